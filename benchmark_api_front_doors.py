@@ -0,0 +1,138 @@
+"""
+Compare the REST API and HTTP API front doors of the backtest service.
+
+Deploy MochiComputeStack with `-c api_front_door=both`, then run for example:
+
+    ID_TOKEN=... python benchmark_api_front_doors.py \
+        --rest-url https://xxxx.execute-api.eu-central-1.amazonaws.com/prod/backtest \
+        --http-url https://yyyy.execute-api.eu-central-1.amazonaws.com/backtest
+
+Requests go to the authorized GET /ping route next to each /backtest endpoint, so they
+exercise the authorizer and a Lambda invocation without submitting any Batch jobs.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import requests
+
+# Default per-million request prices in USD (us-east-1, first pricing tier). Pass the
+# --*-price-per-million options to use the prices of the region the API is deployed in.
+DEFAULT_REST_PRICE_PER_MILLION = 3.50
+DEFAULT_HTTP_PRICE_PER_MILLION = 1.00
+LAMBDA_PRICE_PER_MILLION_REQUESTS = 0.20
+LAMBDA_PRICE_PER_GB_SECOND = 0.0000166667
+
+
+def ping_url(backtest_url: str) -> str:
+    """Derive the /ping URL from the /backtest URL of a front door."""
+    return backtest_url.rstrip('/').rsplit('/', 1)[0] + '/ping'
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Return the pct-th percentile of values using nearest-rank."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run_benchmark(url: str, token: str, total_requests: int, concurrency: int, warmup: int) -> Dict:
+    """
+    Send GET requests to a front door and collect end-to-end latencies.
+
+    A single session per worker keeps TLS connections alive, as a browser would.
+    """
+    headers = {'Authorization': token} if token else {}
+
+    def worker(count: int):
+        session = requests.Session()
+        latencies, errors = [], 0
+        for _ in range(count):
+            start = time.perf_counter()
+            try:
+                response = session.get(url, headers=headers, timeout=30)
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+            except requests.RequestException:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies, errors
+
+    # Warm up connections and the Lambda so cold starts do not skew either front door
+    worker(warmup)
+
+    per_worker = [total_requests // concurrency + (1 if i < total_requests % concurrency else 0)
+                  for i in range(concurrency)]
+    latencies, errors = [], 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for worker_latencies, worker_errors in executor.map(worker, per_worker):
+            latencies.extend(worker_latencies)
+            errors += worker_errors
+
+    if not latencies:
+        return {'requests': total_requests, 'errors': errors}
+
+    return {'requests': total_requests, 'errors': errors, 'mean_ms': statistics.mean(latencies),
+            'p50_ms': percentile(latencies, 50), 'p90_ms': percentile(latencies, 90),
+            'p99_ms': percentile(latencies, 99)}
+
+
+def cost_per_million(api_price_per_million: float, lambda_memory_mb: int, lambda_duration_ms: float) -> float:
+    """Estimate the cost of one million backtest requests through a front door, including the Lambda."""
+    lambda_gb_seconds = 1_000_000 * (lambda_memory_mb / 1024.0) * (lambda_duration_ms / 1000.0)
+    return api_price_per_million + LAMBDA_PRICE_PER_MILLION_REQUESTS + lambda_gb_seconds * LAMBDA_PRICE_PER_GB_SECOND
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the REST and HTTP API front doors")
+    parser.add_argument('--rest-url', help="ApiEndpoint output of MochiComputeStack")
+    parser.add_argument('--http-url', help="HttpApiEndpoint output of MochiComputeStack")
+    parser.add_argument('--token', default=os.environ.get('ID_TOKEN'), help="Cognito ID token (default: $ID_TOKEN)")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--rest-price-per-million', type=float, default=DEFAULT_REST_PRICE_PER_MILLION)
+    parser.add_argument('--http-price-per-million', type=float, default=DEFAULT_HTTP_PRICE_PER_MILLION)
+    parser.add_argument('--lambda-memory-mb', type=int, default=128)
+    parser.add_argument('--lambda-duration-ms', type=float, default=300,
+                        help="Average billed duration of a real /backtest invocation")
+    args = parser.parse_args()
+
+    front_doors = {'rest': (args.rest_url, args.rest_price_per_million),
+                   'http': (args.http_url, args.http_price_per_million)}
+    front_doors = {name: value for name, value in front_doors.items() if value[0]}
+    if not front_doors:
+        parser.error("Pass --rest-url and/or --http-url")
+
+    results = {}
+    for name, (url, price) in front_doors.items():
+        print(f"Benchmarking {name} front door: {ping_url(url)}")
+        result = run_benchmark(ping_url(url), args.token, args.requests, args.concurrency, args.warmup)
+        result['cost_per_million_usd'] = cost_per_million(price, args.lambda_memory_mb, args.lambda_duration_ms)
+        results[name] = result
+
+    print(f"\n{'front door':<12}{'errors':>8}{'mean ms':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'$/1M req':>10}")
+    for name, result in results.items():
+        if 'p50_ms' not in result:
+            print(f"{name:<12}{result['errors']:>8}  no successful requests")
+            continue
+        print(f"{name:<12}{result['errors']:>8}{result['mean_ms']:>10.1f}{result['p50_ms']:>10.1f}"
+              f"{result['p90_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['cost_per_million_usd']:>10.2f}")
+
+    if all('p50_ms' in result for result in results.values()) and len(results) == 2:
+        rest, http = results['rest'], results['http']
+        print(f"\nHTTP API vs REST API: p50 {http['p50_ms'] - rest['p50_ms']:+.1f} ms, "
+              f"p99 {http['p99_ms'] - rest['p99_ms']:+.1f} ms, "
+              f"{http['cost_per_million_usd'] - rest['cost_per_million_usd']:+.2f} USD per million requests")
+
+    return 1 if any(result['errors'] for result in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
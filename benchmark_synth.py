@@ -0,0 +1,167 @@
+"""
+Measure how long `cdk synth` takes, and how much memory it needs, for each stack in app.py.
+
+Every stack is synthesized on its own (with MOCHI_STACKS set, so only that stack and its
+dependencies are built), followed by a full synth of the whole app:
+
+    python benchmark_synth.py
+    python benchmark_synth.py --stacks MochiComputeStack --runs 5
+    python benchmark_synth.py --json synth-times.json
+    python benchmark_synth.py --baseline synth-times.json --max-regression 20
+
+The app runs as `python app.py` in a subprocess, like the CDK CLI runs it, so the
+measurement includes the jsii Node.js runtime that the Python process drives. Peak memory
+is the highest combined resident set size of that process tree.
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from app import register_stacks
+from mochi_orchestrator.stack_registry import STACKS_ENV_VAR, StackRegistry
+
+ALL_STACKS = "<all>"
+SAMPLE_INTERVAL_SECONDS = 0.05
+
+
+def _children(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def tree_rss_kb(pid: int) -> int:
+    """Return the combined resident set size in KiB of a process and all of its descendants."""
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        total += _rss_kb(current)
+        pending.extend(_children(current))
+    return total
+
+
+def synth_once(stack_name: Optional[str]) -> Dict[str, float]:
+    """
+    Synthesize the app once into a temporary directory.
+
+    Args:
+        stack_name: Stack to select through MOCHI_STACKS, or None to synthesize every stack
+
+    Returns:
+        dict: Wall time in seconds and peak memory in MiB
+    """
+    env = dict(os.environ, JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION="1")
+    env.pop(STACKS_ENV_VAR, None)
+    if stack_name:
+        env[STACKS_ENV_VAR] = stack_name
+
+    with tempfile.TemporaryDirectory(prefix="cdk-synth-") as outdir:
+        env["CDK_OUTDIR"] = outdir
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, "app.py"], env=env, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.PIPE, text=True)
+        peak_kb = 0
+        while process.poll() is None:
+            peak_kb = max(peak_kb, tree_rss_kb(process.pid))
+            time.sleep(SAMPLE_INTERVAL_SECONDS)
+        _, stderr = process.communicate()
+        wall_seconds = time.perf_counter() - start
+
+    if process.returncode != 0:
+        raise RuntimeError(f"Synth of {stack_name or 'all stacks'} failed:\n{stderr}")
+
+    if not peak_kb:
+        # No /proc (e.g. macOS): fall back to the largest child seen so far, in KiB on Linux and bytes on macOS
+        peak_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        if sys.platform == "darwin":
+            peak_kb //= 1024
+
+    return {'wall_seconds': wall_seconds, 'peak_memory_mb': peak_kb / 1024.0}
+
+
+def benchmark(stack_names: List[str], runs: int) -> Dict[str, Dict[str, float]]:
+    """Synthesize each stack `runs` times and keep the median wall time and the largest peak memory."""
+    results = {}
+    for stack_name in stack_names:
+        samples = [synth_once(None if stack_name == ALL_STACKS else stack_name) for _ in range(runs)]
+        results[stack_name] = {
+            'wall_seconds': statistics.median(sample['wall_seconds'] for sample in samples),
+            'peak_memory_mb': max(sample['peak_memory_mb'] for sample in samples)
+        }
+        print(f"{stack_name:<32}{results[stack_name]['wall_seconds']:>10.2f}{results[stack_name]['peak_memory_mb']:>12.1f}")
+    return results
+
+
+def regressions(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+                max_regression_pct: float) -> List[str]:
+    """List the stacks whose wall time or peak memory grew by more than max_regression_pct over the baseline."""
+    found = []
+    for stack_name, result in results.items():
+        previous = baseline.get(stack_name)
+        if not previous:
+            continue
+        for metric in ('wall_seconds', 'peak_memory_mb'):
+            if previous[metric] and result[metric] > previous[metric] * (1 + max_regression_pct / 100.0):
+                found.append(f"{stack_name} {metric}: {previous[metric]:.2f} -> {result[metric]:.2f}")
+    return found
+
+
+def main() -> int:
+    registry = StackRegistry(None)
+    register_stacks(registry)
+
+    parser = argparse.ArgumentParser(description="Benchmark cdk synth time and memory per stack")
+    parser.add_argument('--stacks', nargs='+', choices=registry.names,
+                        help="Stacks to benchmark (default: every stack, then the whole app)")
+    parser.add_argument('--runs', type=int, default=3, help="Synth runs per stack; the median wall time is reported")
+    parser.add_argument('--json', help="Write the results to this file")
+    parser.add_argument('--baseline', help="Results file from an earlier run to compare against")
+    parser.add_argument('--max-regression', type=float, default=25.0,
+                        help="Percentage growth over the baseline that fails the benchmark")
+    args = parser.parse_args()
+
+    stack_names = args.stacks or registry.names + [ALL_STACKS]
+
+    print(f"{'stack':<32}{'wall s':>10}{'peak MiB':>12}")
+    results = benchmark(stack_names, args.runs)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.max_regression)
+        if found:
+            print(f"\nSynth regressions over {args.max_regression:.0f}%:")
+            for line in found:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo synth regressions over {args.max_regression:.0f}% against {args.baseline}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
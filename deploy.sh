@@ -10,23 +10,31 @@ for i in "${!stacks[@]}"; do
 done
 
 echo ""
-read -p "Enter stack number to deploy: " stack_number
+read -p "Enter stack numbers to deploy (space separated): " -a stack_numbers
 
-# Validate input is a number
-if ! [[ "$stack_number" =~ ^[0-9]+$ ]]; then
-  echo "Error: Please enter a valid number"
-  exit 1
-fi
+selected_stacks=()
+for stack_number in "${stack_numbers[@]}"; do
+  # Validate input is a number
+  if ! [[ "$stack_number" =~ ^[0-9]+$ ]]; then
+    echo "Error: Please enter valid numbers"
+    exit 1
+  fi
+
+  # Adjust for zero-based indexing and check bounds
+  index=$((stack_number-1))
+  if [ "$index" -lt 0 ] || [ "$index" -ge "${#stacks[@]}" ]; then
+    echo "Error: Please select numbers between 1 and ${#stacks[@]}"
+    exit 1
+  fi
 
-# Adjust for zero-based indexing and check bounds
-index=$((stack_number-1))
-if [ "$index" -lt 0 ] || [ "$index" -ge "${#stacks[@]}" ]; then
-  echo "Error: Please select a number between 1 and ${#stacks[@]}"
+  selected_stacks+=("${stacks[$index]}")
+done
+
+if [ "${#selected_stacks[@]}" -eq 0 ]; then
+  echo "Error: Please select at least one stack"
   exit 1
 fi
 
-# Get the selected stack name
-selected_stack="${stacks[$index]}"
-
-echo "Deploying stack: $selected_stack"
-cdk deploy "$selected_stack"
\ No newline at end of file
+# Synthesize only the selected stacks and deploy independent ones concurrently
+echo "Deploying stacks: ${selected_stacks[*]}"
+MOCHI_STACKS=$(IFS=,; echo "${selected_stacks[*]}") python3 deploy_and_submit.py --deploy-only --stacks "${selected_stacks[@]}"
@@ -1,11 +1,22 @@
+import argparse
+import asyncio
+import itertools
 import subprocess
 import requests
 import json
 import time
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Iterator, List, Optional
+
+DEFAULT_API_URL = "https://6a3jgki3ul.execute-api.eu-central-1.amazonaws.com/prod/backtest"
+DEFAULT_ASSEMBLY_DIR = "cdk.out"
+
+# Parameters used for the test backtest and for load-test requests that the request file does not set
+DEFAULT_LOAD_TEST_PARAMETERS = {"from_date": "2025-03-21", "to_date": "2050-03-16", "shortATRPeriod": 14,
+                                "longATRPeriod": 60, "alpha": 0.5}
 
 
 def load_env_file(env_path: str = '.env') -> Dict[str, str]:
@@ -40,56 +51,224 @@ def load_env_file(env_path: str = '.env') -> Dict[str, str]:
     return env_vars
 
 
-def deploy_cdk_stack():
-    """Deploy the CDK stack and return the success status"""
-    print("Deploying MochiComputeStack...")
+def read_stack_graph(assembly_dir: str = DEFAULT_ASSEMBLY_DIR) -> Dict[str, List[str]]:
+    """
+    Read the stack dependency graph from the manifest of a synthesized cloud assembly.
+
+    Returns:
+        dict: The stacks each stack depends on, by stack name
+    """
+    with open(os.path.join(assembly_dir, 'manifest.json'), 'r') as file:
+        artifacts = json.load(file)['artifacts']
+
+    stacks = {name for name, artifact in artifacts.items() if artifact['type'] == 'aws:cloudformation:stack'}
+    return {name: [dependency for dependency in artifacts[name].get('dependencies', []) if dependency in stacks]
+            for name in stacks}
+
+
+def deployment_waves(graph: Dict[str, List[str]], selected: Optional[List[str]] = None) -> List[List[str]]:
+    """
+    Group the selected stacks and everything they depend on into waves that can be deployed concurrently.
+
+    Every stack is placed in the first wave after all of its dependencies.
+    """
+    pending = set()
+    to_visit = list(selected or graph)
+    while to_visit:
+        name = to_visit.pop()
+        if name not in graph:
+            raise ValueError(f"Unknown stack {name}. Available stacks: {', '.join(sorted(graph))}")
+        if name not in pending:
+            pending.add(name)
+            to_visit.extend(graph[name])
+
+    waves, deployed = [], set()
+    while pending:
+        wave = sorted(name for name in pending if set(graph[name]) <= deployed)
+        if not wave:
+            raise ValueError(f"Dependency cycle between stacks: {', '.join(sorted(pending))}")
+        waves.append(wave)
+        deployed.update(wave)
+        pending.difference_update(wave)
+    return waves
+
+
+def _without_lambda_code(template: Dict) -> Dict:
+    """Drop the parts of a template that change with Lambda code alone: code locations and asset metadata."""
+    resources = {}
+    for name, resource in template.get('Resources', {}).items():
+        if resource.get('Type') == 'AWS::CDK::Metadata':
+            continue
+        resource = {key: value for key, value in resource.items() if key != 'Metadata'}
+        if resource.get('Type') == 'AWS::Lambda::Function':
+            resource['Properties'] = {key: value for key, value in resource.get('Properties', {}).items()
+                                      if key != 'Code'}
+        resources[name] = resource
+    return {**template, 'Resources': resources}
+
+
+def only_lambda_code_changed(stacks: List[str], assembly_dir: str = DEFAULT_ASSEMBLY_DIR) -> bool:
+    """
+    Check whether the synthesized stacks differ from the deployed ones only in Lambda code.
+
+    The synthesized templates are compared with the templates CloudFormation last deployed, so
+    committed infrastructure changes that were never deployed rule out hotswap as well. A stack
+    that does not exist yet, or any error reading it, also counts as an infrastructure change.
+    """
+    import boto3
 
     try:
-        # Run the CDK deploy command and capture output
-        result = subprocess.run(
-            ["cdk", "deploy", "MochiComputeStack"],
-            check=True,
-            text=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-
-        print("Deployment output:")
-        print(result.stdout)
-
-        if result.stderr:
-            print("Deployment warnings/errors:")
-            print(result.stderr)
-
-        print("Deployment complete.")
-        return True
-
-    except subprocess.CalledProcessError as e:
-        print(f"Deployment failed with error code {e.returncode}")
-        print(f"Error output: {e.stderr}")
+        with open(os.path.join(assembly_dir, 'manifest.json'), 'r') as file:
+            artifacts = json.load(file)['artifacts']
+        cloudformation = boto3.client('cloudformation')
+        for stack in stacks:
+            properties = artifacts[stack]['properties']
+            with open(os.path.join(assembly_dir, properties['templateFile']), 'r') as file:
+                synthesized = json.load(file)
+            deployed = cloudformation.get_template(StackName=properties.get('stackName') or stack,
+                                                   TemplateStage='Original')['TemplateBody']
+            if isinstance(deployed, str):
+                deployed = json.loads(deployed)
+            if _without_lambda_code(synthesized) != _without_lambda_code(deployed):
+                print(f"{stack} has infrastructure changes since its last deployment")
+                return False
+    except Exception as e:
+        print(f"Could not compare with the deployed stacks, deploying without hotswap: {e}")
         return False
+    return True
 
 
-def make_api_request(api_url: Optional[str] = None):
-    """Make the API request to the backtest endpoint"""
-    # Give some time for the deployment to fully propagate (if needed)
-    print("Waiting 5 seconds before making the API request...")
-    time.sleep(5)
+def _stream_command(command: List[str], prefix: str) -> int:
+    """Run a command, printing each output line as it arrives prefixed with the stack name."""
+    process = subprocess.Popen(command, text=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1)
+    for line in process.stdout:
+        print(f"[{prefix}] {line.rstrip()}", flush=True)
+    return process.wait()
+
 
+def synth_assembly(stacks: Optional[List[str]], assembly_dir: str = DEFAULT_ASSEMBLY_DIR) -> bool:
+    """Synthesize the selected stacks (and their dependencies) into assembly_dir once for all deployments."""
+    command = ["cdk", "synth", "--quiet", "--output", assembly_dir]
+    if stacks:
+        command += ["-c", f"stacks={','.join(stacks)}"]
+    return _stream_command(command, "synth") == 0
+
+
+def deploy_cdk_stack(stacks: Optional[List[str]] = None, hotswap: str = "auto", concurrency: int = 4,
+                     assembly_dir: str = DEFAULT_ASSEMBLY_DIR) -> bool:
+    """
+    Deploy stacks from one synthesized cloud assembly, running independent stacks concurrently.
+
+    Args:
+        stacks: Stacks to deploy, along with the stacks they depend on (default: MochiComputeStack)
+        hotswap: "always" or "never" to force a mode, or "auto" to hotswap only when the stacks differ
+            from what is deployed in Lambda code alone. Hotswap updates the Lambda functions directly and
+            falls back to a CloudFormation deployment for anything it cannot hotswap.
+        concurrency: Maximum number of stacks deployed at the same time
+        assembly_dir: Where to synthesize the cloud assembly and write the stack outputs
+
+    Returns:
+        bool: True if every stack deployed successfully
+    """
+    stacks = stacks or ["MochiComputeStack"]
+    if not synth_assembly(stacks, assembly_dir):
+        print("Synth failed")
+        return False
+
+    waves = deployment_waves(read_stack_graph(assembly_dir), stacks)
+    use_hotswap = hotswap == "always" or (
+        hotswap == "auto" and only_lambda_code_changed([stack for wave in waves for stack in wave], assembly_dir))
+    print(f"Deploying {', '.join(stacks)}{' with hotswap' if use_hotswap else ''}...")
+    for number, wave in enumerate(waves, start=1):
+        print(f"Deploying wave {number}/{len(waves)}: {', '.join(wave)}")
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return_codes = dict(zip(wave, executor.map(
+                lambda stack: _stream_command(
+                    ["cdk", "deploy", stack, "--app", assembly_dir, "--exclusively", "--require-approval", "never",
+                     "--outputs-file", os.path.join(assembly_dir, f"{stack}.outputs.json")]
+                    + (["--hotswap-fallback"] if use_hotswap else []), stack),
+                wave)))
+
+        failed = [stack for stack, return_code in return_codes.items() if return_code != 0]
+        if failed:
+            print(f"Deployment failed for {', '.join(failed)}; skipping the remaining stacks")
+            return False
+
+    print("Deployment complete.")
+    return True
+
+
+def deployed_api_url(assembly_dir: str = DEFAULT_ASSEMBLY_DIR) -> Optional[str]:
+    """Read the backtest API URL from the outputs of the last MochiComputeStack deployment."""
+    try:
+        with open(os.path.join(assembly_dir, "MochiComputeStack.outputs.json"), 'r') as file:
+            outputs = json.load(file).get("MochiComputeStack", {})
+    except (OSError, ValueError):
+        return None
+    return outputs.get("ApiEndpoint") or outputs.get("HttpApiEndpoint")
+
+
+def wait_for_api(backtest_url: str, timeout_seconds: float = 120, interval_seconds: float = 1.0,
+                 token: Optional[str] = None) -> bool:
+    """
+    Poll the /ping route next to the backtest endpoint until the API answers.
+
+    The route is ready when it returns what a deployed /ping returns: 200 with a token, or 401
+    from the Cognito authorizer without one. Anything else is retried until the timeout,
+    including the 403 "Missing Authentication Token" API Gateway returns for a route that is
+    not deployed yet.
+    """
+    url = backtest_url.rstrip('/').rsplit('/', 1)[0] + '/ping'
+    headers = {"Authorization": token} if token else {}
+    expected_status = 200 if token else 401
+    deadline = time.monotonic() + timeout_seconds
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            response = requests.get(url, headers=headers, timeout=5)
+            if response.status_code == expected_status:
+                print(f"API ready after {attempts} attempt(s) (GET {url} returned {response.status_code})")
+                return True
+        except requests.RequestException:
+            pass
+        if time.monotonic() >= deadline:
+            print(f"API at {url} not ready after {timeout_seconds} seconds")
+            return False
+        time.sleep(interval_seconds)
+
+
+def make_api_request(api_url: Optional[str] = None, token: Optional[str] = None, api_key: Optional[str] = None):
+    """Make the API request to the backtest endpoint"""
     # API endpoint - use from environment if available
-    url = api_url or os.environ.get("API_URL",
-                                    "https://6a3jgki3ul.execute-api.eu-central-1.amazonaws.com/prod/backtest")
+    url = api_url or os.environ.get("API_URL", DEFAULT_API_URL)
+    token = token or os.environ.get("ID_TOKEN")
+    api_key = api_key or os.environ.get("API_KEY")
+
+    # Wait until the deployment has propagated, rather than sleeping a fixed time
+    wait_for_api(url, token=token)
+
+    if not token:
+        print("Skipping the test backtest: the authorizer rejects requests without a Cognito ID token ($ID_TOKEN)")
+        return
 
     # Request headers
     headers = {
-        "Content-Type": "application/json"
+        "Content-Type": "application/json",
+        "Authorization": token
     }
+    if api_key:
+        headers["x-api-key"] = api_key
 
-    # Request payload - can use environment variables if defined
+    # Request payload - can use environment variables if defined. The request validator requires the ATR
+    # periods and alpha as well as the ticker and dates.
     payload = {
         "ticker": os.environ.get("TICKER", "AAPL"),
-        "from_date": os.environ.get("FROM_DATE", "2025-03-21"),
-        "to_date": os.environ.get("TO_DATE", "2050-03-16")
+        "from_date": os.environ.get("FROM_DATE", DEFAULT_LOAD_TEST_PARAMETERS["from_date"]),
+        "to_date": os.environ.get("TO_DATE", DEFAULT_LOAD_TEST_PARAMETERS["to_date"]),
+        "shortATRPeriod": os.environ.get("SHORT_ATR_PERIOD", DEFAULT_LOAD_TEST_PARAMETERS["shortATRPeriod"]),
+        "longATRPeriod": os.environ.get("LONG_ATR_PERIOD", DEFAULT_LOAD_TEST_PARAMETERS["longATRPeriod"]),
+        "alpha": os.environ.get("ALPHA", DEFAULT_LOAD_TEST_PARAMETERS["alpha"])
     }
 
     # Make the request
@@ -114,16 +293,251 @@ def make_api_request(api_url: Optional[str] = None):
         print(f"Error making the request: {e}")
 
 
+def load_test_payloads(request_file: Optional[str]) -> Iterator[Dict]:
+    """
+    Yield backtest request bodies for a load test, cycling through a ticker and parameter file.
+
+    The file is JSON with a list of tickers and a list of parameter sets, for example
+    {"tickers": ["AAPL", "C:EURUSD"], "parameters": [{"from_date": "2024-01-01", "alpha": 0.5}]}.
+    Every ticker is combined with every parameter set, and missing parameters fall back to
+    DEFAULT_LOAD_TEST_PARAMETERS. Without a file the TICKER environment variable (or AAPL) is used.
+    """
+    tickers, parameter_sets = [os.environ.get("TICKER", "AAPL")], [{}]
+    if request_file:
+        with open(request_file, 'r') as file:
+            config = json.load(file)
+        tickers = config.get("tickers") or tickers
+        parameter_sets = config.get("parameters") or parameter_sets
+
+    for ticker, parameters in itertools.cycle(list(itertools.product(tickers, parameter_sets))):
+        yield {**DEFAULT_LOAD_TEST_PARAMETERS, **parameters, "ticker": ticker}
+
+
+def send_times(total: int, rate: Optional[float], burst_size: Optional[int], burst_interval: float) -> List[float]:
+    """
+    Return the offset in seconds from the start of the test at which each request is sent.
+
+    A fixed rate spaces requests evenly, bursts send burst_size requests every burst_interval
+    seconds, and with neither every request is sent at once (limited only by concurrency).
+    """
+    if burst_size:
+        return [(index // burst_size) * burst_interval for index in range(total)]
+    if rate:
+        return [index / rate for index in range(total)]
+    return [0.0] * total
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Return the pct-th percentile of values using nearest-rank."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize_load_test(results: List[Dict], duration_seconds: float) -> Dict:
+    """Summarize load-test results into latency percentiles, error and throttle rates and submitted jobs."""
+    total = len(results)
+    ok = [result for result in results if result['status'] == 200]
+    throttled = [result for result in results if result['status'] == 429]
+    # Held by admission control, to be launched when capacity frees up
+    queued = [result for result in results if result['status'] == 202]
+    latencies = [result['latency_ms'] for result in ok]
+
+    summary = {
+        'requests': total,
+        'duration_seconds': round(duration_seconds, 3),
+        'achieved_rps': round(total / duration_seconds, 2) if duration_seconds else 0.0,
+        'succeeded': len(ok),
+        'throttled': len(throttled),
+        'queued': len(queued),
+        'errors': total - len(ok) - len(throttled) - len(queued),
+        'throttle_rate': round(len(throttled) / total, 4) if total else 0.0,
+        'error_rate': round((total - len(ok) - len(throttled) - len(queued)) / total, 4) if total else 0.0,
+        'submitted_pipelines': sum(1 for result in ok if result['job_ids']),
+        'submitted_jobs': sum(len(result['job_ids']) for result in ok),
+        'status_codes': {}
+    }
+    for result in results:
+        summary['status_codes'][str(result['status'])] = summary['status_codes'].get(str(result['status']), 0) + 1
+    if latencies:
+        summary.update({'mean_ms': round(sum(latencies) / len(latencies), 1),
+                        'p50_ms': percentile(latencies, 50), 'p90_ms': percentile(latencies, 90),
+                        'p99_ms': percentile(latencies, 99), 'max_ms': max(latencies)})
+    return summary
+
+
+async def _send_backtest(session, url: str, headers: Dict[str, str], payload: Dict, start: float, offset: float,
+                         semaphore: asyncio.Semaphore) -> Dict:
+    await asyncio.sleep(max(0.0, start + offset - time.perf_counter()))
+    async with semaphore:
+        sent = time.perf_counter()
+        try:
+            async with session.post(url, json=payload, headers=headers) as response:
+                text = await response.text()
+                status = response.status
+        except Exception as e:
+            print(f"Request for {payload['ticker']} failed: {e}")
+            return {'status': 0, 'latency_ms': (time.perf_counter() - sent) * 1000, 'job_ids': []}
+
+    job_ids = []
+    if status == 200:
+        try:
+            body = json.loads(text)
+            # A fused run reports the same job ID under every stage key
+            job_ids = list(dict.fromkeys(value for key, value in body.items() if key.endswith('JobId') and value))
+        except ValueError:
+            pass
+    return {'status': status, 'latency_ms': (time.perf_counter() - sent) * 1000, 'job_ids': job_ids}
+
+
+async def run_load_test(url: str, total: int, concurrency: int, rate: Optional[float] = None,
+                        burst_size: Optional[int] = None, burst_interval: float = 1.0,
+                        request_file: Optional[str] = None, token: Optional[str] = None,
+                        api_key: Optional[str] = None) -> Dict:
+    """
+    Fire `total` backtest requests at `url` and summarize how the submission path held up.
+
+    Requests share one aiohttp session, so connections are reused, and at most `concurrency`
+    are in flight at once. Point `url` at a local stand-in (see `serve_stand_in`) to measure
+    the harness itself, or at the real API to find the saturation point of the submission path.
+    Every successful request to the real API submits a job chain, so size tests accordingly.
+    """
+    import aiohttp
+
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = token
+    if api_key:
+        headers["x-api-key"] = api_key
+
+    payloads = load_test_payloads(request_file)
+    offsets = send_times(total, rate, burst_size, burst_interval)
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=60)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            _send_backtest(session, url, headers, next(payloads), start, offset, semaphore) for offset in offsets])
+        duration = time.perf_counter() - start
+
+    return summarize_load_test(results, duration)
+
+
+async def serve_stand_in(port: int, latency_ms: float, capacity: int) -> None:
+    """
+    Serve a local stand-in for POST /backtest that answers like the launcher Lambda.
+
+    Each request waits latency_ms before answering with fake job IDs, and requests beyond
+    `capacity` in flight are rejected with a 429 like the API Gateway throttle would.
+    """
+    from aiohttp import web
+
+    in_flight = 0
+
+    async def backtest(request):
+        nonlocal in_flight
+        if in_flight >= capacity:
+            return web.json_response({'message': 'Too Many Requests'}, status=429)
+        in_flight += 1
+        try:
+            body = await request.json()
+            await asyncio.sleep(latency_ms / 1000.0)
+            suffix = f"{time.time_ns():x}"
+            return web.json_response({'message': f"Successfully submitted job chain for {body.get('ticker')}",
+                                      'polygonJobId': f"polygon-{suffix}", 'enhanceJobId': f"enhance-{suffix}",
+                                      'groupTag': f"stand-in-{suffix}"})
+        finally:
+            in_flight -= 1
+
+    app = web.Application()
+    app.router.add_post('/backtest', backtest)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    print(f"Stand-in backtest endpoint listening on http://127.0.0.1:{port}/backtest")
+    await asyncio.Event().wait()
+
+
+def print_load_test_summary(summary: Dict) -> None:
+    """Print a load-test summary as a short report."""
+    print(f"\nRequests: {summary['requests']} in {summary['duration_seconds']} s ({summary['achieved_rps']} req/s)")
+    print(f"Succeeded: {summary['succeeded']}, queued: {summary['queued']}, "
+          f"throttled: {summary['throttled']} ({summary['throttle_rate']:.1%}), "
+          f"errors: {summary['errors']} ({summary['error_rate']:.1%})")
+    print(f"Status codes: {summary['status_codes']}")
+    print(f"Submitted pipelines: {summary['submitted_pipelines']}, jobs: {summary['submitted_jobs']}")
+    if 'p50_ms' in summary:
+        print(f"Latency ms: mean {summary['mean_ms']}, p50 {summary['p50_ms']:.1f}, p90 {summary['p90_ms']:.1f}, "
+              f"p99 {summary['p99_ms']:.1f}, max {summary['max_ms']:.1f}")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Deploy MochiComputeStack and submit a backtest, or load test the API")
+    parser.add_argument('--load-test', action='store_true', help="Fire many concurrent backtest requests instead")
+    parser.add_argument('--deploy', action='store_true', help="Deploy MochiComputeStack before the load test")
+    parser.add_argument('--stacks', nargs='+', default=["MochiComputeStack"],
+                        help="Stacks to deploy, along with the stacks they depend on")
+    parser.add_argument('--hotswap', choices=["auto", "always", "never"], default="auto",
+                        help="Hotswap Lambda code (auto: only when the stacks differ from the deployed ones "
+                             "in Lambda code alone)")
+    parser.add_argument('--deploy-concurrency', type=int, default=4, help="Maximum stacks deployed at once")
+    parser.add_argument('--deploy-only', action='store_true', help="Deploy without submitting a backtest")
+    parser.add_argument('--url', default=os.environ.get("API_URL"),
+                        help="Backtest endpoint, e.g. http://127.0.0.1:8080/backtest for the stand-in "
+                             "(default: $API_URL, then the deployed ApiEndpoint output)")
+    parser.add_argument('--requests', type=int, default=100, help="Total number of requests")
+    parser.add_argument('--concurrency', type=int, default=10, help="Maximum requests in flight")
+    parser.add_argument('--rate', type=float, help="Send at a fixed rate of this many requests per second")
+    parser.add_argument('--burst-size', type=int, help="Send requests in bursts of this size")
+    parser.add_argument('--burst-interval', type=float, default=1.0, help="Seconds between bursts")
+    parser.add_argument('--request-file', help="JSON file with the tickers and parameter sets to draw from")
+    parser.add_argument('--token', default=os.environ.get("ID_TOKEN"), help="Cognito ID token (default: $ID_TOKEN)")
+    parser.add_argument('--api-key', default=os.environ.get("API_KEY"), help="API key (default: $API_KEY)")
+    parser.add_argument('--json', help="Write the load-test summary to this file")
+    parser.add_argument('--serve-stand-in', type=int, metavar='PORT',
+                        help="Run a local stand-in backtest endpoint on this port instead")
+    parser.add_argument('--stand-in-latency-ms', type=float, default=150.0)
+    parser.add_argument('--stand-in-capacity', type=int, default=50)
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    # Load environment variables from .env file
+    # Load environment variables from .env file first, so the argument defaults ($API_URL, $ID_TOKEN, $API_KEY) see them
     env_vars = load_env_file()
 
+    args = parse_arguments()
+
+    if args.serve_stand_in:
+        asyncio.run(serve_stand_in(args.serve_stand_in, args.stand_in_latency_ms, args.stand_in_capacity))
+        sys.exit(0)
+
+    if args.load_test:
+        if args.deploy and not deploy_cdk_stack(args.stacks, args.hotswap, args.deploy_concurrency):
+            print("Skipping load test due to deployment failure.")
+            sys.exit(1)
+
+        args.url = args.url or deployed_api_url() or DEFAULT_API_URL
+
+        summary = asyncio.run(run_load_test(args.url, args.requests, args.concurrency, rate=args.rate,
+                                            burst_size=args.burst_size, burst_interval=args.burst_interval,
+                                            request_file=args.request_file, token=args.token,
+                                            api_key=args.api_key))
+        print_load_test_summary(summary)
+        if args.json:
+            with open(args.json, 'w') as file:
+                json.dump(summary, file, indent=2)
+        sys.exit(0 if summary['errors'] == 0 else 1)
+
     # Deploy the stack first
-    success = deploy_cdk_stack()
+    success = deploy_cdk_stack(args.stacks, args.hotswap, args.deploy_concurrency)
 
     # Only proceed with API request if deployment was successful
+    if success and args.deploy_only:
+        sys.exit(0)
     if success:
-        make_api_request()
+        make_api_request(args.url or deployed_api_url(), token=args.token, api_key=args.api_key)
     else:
         print("Skipping API request due to deployment failure.")
         sys.exit(1)
@@ -0,0 +1,318 @@
+import datetime
+import json
+import math
+import os
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+
+# Items of the admission table, all keyed by `scope`:
+#   TIER#{tier}    - in_flight and queued pipelines of a latency tier, how many of the queued ones were held
+#                    because the tier was full (tier_held), and the average pipeline duration
+#   USER#{user_id} - in_flight and queued pipelines of one user
+#   LEASE#{run_id} - an admitted pipeline; deleting it releases its tier and user slots exactly once. It also
+#                    holds the run's unfinished (jobs) and succeeded (done) Batch job IDs, and launched_at
+#                    once its pipeline has been submitted
+TIERS = ('interactive', 'batch')
+
+DEFAULT_MAX_IN_FLIGHT = {'interactive': 2, 'batch': 4}
+DEFAULT_MAX_PER_USER = 2
+
+# Used for start time estimates until the first pipeline of a tier has finished
+DEFAULT_PIPELINE_SECONDS = 1800
+
+# Weight of the latest pipeline in the moving average of pipeline durations
+DURATION_SMOOTHING = 0.2
+
+# Leases older than this are assumed lost (e.g. a missed state change event) and reclaimed
+DEFAULT_LEASE_HOURS = 12
+
+# A run whose jobs have all succeeded is only finished once no new job has appeared for this long. data-metadata
+# submits the downstream jobs while it runs, and their SUBMITTED events may arrive after its SUCCEEDED event.
+DEFAULT_SETTLE_SECONDS = 120
+
+
+def admission_table_name():
+    """Return the admission table named by ADMISSION_TABLE, or None if admission control is off."""
+    return os.environ.get('ADMISSION_TABLE') or None
+
+
+def max_in_flight(tier):
+    """Concurrency cap of a tier, from ADMISSION_MAX_IN_FLIGHT_{TIER}."""
+    return int(os.environ.get(f"ADMISSION_MAX_IN_FLIGHT_{tier.upper()}", DEFAULT_MAX_IN_FLIGHT[tier]))
+
+
+def max_per_user():
+    """Concurrency cap of each user across tiers, from ADMISSION_MAX_PER_USER."""
+    return int(os.environ.get('ADMISSION_MAX_PER_USER', DEFAULT_MAX_PER_USER))
+
+
+def _counter_update(table_name, scope, attribute, delta, cap=None, behind_queue=False):
+    update = {
+        'TableName': table_name,
+        'Key': {'scope': {'S': scope}},
+        'UpdateExpression': f"SET {attribute} = if_not_exists({attribute}, :zero) + :delta",
+        'ExpressionAttributeValues': {':zero': {'N': '0'}, ':delta': {'N': str(delta)}},
+    }
+    if cap is not None:
+        update['ConditionExpression'] = f"(attribute_not_exists({attribute}) AND :zero < :cap) OR {attribute} < :cap"
+        update['ExpressionAttributeValues'][':cap'] = {'N': str(cap)}
+    if behind_queue:
+        # New requests may not overtake requests held for the tier cap; requests held only because
+        # their own user is at the cap do not block other users
+        update['ConditionExpression'] = (f"({update['ConditionExpression']}) AND "
+                                         f"(attribute_not_exists(tier_held) OR tier_held <= :zero)")
+    return {'Update': update}
+
+
+def try_admit(run_id, user_id, tier, held=False, table_name=None, dynamodb_client=None, now=None):
+    """
+    Take a tier slot and a user slot for a pipeline, if both are free.
+
+    The counters and the lease are written in one transaction, so a pipeline is either fully
+    admitted or not at all. Admitting a run that already holds a lease succeeds again, unless its
+    pipeline was already launched, which makes replays of a held request after a crash safe. New
+    requests are only admitted while nothing is held in their tier, so they queue behind held
+    ones; pass held=True when draining.
+
+    Returns:
+        tuple: (admitted, reason). The reason is None when admitted, otherwise "tier", "user", or
+        "launched" if the run holds a lease and its pipeline was already submitted.
+    """
+    table_name = table_name or admission_table_name()
+    dynamodb_client = dynamodb_client or boto3.client('dynamodb')
+    now = now or time.time()
+
+    try:
+        dynamodb_client.transact_write_items(TransactItems=[
+            _counter_update(table_name, f"TIER#{tier}", 'in_flight', 1, max_in_flight(tier), behind_queue=not held),
+            _counter_update(table_name, f"USER#{user_id}", 'in_flight', 1, max_per_user()),
+            {'Put': {
+                'TableName': table_name,
+                'Item': {'scope': {'S': f"LEASE#{run_id}"}, 'user_id': {'S': user_id}, 'tier': {'S': tier},
+                         'admitted_at': {'N': str(int(now))}},
+                'ConditionExpression': 'attribute_not_exists(#scope)',
+                'ExpressionAttributeNames': {'#scope': 'scope'}
+            }}
+        ])
+        return True, None
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'TransactionCanceledException':
+            raise
+        reasons = [reason.get('Code') for reason in e.response.get('CancellationReasons', [])]
+        if len(reasons) == 3 and reasons[2] == 'ConditionalCheckFailed':
+            lease = dynamodb_client.get_item(TableName=table_name, Key={'scope': {'S': f"LEASE#{run_id}"}},
+                                             ConsistentRead=True).get('Item', {})
+            return (False, 'launched') if 'launched_at' in lease else (True, None)
+        if reasons and reasons[0] == 'ConditionalCheckFailed':
+            return False, 'tier'
+        if len(reasons) > 1 and reasons[1] == 'ConditionalCheckFailed':
+            return False, 'user'
+        raise
+
+
+def mark_launched(run_id, table_name=None, dynamodb_client=None, now=None):
+    """Record on a run's lease that its pipeline was submitted, so a replay does not submit it again."""
+    table_name = table_name or admission_table_name()
+    dynamodb_client = dynamodb_client or boto3.client('dynamodb')
+    try:
+        dynamodb_client.update_item(TableName=table_name, Key={'scope': {'S': f"LEASE#{run_id}"}},
+                                    UpdateExpression='SET launched_at = :now',
+                                    ConditionExpression='attribute_exists(#scope)',
+                                    ExpressionAttributeNames={'#scope': 'scope'},
+                                    ExpressionAttributeValues={':now': {'N': str(int(now or time.time()))}})
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+
+def track_job(run_id, job_id, status, table_name=None, dynamodb_client=None, now=None):
+    """
+    Follow a job of an admitted run, so the run is only finished once all of its jobs are.
+
+    SUBMITTED adds the job to the lease's unfinished jobs, unless it already succeeded (events
+    can arrive out of order); SUCCEEDED moves it to the succeeded ones. Runs without a lease
+    are ignored.
+    """
+    table_name = table_name or admission_table_name()
+    dynamodb_client = dynamodb_client or boto3.client('dynamodb')
+    now = now or time.time()
+
+    if status == 'SUBMITTED':
+        update = {'UpdateExpression': 'ADD jobs :job',
+                  'ConditionExpression': 'attribute_exists(#scope) AND NOT contains(done, :job_id)',
+                  'ExpressionAttributeValues': {':job': {'SS': [job_id]}, ':job_id': {'S': job_id}}}
+    else:
+        update = {'UpdateExpression': 'DELETE jobs :job ADD done :job SET last_done_at = :now',
+                  'ConditionExpression': 'attribute_exists(#scope)',
+                  'ExpressionAttributeValues': {':job': {'SS': [job_id]}, ':now': {'N': str(int(now))}}}
+    try:
+        dynamodb_client.update_item(TableName=table_name, Key={'scope': {'S': f"LEASE#{run_id}"}},
+                                    ExpressionAttributeNames={'#scope': 'scope'}, **update)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+
+def finished_leases(table_name=None, dynamodb_client=None, now=None):
+    """
+    List the run IDs of leases whose jobs have all succeeded, with no new job for ADMISSION_SETTLE_SECONDS.
+
+    DynamoDB drops a string set once its last member is deleted, so a lease without jobs but
+    with succeeded ones has nothing left to wait for.
+    """
+    table_name = table_name or admission_table_name()
+    dynamodb_client = dynamodb_client or boto3.client('dynamodb')
+    cutoff = (now or time.time()) - float(os.environ.get('ADMISSION_SETTLE_SECONDS', DEFAULT_SETTLE_SECONDS))
+
+    run_ids = []
+    paginator = dynamodb_client.get_paginator('scan')
+    for page in paginator.paginate(TableName=table_name,
+                                   FilterExpression='begins_with(#scope, :lease) AND attribute_not_exists(jobs) AND '
+                                                    'attribute_exists(done) AND last_done_at < :cutoff',
+                                   ExpressionAttributeNames={'#scope': 'scope'},
+                                   ExpressionAttributeValues={':lease': {'S': 'LEASE#'},
+                                                              ':cutoff': {'N': str(int(cutoff))}}):
+        run_ids += [item['scope']['S'][len('LEASE#'):] for item in page.get('Items', [])]
+    return run_ids
+
+
+def release(run_id, succeeded, table_name=None, dynamodb_client=None, now=None):
+    """
+    Free the slots of a finished pipeline.
+
+    Deleting the lease is a condition of the transaction, so the several failure events of a
+    chain (a failed stage fails its dependents too) only release the slots once.
+
+    Returns:
+        bool: True if this call released the pipeline
+    """
+    table_name = table_name or admission_table_name()
+    dynamodb_client = dynamodb_client or boto3.client('dynamodb')
+    now = now or time.time()
+
+    lease = dynamodb_client.get_item(TableName=table_name, Key={'scope': {'S': f"LEASE#{run_id}"}},
+                                     ConsistentRead=True).get('Item')
+    if not lease:
+        return False
+
+    tier, user_id = lease['tier']['S'], lease['user_id']['S']
+    try:
+        dynamodb_client.transact_write_items(TransactItems=[
+            {'Delete': {'TableName': table_name, 'Key': {'scope': {'S': f"LEASE#{run_id}"}},
+                        'ConditionExpression': 'attribute_exists(#scope)',
+                        'ExpressionAttributeNames': {'#scope': 'scope'}}},
+            _counter_update(table_name, f"TIER#{tier}", 'in_flight', -1),
+            _counter_update(table_name, f"USER#{user_id}", 'in_flight', -1),
+        ])
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'TransactionCanceledException':
+            return False
+        raise
+
+    if succeeded:
+        record_duration(table_name, tier, now - int(lease['admitted_at']['N']), dynamodb_client)
+    return True
+
+
+def record_duration(table_name, tier, seconds, dynamodb_client):
+    """Fold the duration of a finished pipeline into its tier's moving average."""
+    item = dynamodb_client.get_item(TableName=table_name, Key={'scope': {'S': f"TIER#{tier}"}}).get('Item', {})
+    average = float(item.get('avg_pipeline_seconds', {}).get('N', seconds))
+    average = (1 - DURATION_SMOOTHING) * average + DURATION_SMOOTHING * seconds
+    dynamodb_client.update_item(TableName=table_name, Key={'scope': {'S': f"TIER#{tier}"}},
+                                UpdateExpression='SET avg_pipeline_seconds = :average',
+                                ExpressionAttributeValues={':average': {'N': str(round(average, 1))}})
+
+
+def change_queued(user_id, tier, delta, tier_held=False, table_name=None, dynamodb_client=None):
+    """
+    Count a request into (+1) or out of (-1) the holding queue of its tier.
+
+    Pass tier_held=True for requests held because the tier was full; only those make new
+    requests of other users queue behind them.
+    """
+    table_name = table_name or admission_table_name()
+    dynamodb_client = dynamodb_client or boto3.client('dynamodb')
+    tier_update = _counter_update(table_name, f"TIER#{tier}", 'queued', delta)
+    if tier_held:
+        tier_update['Update']['UpdateExpression'] += ", tier_held = if_not_exists(tier_held, :zero) + :delta"
+    dynamodb_client.transact_write_items(TransactItems=[
+        tier_update,
+        _counter_update(table_name, f"USER#{user_id}", 'queued', delta),
+    ])
+
+
+def estimate_start(user_id, tier, table_name=None, dynamodb_client=None, now=None):
+    """
+    Estimate when a request that joins the holding queue now will start.
+
+    Slots free up at roughly cap / average pipeline duration per second, so a request waits
+    for the pipelines queued ahead of it in its tier, or of its own user, whichever is slower.
+
+    Returns:
+        tuple: (estimated start as an aware datetime, number of requests ahead in the tier)
+    """
+    table_name = table_name or admission_table_name()
+    dynamodb_client = dynamodb_client or boto3.client('dynamodb')
+    now = now or time.time()
+
+    items = dynamodb_client.batch_get_item(RequestItems={table_name: {'Keys': [
+        {'scope': {'S': f"TIER#{tier}"}}, {'scope': {'S': f"USER#{user_id}"}}]}})['Responses'].get(table_name, [])
+    by_scope = {item['scope']['S']: item for item in items}
+    tier_item = by_scope.get(f"TIER#{tier}", {})
+    user_item = by_scope.get(f"USER#{user_id}", {})
+
+    def count(item, attribute):
+        return max(int(item.get(attribute, {}).get('N', 0)), 0)
+
+    duration = float(tier_item.get('avg_pipeline_seconds', {}).get('N', DEFAULT_PIPELINE_SECONDS))
+    tier_rounds = math.ceil((count(tier_item, 'queued') + 1) / max(max_in_flight(tier), 1))
+    user_rounds = math.ceil((count(user_item, 'queued') + 1) / max(max_per_user(), 1))
+    wait_seconds = max(tier_rounds, user_rounds) * duration
+    return (datetime.datetime.fromtimestamp(now + wait_seconds, datetime.timezone.utc),
+            count(tier_item, 'queued'))
+
+
+def holding_queue_url(tier):
+    """URL of the FIFO holding queue of a tier, from HOLDING_QUEUE_{TIER}_URL."""
+    return os.environ.get(f"HOLDING_QUEUE_{tier.upper()}_URL")
+
+
+def held_event(event):
+    """Keep the parts of an API event that replaying it needs: the body and the caller's identity."""
+    return {'body': event.get('body'), 'isBase64Encoded': event.get('isBase64Encoded', False),
+            'requestContext': {'authorizer': (event.get('requestContext') or {}).get('authorizer') or {}}}
+
+
+def hold(event, run_id, user_id, tier, reason='tier', sqs_client=None):
+    """
+    Put a request that could not be admitted into its tier's holding queue.
+
+    Messages are grouped by user, so one user's burst is replayed in order without
+    holding up other users. The message keeps the reason it was held ("tier" or "user"),
+    so the drain takes it out of the right counters.
+    """
+    sqs_client = sqs_client or boto3.client('sqs')
+    sqs_client.send_message(QueueUrl=holding_queue_url(tier), MessageGroupId=user_id, MessageDeduplicationId=run_id,
+                            MessageBody=json.dumps({'event': held_event(event), 'run_id': run_id,
+                                                    'user_id': user_id, 'tier': tier, 'reason': reason}))
+    change_queued(user_id, tier, 1, tier_held=reason == 'tier')
+
+
+def stale_leases(table_name=None, dynamodb_client=None, now=None):
+    """List the run IDs of leases older than ADMISSION_LEASE_HOURS."""
+    table_name = table_name or admission_table_name()
+    dynamodb_client = dynamodb_client or boto3.client('dynamodb')
+    cutoff = (now or time.time()) - float(os.environ.get('ADMISSION_LEASE_HOURS', DEFAULT_LEASE_HOURS)) * 3600
+
+    run_ids = []
+    paginator = dynamodb_client.get_paginator('scan')
+    for page in paginator.paginate(TableName=table_name, FilterExpression='begins_with(#scope, :lease) AND '
+                                                                          'admitted_at < :cutoff',
+                                   ExpressionAttributeNames={'#scope': 'scope'},
+                                   ExpressionAttributeValues={':lease': {'S': 'LEASE#'},
+                                                              ':cutoff': {'N': str(int(cutoff))}}):
+        run_ids += [item['scope']['S'][len('LEASE#'):] for item in page.get('Items', [])]
+    return run_ids
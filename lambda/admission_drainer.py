@@ -0,0 +1,81 @@
+import json
+
+import boto3
+
+from admission import (TIERS, change_queued, finished_leases, holding_queue_url, mark_launched, release,
+                       stale_leases, try_admit)
+
+# Stop draining with this much of the invocation left, so a launch is never cut off half-submitted
+SAFETY_MARGIN_MS = 15000
+
+
+def drain(launch, context=None, sqs_client=None):
+    """
+    Admit held requests as capacity frees up and launch their pipelines.
+
+    Interactive requests are drained before batch ones. Within a tier, messages are grouped by
+    user: a user at their cap only blocks their own later requests, and a full tier stops the
+    tier. Runs whose jobs have all succeeded are released first, and leases that outlived
+    ADMISSION_LEASE_HOURS are reclaimed, so a missed state change event cannot leak a slot forever.
+
+    Args:
+        launch: Callable (event, run_id) that submits a held request's pipeline
+        context: Lambda context, used to stay within the invocation's time limit
+
+    Returns:
+        dict: Run IDs launched, finished runs released, and stale leases reclaimed
+    """
+    sqs_client = sqs_client or boto3.client('sqs')
+    finished = [run_id for run_id in finished_leases() if release(run_id, succeeded=True)]
+    reclaimed = [run_id for run_id in stale_leases() if release(run_id, succeeded=False)]
+    launched = []
+
+    for tier in TIERS:
+        queue_url = holding_queue_url(tier)
+        tier_full = False
+        while queue_url and not tier_full and _time_left(context):
+            messages = sqs_client.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10,
+                                                  VisibilityTimeout=120).get('Messages', [])
+            if not messages:
+                break
+
+            blocked_users = set()
+            admitted_any = False
+            for message in messages:
+                held = json.loads(message['Body'])
+                admitted, reason = (False, 'tier') if tier_full or held['user_id'] in blocked_users \
+                    else try_admit(held['run_id'], held['user_id'], tier, held=True)
+                if reason == 'launched':
+                    # A previous drain launched it but stopped before deleting the message
+                    print(f"Held run {held['run_id']} was already launched, dropping its message")
+                elif not admitted:
+                    tier_full = tier_full or reason == 'tier'
+                    blocked_users.add(held['user_id'])
+                    # Back to the head of its group for the next drain
+                    sqs_client.change_message_visibility(QueueUrl=queue_url, ReceiptHandle=message['ReceiptHandle'],
+                                                         VisibilityTimeout=0)
+                    continue
+                else:
+                    try:
+                        launch(held['event'], held['run_id'])
+                        mark_launched(held['run_id'])
+                        launched.append(held['run_id'])
+                    except Exception as e:
+                        # Dropped rather than retried, so one bad request cannot block its user's queue
+                        print(f"Error launching held run {held['run_id']}, dropping it: {str(e)}")
+                        release(held['run_id'], succeeded=False)
+
+                sqs_client.delete_message(QueueUrl=queue_url, ReceiptHandle=message['ReceiptHandle'])
+                change_queued(held['user_id'], tier, -1, tier_held=held.get('reason') == 'tier')
+                admitted_any = True
+
+            if not admitted_any:
+                break
+
+    print(f"Launched {len(launched)} held runs, released {len(finished)} finished runs, "
+          f"reclaimed {len(reclaimed)} stale leases")
+    return {'launched': launched, 'finished': finished, 'reclaimed': reclaimed}
+
+
+def _time_left(context):
+    return context is None or context.get_remaining_time_in_millis() > SAFETY_MARGIN_MS
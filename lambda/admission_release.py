@@ -0,0 +1,28 @@
+from admission import release, track_job
+from run_catalog import job_stage
+
+
+def handler(event, context):
+    """
+    EventBridge handler that follows the jobs of admitted pipelines and frees a pipeline's slots when one fails.
+
+    Jobs are matched to their run by the SubmissionGroupTag tag on every job. Submitted and
+    succeeded jobs are tracked on the run's lease; once all of them have succeeded, the
+    scheduled drain releases the run. A failed job releases it straight away.
+    """
+    job = event.get('detail', {})
+    run_id = job.get('tags', {}).get('SubmissionGroupTag')
+    status = job.get('status')
+    stage = job_stage(job)
+
+    if not run_id or status not in ('SUBMITTED', 'SUCCEEDED', 'FAILED'):
+        return {'released': False}
+
+    if status != 'FAILED':
+        track_job(run_id, job['jobId'], status)
+        return {'released': False, 'runId': run_id, 'stage': stage, 'status': status}
+
+    released = release(run_id, succeeded=False)
+    if released:
+        print(f"Released admission slots of run {run_id} after {stage} {status}")
+    return {'released': released, 'runId': run_id, 'stage': stage, 'status': status}
@@ -0,0 +1,328 @@
+import datetime
+import math
+import os
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+from admission import admission_table_name, estimate_start, max_in_flight
+
+# Historical durations live in the run catalog as one sparse item per stage, keyed run_id = STAGE#{stage}.
+# They carry none of the index attributes, so run queries never see them.
+STAGE_STATS_PREFIX = "STAGE#"
+
+# Weight of the latest job in the moving averages of stage durations
+DURATION_SMOOTHING = 0.2
+
+# Moving averages of jobs tagged with EstimatedInputMB, from which run time is fitted as base + slope * MB
+SIZED_AVERAGES = ('avg_input_mb', 'avg_input_mb_sq', 'avg_sized_seconds', 'avg_mb_seconds')
+
+# Input sizes must spread by at least this coefficient of variation before a slope is fitted; below it,
+# an input within SIMILAR_SIZE_RATIO of the average size is scaled proportionally instead
+MIN_SIZE_VARIATION = 0.1
+SIMILAR_SIZE_RATIO = 2.0
+
+# Stage statistics are written conditionally on their job count; give up after this many lost races
+MAX_STATS_ATTEMPTS = 5
+
+# Stages the launcher submits, in dependency order, with their job definitions
+CHAIN_STAGES = (('polygon-extract', 'polygon-extract'), ('trade-data-enhancer', 'trade-data-enhancer'),
+                ('meta', 'data-metadata'))
+
+# Stages data-metadata submits after the launcher's chain; estimated only once they have history
+DOWNSTREAM_STAGES = ('mochi-trades', 'trade-extract', 'py-trade-lens', 'trade-summary', 'mochi-graphs', 'r-graphs')
+
+# Used for stages that have not finished a job yet
+DEFAULT_STAGE_SECONDS = 600
+
+# Fargate Linux/x86 on-demand prices in eu-central-1; Spot is billed at roughly a 70% discount
+DEFAULT_VCPU_HOUR_USD = 0.04656
+DEFAULT_GB_HOUR_USD = 0.00511
+DEFAULT_SPOT_DISCOUNT = 0.7
+
+# Batch job statuses that count as the queue a new job waits behind
+QUEUED_STATUSES = ('SUBMITTED', 'PENDING', 'RUNNABLE', 'STARTING')
+
+
+def _number(value):
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def job_resources(job):
+    """
+    Read the vCPU and memory (MiB) of a Batch job or job definition.
+
+    Container jobs have one set of resource requirements; ECS jobs (the fused job) have one
+    per container, which run on the same task and add up.
+    """
+    requirement_lists = [(job.get('container') or job.get('containerProperties') or {}).get('resourceRequirements')]
+    ecs_properties = job.get('ecsProperties') or {}
+    for task in ecs_properties.get('taskProperties', []):
+        requirement_lists += [container.get('resourceRequirements') for container in task.get('containers', [])]
+
+    vcpu, memory = 0.0, 0.0
+    for requirements in requirement_lists:
+        for requirement in requirements or []:
+            if requirement.get('type') == 'VCPU':
+                vcpu += float(requirement['value'])
+            elif requirement.get('type') == 'MEMORY':
+                memory += float(requirement['value'])
+    return vcpu or None, memory or None
+
+
+def record_stage_duration(table, stage, job):
+    """
+    Fold the run time of a succeeded job into the moving averages of its stage.
+
+    Jobs tagged with EstimatedInputMB also update moving averages of the input size, its
+    square, the run time and their product, from which estimate_stage_seconds fits a base
+    time plus seconds per MB. The item is replaced conditionally on the job count it was read
+    with, so concurrent jobs of a stage do not overwrite each other's updates.
+
+    Returns:
+        bool: True if the job had a run time to record
+    """
+    started_at, stopped_at = job.get('startedAt'), job.get('stoppedAt')
+    if job.get('status') != 'SUCCEEDED' or started_at is None or stopped_at is None:
+        return False
+
+    seconds = max((stopped_at - started_at) / 1000, 0)
+    key = {'run_id': f"{STAGE_STATS_PREFIX}{stage}"}
+    input_mb = float((job.get('tags') or {}).get('EstimatedInputMB') or 0)
+    vcpu, memory = job_resources(job)
+
+    for _ in range(MAX_STATS_ATTEMPTS):
+        stats = table.get_item(Key=key, ConsistentRead=True).get('Item') or {}
+
+        def smooth(name, value):
+            previous = _number(stats.get(name, value))
+            return Decimal(str(round((1 - DURATION_SMOOTHING) * previous + DURATION_SMOOTHING * value, 3)))
+
+        item = {**key, 'stage': stage, 'jobs': int(stats.get('jobs', 0)) + 1,
+                'avg_seconds': smooth('avg_seconds', seconds),
+                'updated_at': datetime.datetime.now(datetime.timezone.utc).isoformat()}
+        if job.get('createdAt') is not None:
+            item['avg_queue_seconds'] = smooth('avg_queue_seconds', max((started_at - job['createdAt']) / 1000, 0))
+        item.update({name: stats[name] for name in SIZED_AVERAGES + ('sized_jobs',) if name in stats})
+        if input_mb > 0:
+            item.update({'avg_input_mb': smooth('avg_input_mb', input_mb),
+                         'avg_input_mb_sq': smooth('avg_input_mb_sq', input_mb * input_mb),
+                         'avg_sized_seconds': smooth('avg_sized_seconds', seconds),
+                         'avg_mb_seconds': smooth('avg_mb_seconds', input_mb * seconds),
+                         'sized_jobs': int(stats.get('sized_jobs', 0)) + 1})
+
+        if vcpu:
+            item['vcpu'] = Decimal(str(vcpu))
+            item['memory'] = Decimal(str(memory or 0))
+
+        condition = ({'ConditionExpression': 'jobs = :jobs', 'ExpressionAttributeValues': {':jobs': stats['jobs']}}
+                     if 'jobs' in stats else {'ConditionExpression': 'attribute_not_exists(run_id)'})
+        try:
+            table.put_item(Item=item, **condition)
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+    print(f"Gave up recording the duration of {stage} after {MAX_STATS_ATTEMPTS} concurrent updates")
+    return False
+
+
+def stage_stats(table, stages):
+    """Return the duration statistics of the given stages, by stage; stages without history are left out."""
+    if not table:
+        return {}
+    stats = {}
+    for stage in stages:
+        item = table.get_item(Key={'run_id': f"{STAGE_STATS_PREFIX}{stage}"}).get('Item')
+        if item:
+            stats[stage] = {name: _number(value) for name, value in item.items()}
+    return stats
+
+
+def job_definition_resources(batch_client, job_definition):
+    """Look up the vCPU and memory (MiB) of the newest active revision of a job definition."""
+    definitions = batch_client.describe_job_definitions(jobDefinitionName=job_definition,
+                                                        status='ACTIVE').get('jobDefinitions', [])
+    if not definitions:
+        return None, None
+    return job_resources(max(definitions, key=lambda definition: definition.get('revision', 0)))
+
+
+def job_graph(skipped_stages, fused, fused_job_definition, queue_name):
+    """
+    List the jobs the launcher would submit, with the stages each one waits for.
+
+    Returns:
+        list: {'stage', 'jobDefinition', 'jobQueue', 'dependsOn'} in submission order
+    """
+    if fused:
+        return [{'stage': 'fused', 'jobDefinition': fused_job_definition, 'jobQueue': queue_name, 'dependsOn': []}]
+
+    graph = []
+    for stage, job_definition in CHAIN_STAGES:
+        if stage in skipped_stages:
+            continue
+        graph.append({'stage': stage, 'jobDefinition': job_definition, 'jobQueue': queue_name,
+                      'dependsOn': [job['stage'] for job in graph]})
+    return graph
+
+
+def estimate_stage_seconds(stats, input_mb):
+    """
+    Estimate the run time of a stage from its history.
+
+    With input sizes that vary enough, the run time is fitted as a base time plus seconds per
+    MB, so fixed startup costs are not scaled with the input. Otherwise the average run time
+    is scaled by size only for inputs close to the average size.
+
+    Returns:
+        tuple: (seconds, basis), where basis says which statistic the estimate comes from
+    """
+    if stats and input_mb and all(stats.get(name) for name in SIZED_AVERAGES):
+        mean_mb, mean_seconds = stats['avg_input_mb'], stats['avg_sized_seconds']
+        variance = stats['avg_input_mb_sq'] - mean_mb * mean_mb
+        if int(stats.get('sized_jobs', 0)) > 1 and variance > (MIN_SIZE_VARIATION * mean_mb) ** 2:
+            slope = (stats['avg_mb_seconds'] - mean_mb * mean_seconds) / variance
+            if slope >= 0:
+                return max(mean_seconds + slope * (input_mb - mean_mb), 0), 'history-fit'
+        if 1 / SIMILAR_SIZE_RATIO <= input_mb / mean_mb <= SIMILAR_SIZE_RATIO:
+            return mean_seconds * input_mb / mean_mb, 'history-per-mb'
+    if stats and stats.get('avg_seconds'):
+        return stats['avg_seconds'], 'history'
+    return DEFAULT_STAGE_SECONDS, 'default'
+
+
+def shared_queues(batch_client, queue_name):
+    """
+    List the Batch queues that share a compute environment with the given queue, the queue itself included.
+
+    The interactive queue overflows onto the Spot environment of the batch queue, so jobs of either queue
+    take capacity a new job could otherwise use.
+    """
+    queues = batch_client.describe_job_queues(jobQueues=[queue_name]).get('jobQueues', [])
+    environments = {entry['computeEnvironment'] for queue in queues
+                    for entry in queue.get('computeEnvironmentOrder', [])}
+    if not environments:
+        return [queue_name]
+
+    names = {queue_name}
+    for page in batch_client.get_paginator('describe_job_queues').paginate():
+        for queue in page.get('jobQueues', []):
+            if environments & {entry['computeEnvironment'] for entry in queue.get('computeEnvironmentOrder', [])}:
+                names.add(queue['jobQueueName'])
+    return sorted(names)
+
+
+def queue_depth(batch_client, queue_names):
+    """Count the jobs of the given Batch queues by status, for the statuses a new job would wait behind or beside."""
+    depth = {}
+    paginator = batch_client.get_paginator('list_jobs')
+    for status in QUEUED_STATUSES + ('RUNNING',):
+        depth[status] = sum(len(page.get('jobSummaryList', []))
+                            for queue_name in queue_names
+                            for page in paginator.paginate(jobQueue=queue_name, jobStatus=status))
+    return depth
+
+
+def admission_wait_seconds(user_id, tier, dynamodb_client, now):
+    """
+    Seconds a request would wait in its tier's holding queue, or 0 if it would be admitted straight away.
+    """
+    table_name = admission_table_name()
+    if not table_name:
+        return 0
+    item = dynamodb_client.get_item(TableName=table_name, Key={'scope': {'S': f"TIER#{tier}"}}).get('Item', {})
+    in_flight = int(item.get('in_flight', {}).get('N', 0))
+    tier_held = int(item.get('tier_held', {}).get('N', 0))
+    if in_flight < max_in_flight(tier) and tier_held <= 0:
+        return 0
+    estimated_start, _ = estimate_start(user_id, tier, table_name=table_name, dynamodb_client=dynamodb_client,
+                                        now=now)
+    return max(estimated_start.timestamp() - now, 0)
+
+
+def fargate_cost(vcpu, memory_mib, seconds, spot):
+    """Estimate the Fargate cost in USD of a task of the given size running for `seconds`."""
+    hourly = (vcpu * float(os.environ.get('FARGATE_VCPU_HOUR_USD', DEFAULT_VCPU_HOUR_USD)) +
+              memory_mib / 1024 * float(os.environ.get('FARGATE_GB_HOUR_USD', DEFAULT_GB_HOUR_USD)))
+    if spot:
+        hourly *= 1 - float(os.environ.get('FARGATE_SPOT_DISCOUNT', DEFAULT_SPOT_DISCOUNT))
+    return hourly * seconds / 3600
+
+
+def plan_backtest(graph, tier, user_id, estimated_bytes, table, batch_client, dynamodb_client, now=None):
+    """
+    Estimate the queue wait, run time and cost of a job graph from stage history and current queue depth.
+
+    Stages run one after another, so the run time is the sum of the stage estimates. The queue
+    wait is the admission hold, if the tier is at capacity, plus the time for the waiting jobs of
+    every queue sharing the tier's compute environments to drain through BATCH_MAX_VCPUS.
+
+    The interactive tier is priced at on-demand rates, but its overflow runs on Spot, so its cost
+    is an upper bound and minCostUsd gives the all-Spot lower bound.
+
+    Returns:
+        dict: The job graph with per-job estimates, the downstream stages with history, and totals
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc).timestamp()
+    input_mb = estimated_bytes / (1024 * 1024) if estimated_bytes else None
+    spot = tier == 'batch'
+    stats = stage_stats(table, [job['stage'] for job in graph] + list(DOWNSTREAM_STAGES))
+
+    jobs = []
+    for job in graph:
+        stage_history = stats.get(job['stage'])
+        vcpu, memory = ((stage_history['vcpu'], stage_history.get('memory', 0))
+                        if stage_history and stage_history.get('vcpu')
+                        else job_definition_resources(batch_client, job['jobDefinition']))
+        seconds, basis = estimate_stage_seconds(stage_history, input_mb)
+        jobs.append({**job, 'vcpu': vcpu, 'memory': memory, 'estimatedSeconds': round(seconds),
+                     'estimateBasis': basis, 'historicalJobs': int(stage_history['jobs']) if stage_history else 0})
+
+    downstream = []
+    for stage in DOWNSTREAM_STAGES:
+        if stage in stats and stats[stage].get('vcpu'):
+            seconds, basis = estimate_stage_seconds(stats[stage], input_mb)
+            downstream.append({'stage': stage, 'vcpu': stats[stage]['vcpu'], 'memory': stats[stage].get('memory', 0),
+                               'estimatedSeconds': round(seconds), 'estimateBasis': basis,
+                               'historicalJobs': int(stats[stage]['jobs'])})
+
+    for job in jobs + downstream:
+        job['estimatedCostUsd'] = round(fargate_cost(job['vcpu'] or 0, job['memory'] or 0,
+                                                     job['estimatedSeconds'], spot), 4)
+
+    queues = shared_queues(batch_client, graph[0]['jobQueue']) if graph else []
+    depth = queue_depth(batch_client, queues) if queues else {}
+    waiting = sum(depth.get(status, 0) for status in QUEUED_STATUSES)
+    max_vcpus = float(os.environ.get('BATCH_MAX_VCPUS', 4))
+    first_vcpu = jobs[0]['vcpu'] if jobs and jobs[0]['vcpu'] else 1
+    slots = max(math.floor(max_vcpus / first_vcpu), 1)
+    typical_seconds = (sum(stage['avg_seconds'] for stage in stats.values()) / len(stats)
+                       if stats else DEFAULT_STAGE_SECONDS)
+    batch_wait = math.ceil(waiting / slots) * typical_seconds
+    admission_wait = admission_wait_seconds(user_id, tier, dynamodb_client, now)
+
+    all_jobs = jobs + downstream
+    runtime = sum(job['estimatedSeconds'] for job in all_jobs)
+    queue_wait = admission_wait + batch_wait
+    min_cost = sum(fargate_cost(job['vcpu'] or 0, job['memory'] or 0, job['estimatedSeconds'], True)
+                   for job in all_jobs)
+    return {
+        'jobs': jobs,
+        'downstream': downstream,
+        'queueDepth': depth,
+        'sharedQueues': queues,
+        'estimate': {
+            'queueWaitSeconds': round(queue_wait),
+            'admissionWaitSeconds': round(admission_wait),
+            'runtimeSeconds': round(runtime),
+            'vcpuHours': round(sum((job['vcpu'] or 0) * job['estimatedSeconds'] for job in all_jobs) / 3600, 3),
+            'costUsd': round(sum(job['estimatedCostUsd'] for job in all_jobs), 4),
+            'minCostUsd': round(min_cost, 4),
+            'pricing': 'fargate-spot' if spot else 'fargate-on-demand-upper-bound',
+            'estimatedInputMb': round(input_mb, 1) if input_mb else None,
+            'estimatedFinishTime': datetime.datetime.fromtimestamp(now + queue_wait + runtime,
+                                                                   datetime.timezone.utc).isoformat(),
+        },
+    }
@@ -0,0 +1,97 @@
+import json
+import secrets
+
+import boto3
+
+from tracing import parse_trace_header, trace_header_from_job
+
+TERMINAL_STATUSES = ('SUCCEEDED', 'FAILED')
+
+
+def _segment_id() -> str:
+    return secrets.token_hex(8)
+
+
+def _seconds(milliseconds):
+    return milliseconds / 1000.0 if milliseconds else None
+
+
+def build_job_segment(job):
+    """
+    Build an X-Ray segment document for a finished Batch job.
+
+    The segment spans the job from submission to its last attempt stopping, with a `queue`
+    subsegment for the time until the first attempt started (including waiting on upstream
+    jobs) and one `run` subsegment per attempt, so Spot interruption retries are visible.
+
+    Returns:
+        dict: The segment document, or None if the job carries no trace header
+    """
+    trace = parse_trace_header(trace_header_from_job(job))
+    if 'Root' not in trace:
+        return None
+
+    tags = job.get('tags', {})
+    stage = tags.get('TaskType') or job.get('jobDefinition', '').split('/')[-1].split(':')[0] or 'batch-job'
+    created_at = _seconds(job.get('createdAt'))
+    attempts = [attempt for attempt in job.get('attempts', []) if attempt.get('startedAt')]
+    started_at = _seconds(attempts[0]['startedAt']) if attempts else _seconds(job.get('startedAt'))
+    stopped_at = _seconds(job.get('stoppedAt')) or started_at or created_at
+
+    subsegments = []
+    if created_at and started_at:
+        subsegments.append({'id': _segment_id(), 'name': 'queue', 'start_time': created_at, 'end_time': started_at})
+    for number, attempt in enumerate(attempts, start=1):
+        subsegments.append({
+            'id': _segment_id(),
+            'name': f'run-attempt-{number}',
+            'start_time': _seconds(attempt['startedAt']),
+            'end_time': _seconds(attempt.get('stoppedAt')) or stopped_at,
+            'metadata': {'batch': {'statusReason': attempt.get('statusReason', '')}}
+        })
+
+    segment = {
+        'name': f"batch-{stage}",
+        'id': _segment_id(),
+        'trace_id': trace['Root'],
+        'start_time': created_at or started_at,
+        'end_time': stopped_at,
+        'origin': 'AWS::Batch::Job',
+        'error': job.get('status') == 'FAILED',
+        'annotations': {
+            'group_tag': tags.get('SubmissionGroupTag', ''),
+            'stage': stage,
+            'ticker': tags.get('Ticker') or tags.get('Symbol', ''),
+            'status': job.get('status', ''),
+            'attempts': len(attempts)
+        },
+        'metadata': {'batch': {'jobId': job.get('jobId'), 'jobName': job.get('jobName'),
+                               'jobQueue': job.get('jobQueue'), 'statusReason': job.get('statusReason', '')}},
+        'subsegments': subsegments
+    }
+    if 'Parent' in trace:
+        segment['parent_id'] = trace['Parent']
+
+    return segment
+
+
+def handler(event, context):
+    """
+    EventBridge handler that turns Batch job state changes into X-Ray segments.
+    """
+    job = event.get('detail', {})
+    if job.get('status') not in TERMINAL_STATUSES:
+        return {'sent': False}
+
+    segment = build_job_segment(job)
+    if not segment:
+        print(f"Job {job.get('jobId')} has no trace header, skipping")
+        return {'sent': False}
+
+    xray_client = boto3.client('xray')
+    response = xray_client.put_trace_segments(TraceSegmentDocuments=[json.dumps(segment)])
+    if response.get('UnprocessedTraceSegments'):
+        print(f"Unprocessed trace segments: {response['UnprocessedTraceSegments']}")
+
+    print(f"Sent segment for job {job.get('jobId')} to trace {segment['trace_id']}")
+    return {'sent': True, 'traceId': segment['trace_id']}
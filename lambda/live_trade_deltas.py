@@ -0,0 +1,242 @@
+import datetime
+import json
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import boto3
+
+# Object layout inside the live trades bucket:
+#   manifests/{stream}.json                 - small, mutable; latest sequence, snapshot and delta keys
+#   deltas/{stream}/{timestamp}-{uuid}.json - immutable append-only record batches
+#   snapshots/{stream}/{sequence}.json      - immutable compaction of every delta up to `sequence`
+MANIFESTS_PREFIX = "manifests/"
+DELTAS_PREFIX = "deltas/"
+SNAPSHOTS_PREFIX = "snapshots/"
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MANIFEST_CACHE_CONTROL = "no-cache"
+
+MAX_APPEND_ATTEMPTS = 10
+
+
+def manifest_key(stream: str) -> str:
+    """Return the S3 key of the manifest for a live trade stream."""
+    return f"{MANIFESTS_PREFIX}{stream}.json"
+
+
+def snapshot_key(stream: str, sequence: int) -> str:
+    """Return the S3 key of the snapshot that covers a stream up to `sequence`."""
+    return f"{SNAPSHOTS_PREFIX}{stream}/{sequence:020d}.json"
+
+
+def empty_manifest(stream: str) -> Dict:
+    """Return the manifest of a stream that has no deltas yet."""
+    return {'stream': stream, 'latest_sequence': 0, 'snapshot': None, 'deltas': []}
+
+
+def _error_code(error) -> str:
+    return error.response.get('Error', {}).get('Code', '')
+
+
+def get_manifest(s3_client, bucket_name: str, stream: str, if_none_match: Optional[str] = None
+                 ) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Fetch the manifest of a stream, optionally as a conditional GET.
+
+    Args:
+        s3_client: boto3 S3 client
+        bucket_name: Name of the live trades bucket
+        stream: Name of the live trade stream
+        if_none_match: ETag from a previous read; when it still matches, nothing is downloaded
+
+    Returns:
+        tuple: (manifest, etag). The manifest is None when it is unchanged since `if_none_match`.
+               A stream that has never been written returns an empty manifest and a None etag.
+    """
+    kwargs = {'Bucket': bucket_name, 'Key': manifest_key(stream)}
+    if if_none_match:
+        kwargs['IfNoneMatch'] = if_none_match
+
+    try:
+        response = s3_client.get_object(**kwargs)
+    except s3_client.exceptions.NoSuchKey:
+        return empty_manifest(stream), None
+    except s3_client.exceptions.ClientError as e:
+        if _error_code(e) in ('304', 'NotModified'):
+            return None, if_none_match
+        raise e
+
+    return json.loads(response['Body'].read()), response['ETag']
+
+
+def put_manifest(s3_client, bucket_name: str, manifest: Dict, if_match: Optional[str]) -> bool:
+    """
+    Write a manifest only if nobody else changed it since it was read.
+
+    Args:
+        s3_client: boto3 S3 client
+        bucket_name: Name of the live trades bucket
+        manifest: Manifest to write
+        if_match: ETag the manifest had when it was read, or None if it did not exist
+
+    Returns:
+        bool: True if the manifest was written, False if a concurrent writer won the race
+    """
+    kwargs = {'Bucket': bucket_name, 'Key': manifest_key(manifest['stream']), 'Body': json.dumps(manifest),
+              'ContentType': 'application/json', 'CacheControl': MANIFEST_CACHE_CONTROL}
+    if if_match:
+        kwargs['IfMatch'] = if_match
+    else:
+        kwargs['IfNoneMatch'] = '*'
+
+    try:
+        s3_client.put_object(**kwargs)
+        return True
+    except s3_client.exceptions.ClientError as e:
+        if _error_code(e) in ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409'):
+            return False
+        raise e
+
+
+def append_delta(bucket_name: str, stream: str, records: List[Dict], s3_client=None) -> int:
+    """
+    Append a batch of live trade records to a stream.
+
+    The delta object is written under a unique key first, then registered in the manifest
+    with a conditional write. A writer that crashes in between only leaves an orphaned
+    delta behind, which the bucket lifecycle rules expire.
+
+    Args:
+        bucket_name: Name of the live trades bucket
+        stream: Name of the live trade stream
+        records: Records to append
+        s3_client: Optional boto3 S3 client
+
+    Returns:
+        int: The sequence number assigned to the delta
+    """
+    s3_client = s3_client or boto3.client('s3')
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    delta_key = f"{DELTAS_PREFIX}{stream}/{now.strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex}.json"
+    body = json.dumps({'records': records, 'written_at': now.isoformat()})
+    s3_client.put_object(Bucket=bucket_name, Key=delta_key, Body=body, ContentType='application/json',
+                         CacheControl=IMMUTABLE_CACHE_CONTROL)
+
+    for _ in range(MAX_APPEND_ATTEMPTS):
+        manifest, etag = get_manifest(s3_client, bucket_name, stream)
+        sequence = manifest['latest_sequence'] + 1
+        manifest['latest_sequence'] = sequence
+        manifest['deltas'].append({'sequence': sequence, 'key': delta_key, 'size': len(body),
+                                   'written_at': now.isoformat()})
+        if put_manifest(s3_client, bucket_name, manifest, etag):
+            print(f"Appended delta {sequence} to stream {stream}: s3://{bucket_name}/{delta_key}")
+            return sequence
+
+    raise RuntimeError(f"Could not register delta for stream {stream} after {MAX_APPEND_ATTEMPTS} attempts")
+
+
+def read_since(bucket_name: str, stream: str, last_sequence: int = 0, manifest_etag: Optional[str] = None,
+               s3_client=None) -> Dict:
+    """
+    Read the records of a stream written after `last_sequence`.
+
+    Readers keep the returned `sequence` and `manifest_etag` and pass them back on the next
+    refresh, so an unchanged stream costs one conditional GET and a changed one only the
+    new deltas. A reader that fell behind the latest compaction gets the snapshot first.
+
+    Args:
+        bucket_name: Name of the live trades bucket
+        stream: Name of the live trade stream
+        last_sequence: Last sequence number the reader has applied
+        manifest_etag: Manifest ETag from the previous read
+        s3_client: Optional boto3 S3 client
+
+    Returns:
+        dict: {'changed', 'reset', 'records', 'sequence', 'manifest_etag'}. When `reset` is True
+              the records replace everything the reader held instead of extending it.
+    """
+    s3_client = s3_client or boto3.client('s3')
+
+    manifest, etag = get_manifest(s3_client, bucket_name, stream, if_none_match=manifest_etag)
+    if manifest is None:
+        return {'changed': False, 'reset': False, 'records': [], 'sequence': last_sequence, 'manifest_etag': etag}
+
+    records = []
+    reset = False
+    snapshot = manifest.get('snapshot')
+    if snapshot and last_sequence < snapshot['sequence']:
+        response = s3_client.get_object(Bucket=bucket_name, Key=snapshot['key'])
+        records.extend(json.loads(response['Body'].read())['records'])
+        last_sequence = snapshot['sequence']
+        reset = True
+
+    for delta in manifest['deltas']:
+        if delta['sequence'] <= last_sequence:
+            continue
+        response = s3_client.get_object(Bucket=bucket_name, Key=delta['key'])
+        records.extend(json.loads(response['Body'].read())['records'])
+        last_sequence = delta['sequence']
+
+    return {'changed': True, 'reset': reset, 'records': records, 'sequence': last_sequence, 'manifest_etag': etag}
+
+
+def retired_keys(manifest: Dict) -> List[str]:
+    """Return the keys of the snapshot and deltas the last compaction of a manifest replaced."""
+    retired = manifest.get('retired') or {}
+    keys = list(retired.get('deltas', []))
+    if retired.get('snapshot'):
+        keys.append(retired['snapshot']['key'])
+    return keys
+
+
+def compact(bucket_name: str, stream: str, s3_client=None) -> Optional[int]:
+    """
+    Fold the current snapshot and every registered delta of a stream into a new snapshot.
+
+    The snapshot and deltas this replaces are recorded as retired in the manifest and only
+    deleted by the next compaction, so a reader that fetched the previous manifest can still
+    download everything it references.
+
+    Args:
+        bucket_name: Name of the live trades bucket
+        stream: Name of the live trade stream
+        s3_client: Optional boto3 S3 client
+
+    Returns:
+        int: The sequence covered by the new snapshot, or None if there was nothing to compact
+    """
+    s3_client = s3_client or boto3.client('s3')
+
+    manifest, etag = get_manifest(s3_client, bucket_name, stream)
+    if not manifest['deltas']:
+        return None
+
+    state = read_since(bucket_name, stream, 0, s3_client=s3_client)
+    sequence = state['sequence']
+    new_snapshot = {'sequence': sequence, 'key': snapshot_key(stream, sequence)}
+    s3_client.put_object(Bucket=bucket_name, Key=new_snapshot['key'],
+                         Body=json.dumps({'sequence': sequence, 'records': state['records']}),
+                         ContentType='application/json', CacheControl=IMMUTABLE_CACHE_CONTROL)
+
+    # Retired by the previous compaction; nothing the current manifest references any more
+    expired_keys = retired_keys(manifest)
+    for _ in range(MAX_APPEND_ATTEMPTS):
+        manifest['retired'] = {'snapshot': manifest.get('snapshot'),
+                               'deltas': [delta['key'] for delta in manifest['deltas'] if delta['sequence'] <= sequence]}
+        manifest['snapshot'] = new_snapshot
+        manifest['deltas'] = [delta for delta in manifest['deltas'] if delta['sequence'] > sequence]
+        if put_manifest(s3_client, bucket_name, manifest, etag):
+            break
+        # A writer appended in the meantime; keep its deltas and retry on top of its manifest
+        manifest, etag = get_manifest(s3_client, bucket_name, stream)
+    else:
+        raise RuntimeError(f"Could not publish snapshot {sequence} for stream {stream}")
+
+    expired_keys = [key for key in expired_keys if key != new_snapshot['key']]
+    for start in range(0, len(expired_keys), 1000):
+        s3_client.delete_objects(Bucket=bucket_name, Delete={
+            'Objects': [{'Key': key} for key in expired_keys[start:start + 1000]], 'Quiet': True})
+
+    print(f"Compacted stream {stream} up to sequence {sequence}")
+    return sequence
@@ -0,0 +1,59 @@
+import datetime
+import json
+import os
+
+import boto3
+
+from live_trade_deltas import MANIFESTS_PREFIX, compact, get_manifest
+
+
+def should_compact(manifest, min_deltas, max_delta_age_minutes, now=None):
+    """
+    Decide whether a stream has accumulated enough deltas to be worth compacting.
+
+    Streams are also compacted once their oldest delta passes the age limit, so a quiet stream
+    does not keep its deltas around indefinitely.
+    """
+    deltas = manifest.get('deltas', [])
+    if not deltas:
+        return False
+    if len(deltas) >= min_deltas:
+        return True
+
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    oldest = datetime.datetime.fromisoformat(deltas[0]['written_at'])
+    return now - oldest >= datetime.timedelta(minutes=max_delta_age_minutes)
+
+
+def handler(event, context):
+    """
+    Scheduled Lambda handler that compacts the deltas of every live trade stream into snapshots.
+
+    A stream that fails does not stop the others, but the invocation fails at the end so the
+    compactor's error alarm fires.
+    """
+    bucket_name = os.environ['LIVE_TRADES_BUCKET']
+    min_deltas = int(os.environ.get('COMPACT_MIN_DELTAS', '50'))
+    max_delta_age_minutes = int(os.environ.get('COMPACT_MAX_DELTA_AGE_MINUTES', '60'))
+
+    s3_client = boto3.client('s3')
+    paginator = s3_client.get_paginator('list_objects_v2')
+
+    compacted = []
+    failed = []
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=MANIFESTS_PREFIX):
+        for item in page.get('Contents', []):
+            stream = item['Key'][len(MANIFESTS_PREFIX):-len('.json')]
+            manifest, _ = get_manifest(s3_client, bucket_name, stream)
+            if should_compact(manifest, min_deltas, max_delta_age_minutes):
+                try:
+                    sequence = compact(bucket_name, stream, s3_client=s3_client)
+                    compacted.append({'stream': stream, 'sequence': sequence})
+                except Exception as e:
+                    print(f"Error compacting stream {stream}: {str(e)}")  # Continue with the other streams
+                    failed.append(stream)
+
+    print(f"Compacted {len(compacted)} streams: {json.dumps(compacted)}")
+    if failed:
+        raise RuntimeError(f"Could not compact {len(failed)} streams: {', '.join(failed)}")
+    return {'compacted': compacted}
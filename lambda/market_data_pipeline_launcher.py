@@ -1,13 +1,24 @@
+import base64
 import json
 import os
-import random
 import datetime
 import re
+import time
 
 import boto3
 
-from do_all_s3_keys_exist import do_all_s3_keys_exist
+from admission import admission_table_name, estimate_start, hold, release, try_admit
+from admission_drainer import drain
+from backtest_plan import job_graph, plan_backtest
 from generate_s3_path_utils import generate_s3_path
+from metrics import StageMetrics, should_log_verbose, ticker_class
+from prepared_cache import (cached_stages, claim_cache_prefix, is_cacheable, prepared_cache_prefix, raw_cache_key,
+                            record_raw_data, reuse_raw_data)
+from rate_limiter import estimate_polygon_calls, polygon_bucket, polygon_calls_per_minute
+from run_catalog import catalog_item, catalog_table, put_run, user_from_event
+from run_ids import new_run_id
+from stage_fusion import FUSED_JOB_DEFINITION, estimate_input_bytes, fused_overrides, should_fuse
+from tracing import parse_trace_header, trace_environment
 
 
 def upload_params_to_s3(params, bucket_name, file_name):
@@ -38,178 +49,408 @@ def upload_params_to_s3(params, bucket_name, file_name):
         raise e
 
 
+# Longest the launcher waits itself for a Polygon start slot; later slots are left to the extract job
+MAX_INLINE_STAGGER_SECONDS = 10
+
+# Input of the scheduled rule that drains the admission holding queues through this function
+DRAIN_ACTION = 'drain-holding-queues'
+
+
 def handler(event, context):
     """
     Lambda function handler that processes market data and submits a chain of batch jobs.
     All jobs use a common group_tag for better tracking and organization.
     """
-    print("Received event:", json.dumps(event))
+    metrics = StageMetrics()
+    with metrics.stage('invocation'):
+        if event.get('action') == DRAIN_ACTION:
+            return drain(lambda held_event, run_id: launch_pipeline(held_event, context, metrics, run_id=run_id),
+                         context)
+        if admission_table_name() and not is_ping_request(event) and not is_dry_run(event):
+            return admit_and_launch(event, context, metrics)
+        return launch_pipeline(event, context, metrics)
 
-    # Initialize boto3 client
-    batch_client = boto3.client('batch')
 
-    # Easy-to-remember random words for group tagging
-    easy_words = ["apple", "banana", "cherry", "dragonfruit", "elderberry", "fig", "grape", "honeydew", "kiwi", "lemon",
-                  "mango", "nectarine", "orange", "papaya", "quince", "raspberry", "strawberry", "tangerine", "ugli",
-                  "vanilla", "watermelon", "xigua", "yam", "zucchini"]
+def admit_and_launch(event, context, metrics):
+    """
+    Launch a backtest if its tier and user are under their concurrency caps, otherwise hold it.
+
+    Held requests are answered with 202 and an estimated start time, and launched by the
+    scheduled drain once capacity frees up. Slots are released by the Batch job state change
+    events when the pipeline finishes, or straight away if submitting it fails.
+    """
+    # Reject malformed requests now rather than when they are replayed
+    extract_arguments_from_event(event)
+    tier, _ = select_tier(parse_event_body(event))
+    user_id = user_from_event(event)
+    run_id = new_run_id()
+
+    admitted, reason = metrics.call('admit', try_admit, run_id, user_id, tier)
+    if not admitted:
+        estimated_start, ahead = metrics.call('estimate_start', estimate_start, user_id, tier)
+        metrics.call('hold_request', hold, event, run_id, user_id, tier, reason)
+        at_capacity = f"{tier} tier" if reason == 'tier' else f"user {user_id}"
+        print(f"The {at_capacity} is at capacity, holding run {run_id}")
+        return {'statusCode': 202, 'body': json.dumps({
+            'message': "Capacity is full, the backtest is queued and will start automatically",
+            'admission': 'QUEUED', 'groupTag': run_id, 'tier': tier, 'queuedAhead': ahead,
+            'estimatedStartTime': estimated_start.isoformat()})}
+
+    try:
+        response = launch_pipeline(event, context, metrics, run_id=run_id)
+    except Exception:
+        release(run_id, succeeded=False)
+        raise
+
+    body = json.loads(response['body'])
+    body.update({'admission': 'ADMITTED',
+                 'estimatedStartTime': datetime.datetime.now(datetime.timezone.utc).isoformat()})
+    return {**response, 'body': json.dumps(body)}
+
+
+def launch_pipeline(event, context, metrics, run_id=None):
+    """
+    Submit the job chain for a backtest request, timing every stage and AWS call.
+
+    Args:
+        run_id: Run ID chosen at admission, for requests that were admitted or held before launching
+    """
+    if should_log_verbose():
+        print("Received event:", json.dumps(event))
 
-    # Second set of easy words for group tagging (animal theme)
-    easy_words2 = ["ant", "bear", "cat", "dog", "elephant", "fox", "giraffe", "hippo", "iguana", "jaguar", "koala",
-                   "lion", "monkey", "newt", "otter", "panda", "quail", "rabbit", "snake", "tiger", "unicorn",
-                   "vulture", "wolf", "xerus", "yak", "zebra"]
+    if is_ping_request(event):
+        # Front door benchmark route: authorizer and Lambda overhead only, no jobs submitted
+        return {'statusCode': 200, 'body': json.dumps({'message': 'pong'})}
 
-    # Generate a random group tag for all jobs in this execution
-    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-    group_tag = f"{random.choice(easy_words)}-{random.choice(easy_words2)}--{timestamp}"
+    # Initialize boto3 client
+    batch_client = boto3.client('batch')
+
+    # Collision-free, time-sortable run ID shared by all jobs in this execution
+    submitted_at = datetime.datetime.now(datetime.timezone.utc)
+    group_tag = run_id or new_run_id(submitted_at)
+    timestamp = submitted_at.strftime("%Y%m%d%H%M%S")
     print(f"Using group tag: {group_tag} for all jobs in this execution")
 
     # Extract ticker from event
-    ticker, from_date, to_date, short_atr_period, long_atr_period, alpha, trade_duration, trade_timeout = extract_arguments_from_event(event)
+    with metrics.stage('parse_request'):
+        ticker, from_date, to_date, short_atr_period, long_atr_period, alpha, trade_duration, trade_timeout = extract_arguments_from_event(event)
+    metrics.ticker_class = ticker_class(ticker)
+    dry_run = is_dry_run(event)
     print(f"Processing ticker: {ticker} {from_date} {to_date} {short_atr_period} {long_atr_period} {alpha}")
     print(f"Trade duration: {trade_duration} hours, Trade timeout: {trade_timeout} hours")
 
-    s3_key_min = generate_s3_path(ticker, "polygon", timeframe="min", group_tag=group_tag)
-    s3_key_hour = generate_s3_path(ticker, "polygon", timeframe="hour", group_tag=group_tag)
-    s3_key_day = generate_s3_path(ticker, "polygon", timeframe="day", group_tag=group_tag)
-
-    # Common job queue
-    queue_name = "fargateSpotTrades"
-    print(f"Using queue: {queue_name}")
+    # Extracted and prepared data of a finished date range is memoized under a prefix derived from the
+    # inputs and enhancer parameters; ranges that are still growing stay under the run's group tag
+    data_prefix = group_tag
+    if is_cacheable(to_date):
+        data_prefix = prepared_cache_prefix(ticker, "polygon", from_date, to_date, short_atr_period,
+                                            long_atr_period, alpha)
+
+    def data_keys(prefix):
+        return [generate_s3_path(ticker, "polygon", timeframe=timeframe, group_tag=prefix)
+                for timeframe in ("min", "hour", "day")]
+
+    skipped_stages = []
+    if data_prefix != group_tag:
+        raw_bucket = os.environ.get('RAW_BUCKET_NAME')
+        skipped_stages = metrics.call('check_prepared_cache', cached_stages, raw_bucket,
+                                      os.environ.get('PREPARED_BUCKET_NAME'), data_keys(data_prefix))
+
+        # A run that will write into the cache claims the prefix first; if another run is filling it,
+        # this one stays run-scoped instead of writing the same keys
+        if len(skipped_stages) < 2 and not dry_run:
+            if metrics.call('claim_prepared_cache', claim_cache_prefix, raw_bucket, data_prefix, group_tag):
+                raw_key = raw_cache_key(ticker, "polygon", from_date, to_date)
+                if not skipped_stages and metrics.call('reuse_raw_data', reuse_raw_data, raw_bucket, raw_key,
+                                                       data_prefix, data_keys(data_prefix)):
+                    skipped_stages = ['polygon-extract']
+                elif not skipped_stages:
+                    record_raw_data(raw_bucket, raw_key, data_prefix)
+            else:
+                print(f"Another run is filling {data_prefix}, using the run-scoped prefix")
+                data_prefix, skipped_stages = group_tag, []
+        print(f"Data prefix {data_prefix}, reusing the output of {skipped_stages or 'no stages'}")
+
+    s3_key_min, s3_key_hour, s3_key_day = data_keys(data_prefix)
+
+    # Environment shared by every job in the chain; carries the API/Lambda trace into Batch
+    common_environment = trace_environment()
+    trace_root = parse_trace_header(common_environment[0]['value']).get('Root') if common_environment else None
+
+    # Run-scoped directory on the shared scratch volume, so downstream stages can read upstream output locally
+    scratch_root = os.environ.get('SCRATCH_ROOT')
+    if scratch_root:
+        common_environment = common_environment + [{'name': 'SCRATCH_DIR', 'value': f"{scratch_root}/runs/{group_tag}"}]
+
+    # Run-scoped checkpoint prefix; long-running stages checkpoint under {prefix}{AWS_BATCH_JOB_ID}/, with
+    # AWS_BATCH_JOB_ATTEMPT telling them whether they are resuming. Overrides the job definitions' checkpoints/jobs/
+    if os.environ.get('CHECKPOINT_BUCKET'):
+        common_environment = common_environment + [
+            {'name': 'CHECKPOINT_BUCKET', 'value': os.environ['CHECKPOINT_BUCKET']},
+            {'name': 'CHECKPOINT_PREFIX', 'value': f"checkpoints/{group_tag}/"}]
+
+    # Job queue of the requested latency tier, shared by every job in the chain
+    with metrics.stage('select_tier'):
+        tier, queue_name = select_tier(parse_event_body(event))
+    print(f"Using {tier} tier queue: {queue_name}")
 
     # Create a parameters dictionary with all the relevant parameters
     params = {'ticker': ticker, 'from_date': from_date, 'to_date': to_date, 'short_atr_period': short_atr_period,
         'long_atr_period': long_atr_period, 'alpha': alpha, 'trade_duration': trade_duration, 
-        'trade_timeout': trade_timeout, 'group_tag': group_tag, 'timestamp': timestamp}
+        'trade_timeout': trade_timeout, 'group_tag': group_tag, 'timestamp': timestamp, 'data_prefix': data_prefix}
 
     # Upload parameters to the backtest params bucket
     backtest_params_bucket = os.environ.get('MOCHI_PROD_BACKTEST_PARAMS')
-    if backtest_params_bucket:
+    if dry_run:
+        print("Dry run, skipping parameter upload")
+    elif backtest_params_bucket:
         try:
             # Use group_tag as the file name
             file_name = f"{group_tag}.json"
-            upload_params_to_s3(params, backtest_params_bucket, file_name)
+            metrics.call('upload_params', upload_params_to_s3, params, backtest_params_bucket, file_name)
             print(f"Parameters uploaded to {backtest_params_bucket}/{file_name}")
         except Exception as e:
             print(f"Error uploading parameters to S3: {str(e)}")  # Continue execution even if upload fails
     else:
         print("MOCHI_PROD_BACKTEST_PARAMS environment variable not set, skipping parameter upload")
 
-    # Step 1: Submit the polygon job (first in the chain)
-    polygon_job_name = sanitize_job_name(f"polygon-job-{ticker}-{group_tag}")
-    print(f"Submitting polygon job: {polygon_job_name}")
-
-    keys_to_check = [s3_key_min, s3_key_hour, s3_key_day]
-
-    raw_data_bucket = os.environ.get('RAW_BUCKET_NAME')
-
-    polygon_response = batch_client.submit_job(jobName=polygon_job_name, jobQueue=queue_name,
-                                               jobDefinition='polygon-extract',
-                                               parameters={'ticker': ticker, 'from_date': from_date,
-                                                           'to_date': to_date}, containerOverrides={
-            'command': ["python", "src/main.py", "--tickers", ticker, "--s3_key_min", s3_key_min, "--s3_key_hour",
-                        s3_key_hour, "--s3_key_day", s3_key_day, "--from_date", from_date, "--to_date", to_date,
-                        "--back_test_id", group_tag],
-            'environment': [{"name": "POLYGON_API_KEY", "value": os.environ.get('POLYGON_API_KEY')},
-                            {'name': 'OUTPUT_BUCKET_NAME', 'value': os.environ.get('RAW_BUCKET_NAME')}]},
-                                               tags={"Ticker": ticker, "SubmissionGroupTag": group_tag,
-                                                     "TaskType": "polygon-extract"})
-
-    polygon_job_id = polygon_response['jobId']
-    print(f"Submitted polygon job with ID: {polygon_job_id}")
-
+    # Command and environment of each stage, shared by the job chain and the fused task
+    polygon_command = ["python", "src/main.py", "--tickers", ticker, "--s3_key_min", s3_key_min, "--s3_key_hour",
+                       s3_key_hour, "--s3_key_day", s3_key_day, "--from_date", from_date, "--to_date", to_date,
+                       "--back_test_id", group_tag]
+    polygon_environment = [{"name": "POLYGON_API_KEY", "value": os.environ.get('POLYGON_API_KEY')},
+                           {'name': 'OUTPUT_BUCKET_NAME', 'value': os.environ.get('RAW_BUCKET_NAME')}] + common_environment
+
+    # Space out extract jobs so their combined Polygon calls stay within the plan's rate limit
+    polygon_not_before = None
+    rate_limiter = polygon_bucket()
+    if rate_limiter and 'polygon-extract' not in skipped_stages and not dry_run:
+        polygon_calls = estimate_polygon_calls(ticker, from_date, to_date)
+        polygon_not_before = metrics.call('schedule_polygon_calls', rate_limiter.schedule, polygon_calls)
+        stagger_seconds = polygon_not_before - time.time()
+        print(f"Reserved {polygon_calls} Polygon calls starting in {max(stagger_seconds, 0):.1f} s")
+        if 0 < stagger_seconds <= MAX_INLINE_STAGGER_SECONDS:
+            time.sleep(stagger_seconds)
+        polygon_environment = polygon_environment + [
+            {'name': 'POLYGON_NOT_BEFORE', 'value': f"{polygon_not_before:.3f}"},
+            {'name': 'POLYGON_ESTIMATED_CALLS', 'value': str(polygon_calls)},
+            {'name': 'POLYGON_CALLS_PER_MINUTE', 'value': f"{polygon_calls_per_minute():g}"}]
+
+    enhance_command = ["python", "src/enhancer.py", "--ticker", ticker, "--provider", "polygon", "--s3_key_min",
+                       s3_key_min, "--s3_key_hour", s3_key_hour, "--s3_key_day", s3_key_day, "--short_atr_period",
+                       str(short_atr_period), "--long_atr_period", str(long_atr_period), "--alpha", str(alpha),
+                       "--back_test_id", group_tag]
+    enhance_environment = [{'name': 'INPUT_BUCKET_NAME', 'value': os.environ.get('RAW_BUCKET_NAME')},
+                           {'name': 'OUTPUT_BUCKET_NAME', 'value': os.environ.get('PREPARED_BUCKET_NAME')},
+                           {'name': 'AWS_REGION', 'value': 'eu-central-1'},
+                           {'name': 'MOCHI_PROD_BACKTEST_PARAMS',
+                            'value': os.environ.get('MOCHI_PROD_BACKTEST_PARAMS')},
+                           ] + common_environment
+
+    metadata_command = ["--s3-key-min", s3_key_min, "--ticker", ticker, "--group-tag", group_tag, "--back-test-id",
+                        group_tag, "--trade-duration", str(trade_duration), "--trade-timeout", str(trade_timeout)]
+    metadata_environment = [{'name': 'AWS_REGION', 'value': 'eu-central-1'},
+                            {'name': 'S3_BUCKET', 'value': os.environ.get('RAW_BUCKET_NAME')},
+                            {'name': 'S3_UPLOAD_BUCKET', 'value': os.environ.get('MOCHI_PROD_TICKER_META')},
+                            {'name': 'MOCHI_DATA_BUCKET', 'value': os.environ.get('PREPARED_BUCKET_NAME')},
+                            {'name': 'MOCHI_TRADES_BUCKET', 'value': os.environ.get('TRADES_BUCKET_NAME')},
+                            {'name': 'MOCHI_TRADERS_BUCKET', 'value': os.environ.get('TRADER_BUCKET_NAME')},
+                            {'name': 'S3_TICKER-META_BUCKET', 'value': os.environ.get('MOCHI_PROD_TICKER_META')},
+                            {'name': 'MOCHI_AGGREGATION_BUCKET', 'value': os.environ.get('MOCHI_AGGREGATION_BUCKET')},
+                            {'name': 'MOCHI_AGGREGATION_BUCKET_STAGING',
+                             'value': os.environ.get('MOCHI_AGGREGATION_BUCKET_STAGING')},
+                            {'name': 'MOCHI_GRAPHS_BUCKET', 'value': os.environ.get('MOCHI_GRAPHS_BUCKET')},
+                            {'name': 'MOCHI_PROD_TRADE_EXTRACTS', 'value': os.environ.get('MOCHI_PROD_TRADE_EXTRACTS')}
+                            ] + common_environment
+
+    # Small backtests run all three stages in one task, passing data through the task's local disk
+    estimated_bytes = estimate_input_bytes(ticker, from_date, to_date)
+    fused = not skipped_stages and should_fuse(estimated_bytes)
+    # Lets the run catalog learn how stage durations grow with input size, for dry-run estimates
+    size_tags = {"EstimatedInputMB": f"{estimated_bytes / (1024 * 1024):.1f}"} if estimated_bytes else {}
+
+    if dry_run:
+        graph = job_graph(skipped_stages, fused, FUSED_JOB_DEFINITION, queue_name)
+        plan = metrics.call('plan_backtest', plan_backtest, graph, tier, user_from_event(event), estimated_bytes,
+                            catalog_table(), batch_client, boto3.client('dynamodb'))
+        response_body = {'message': f'Dry run, no jobs submitted for {ticker}', 'dryRun': True,
+                         'mode': 'fused' if fused else 'chain', 'tier': tier, 'dataPrefix': data_prefix,
+                         'skippedStages': skipped_stages, **plan}
+        return {'statusCode': 200, 'body': json.dumps(response_body)}
+
+    if fused:
+        fused_job_name = sanitize_job_name(f"fused-job-{ticker}-{group_tag}")
+        print(f"Estimated input {estimated_bytes} bytes, submitting fused job: {fused_job_name}")
+
+        fused_response = metrics.call('submit_fused', batch_client.submit_job, jobName=fused_job_name,
+                                      jobQueue=queue_name, jobDefinition=FUSED_JOB_DEFINITION,
+                                      ecsPropertiesOverride=fused_overrides({
+                                          'extract': {'command': polygon_command,
+                                                      'environment': polygon_environment},
+                                          'enhance': {'command': enhance_command,
+                                                      'environment': enhance_environment},
+                                          'metadata': {'command': metadata_command,
+                                                       'environment': metadata_environment}}),
+                                      tags={"Ticker": ticker, "SubmissionGroupTag": group_tag, "TaskType": "fused",
+                                            **size_tags})
+
+        fused_job_id = fused_response['jobId']
+        print(f"Submitted fused job with ID: {fused_job_id}")
+
+        record_run(metrics, event, group_tag, ticker, params, {'fused': {'jobId': fused_job_id}}, tier, 'fused')
+
+        # The stage job IDs point at the fused job so existing clients keep working
+        response_body = {'message': f'Successfully submitted fused job for {ticker}', 'mode': 'fused', 'tier': tier,
+                         'fusedJobId': fused_job_id, 'polygonJobId': fused_job_id, 'enhanceJobId': fused_job_id,
+                         'groupTag': group_tag}
+        if trace_root:
+            response_body['traceId'] = trace_root
+        if polygon_not_before:
+            response_body['polygonNotBefore'] = datetime.datetime.fromtimestamp(
+                polygon_not_before, datetime.timezone.utc).isoformat()
+
+        return {'statusCode': 200, 'body': json.dumps(response_body)}
+
+    # Stages whose output is already under the data prefix are not submitted; the jobs that are
+    # depend only on the ones submitted before them
     dependencies = []
-    if 'polygon_job_id' in locals():
-        # Only add the polygon job as a dependency if it was actually submitted
-        dependencies.append({'jobId': polygon_job_id})
-    else:
+    stages = {}
+
+    # Step 1: Submit the polygon job (first in the chain)
+    if 'polygon-extract' in skipped_stages:
         polygon_job_id = "skipped"
+    else:
+        polygon_job_name = sanitize_job_name(f"polygon-job-{ticker}-{group_tag}")
+        print(f"Submitting polygon job: {polygon_job_name}")
+
+        polygon_response = metrics.call('submit_polygon_extract', batch_client.submit_job, jobName=polygon_job_name, jobQueue=queue_name,
+                                                   jobDefinition='polygon-extract',
+                                                   parameters={'ticker': ticker, 'from_date': from_date,
+                                                               'to_date': to_date}, containerOverrides={
+                'command': polygon_command,
+                'environment': polygon_environment},
+                                                   tags={"Ticker": ticker, "SubmissionGroupTag": group_tag,
+                                                         "TaskType": "polygon-extract", **size_tags})
+
+        polygon_job_id = polygon_response['jobId']
+        print(f"Submitted polygon job with ID: {polygon_job_id}")
+        dependencies.append({'jobId': polygon_job_id})
+        stages['polygon-extract'] = {'jobId': polygon_job_id}
 
     # Step 2: Submit the trade-data-enhancer job (dependent on polygon job)
-    enhance_job_name = sanitize_job_name(f"trade-data-enhancer-{ticker}-{group_tag}")
-    print(f"Submitting trade-data-enhancer job: {enhance_job_name}")
-
-    enhance_response = batch_client.submit_job(jobName=enhance_job_name, jobQueue=queue_name,
-                                               jobDefinition="trade-data-enhancer", dependsOn=dependencies,
-                                               containerOverrides={
-                                                   'command': ["python", "src/enhancer.py", "--ticker", ticker,
-                                                               "--provider", "polygon", "--s3_key_min", s3_key_min,
-                                                               "--s3_key_hour", s3_key_hour, "--s3_key_day", s3_key_day,
-                                                               "--short_atr_period", str(short_atr_period),
-                                                               "--long_atr_period", str(long_atr_period), "--alpha",
-                                                               str(alpha), "--back_test_id", group_tag],
-                                                   'environment': [{'name': 'INPUT_BUCKET_NAME',
-                                                                    'value': os.environ.get('RAW_BUCKET_NAME')},
-                                                       {'name': 'OUTPUT_BUCKET_NAME',
-                                                        'value': os.environ.get('PREPARED_BUCKET_NAME')},
-                                                       {'name': 'AWS_REGION', 'value': 'eu-central-1'},
-                                                       {'name': 'MOCHI_PROD_BACKTEST_PARAMS',
-                                                        'value': os.environ.get('MOCHI_PROD_BACKTEST_PARAMS')},
-
-                                                   ]}, tags={"Ticker": ticker, "SubmissionGroupTag": group_tag,
-                                                             "TaskType": "trade-data-enhancer"})
-
-    enhance_job_id = enhance_response['jobId']
-    print(f"Submitted trade-data-enhancer job with ID: {enhance_job_id}")
-
-    # Step 1: Submit the polygon job (first in the chain)
+    if 'trade-data-enhancer' in skipped_stages:
+        enhance_job_id = "skipped"
+    else:
+        enhance_job_name = sanitize_job_name(f"trade-data-enhancer-{ticker}-{group_tag}")
+        print(f"Submitting trade-data-enhancer job: {enhance_job_name}")
+
+        enhance_response = metrics.call('submit_trade_data_enhancer', batch_client.submit_job, jobName=enhance_job_name, jobQueue=queue_name,
+                                                   jobDefinition="trade-data-enhancer", dependsOn=dependencies,
+                                                   containerOverrides={
+                                                       'command': enhance_command,
+                                                       'environment': enhance_environment}, tags={"Ticker": ticker, "SubmissionGroupTag": group_tag,
+                                                                 "TaskType": "trade-data-enhancer", **size_tags})
+
+        enhance_job_id = enhance_response['jobId']
+        print(f"Submitted trade-data-enhancer job with ID: {enhance_job_id}")
+        dependencies = dependencies + [{'jobId': enhance_job_id}]
+        stages['trade-data-enhancer'] = {'jobId': enhance_job_id}
+
+    # Step 3: Submit the metadata job (dependent on the stages above)
     metadata_job_name = sanitize_job_name(f"metadata-job-{ticker}-{group_tag}")
 
     print(f"Submitting job with name: {metadata_job_name}")
 
     # Submit the trades job (dependent on trade-data-enhancer-job)
-    metadata_response = batch_client.submit_job(jobName=metadata_job_name, jobQueue=queue_name,
+    metadata_response = metrics.call('submit_data_metadata', batch_client.submit_job, jobName=metadata_job_name, jobQueue=queue_name,
                                                 jobDefinition="data-metadata",
-                                                dependsOn=[{'jobId': polygon_job_id}, {'jobId': enhance_job_id}],
+                                                dependsOn=dependencies,
                                                 containerOverrides={
-                                                    "command": ["--s3-key-min", s3_key_min, "--ticker", ticker,
-                                                                "--group-tag", group_tag, "--back-test-id", group_tag,
-                                                                "--trade-duration", str(trade_duration),
-                                                                "--trade-timeout", str(trade_timeout)],
-                                                    'environment': [{'name': 'AWS_REGION', 'value': 'eu-central-1'},
-                                                        {'name': 'S3_BUCKET',
-                                                         'value': os.environ.get('RAW_BUCKET_NAME')},
-                                                        {'name': 'S3_UPLOAD_BUCKET',
-                                                         'value': os.environ.get('MOCHI_PROD_TICKER_META')},
-                                                        {'name': 'MOCHI_DATA_BUCKET',
-                                                         'value': os.environ.get('PREPARED_BUCKET_NAME')},
-                                                        {'name': 'MOCHI_TRADES_BUCKET',
-                                                         'value': os.environ.get('TRADES_BUCKET_NAME')},
-                                                        {'name': 'MOCHI_TRADERS_BUCKET',
-                                                         'value': os.environ.get('TRADER_BUCKET_NAME')},
-                                                        {'name': 'S3_TICKER-META_BUCKET',
-                                                         'value': os.environ.get('MOCHI_PROD_TICKER_META')},
-                                                        {'name': 'MOCHI_AGGREGATION_BUCKET',
-                                                         'value': os.environ.get('MOCHI_AGGREGATION_BUCKET')},
-                                                        {'name': 'MOCHI_AGGREGATION_BUCKET_STAGING',
-                                                         'value': os.environ.get('MOCHI_AGGREGATION_BUCKET_STAGING')},
-
-                                                        {'name': 'MOCHI_GRAPHS_BUCKET',
-                                                         'value': os.environ.get('MOCHI_GRAPHS_BUCKET')},
-                                                        {'name': 'MOCHI_PROD_TRADE_EXTRACTS',
-                                                         'value': os.environ.get('MOCHI_PROD_TRADE_EXTRACTS')}
-
-                                                    ]},
+                                                    "command": metadata_command,
+                                                    'environment': metadata_environment},
 
                                                 tags={"Symbol": ticker, "SubmissionGroupTag": group_tag,
-                                                      "TaskType": "meta"})
+                                                      "TaskType": "meta", **size_tags})
+    stages['meta'] = {'jobId': metadata_response['jobId']}
+
+    record_run(metrics, event, group_tag, ticker, params, stages, tier, 'chain')
+
+    response_body = {'message': f'Successfully submitted job chain for {ticker}', 'mode': 'chain', 'tier': tier,
+                     'polygonJobId': polygon_job_id, 'enhanceJobId': enhance_job_id, 'groupTag': group_tag,
+                     'dataPrefix': data_prefix, 'skippedStages': skipped_stages}
+    if trace_root:
+        response_body['traceId'] = trace_root
+    if polygon_not_before:
+        response_body['polygonNotBefore'] = datetime.datetime.fromtimestamp(
+            polygon_not_before, datetime.timezone.utc).isoformat()
+
+    return {'statusCode': 200, 'body': json.dumps(response_body)}
+
+
+def record_run(metrics, event, group_tag, ticker, params, stages, tier, mode):
+    """
+    Add a submitted run to the run catalog, if one is configured.
+
+    The catalog is an index for the dashboard, so a failed write is logged rather than failing the
+    request; the params file in S3 remains the record of the run.
+    """
+    table = catalog_table()
+    if not table:
+        return
+
+    data_prefix = params.get('data_prefix', group_tag)
+    outputs = {'raw': f"s3://{os.environ.get('RAW_BUCKET_NAME')}/{data_prefix}/",
+               'prepared': f"s3://{os.environ.get('PREPARED_BUCKET_NAME')}/{data_prefix}/"}
+    if os.environ.get('MOCHI_PROD_BACKTEST_PARAMS'):
+        outputs['params'] = f"s3://{os.environ['MOCHI_PROD_BACKTEST_PARAMS']}/{group_tag}.json"
+
+    try:
+        item = catalog_item(group_tag, user_from_event(event), ticker, params, stages, outputs, tier=tier, mode=mode)
+        metrics.call('catalog_run', put_run, table, item)
+    except Exception as e:
+        print(f"Error adding run {group_tag} to the run catalog: {str(e)}")
+
+
+def parse_event_body(event):
+    """Parse the JSON body of an API Gateway event."""
+    # Check if body is present
+    if 'body' not in event:
+        raise ValueError("No body in event")
 
-    return {'statusCode': 200, 'body': json.dumps(
-        {'message': f'Successfully submitted job chain for {ticker}', 'polygonJobId': polygon_job_id,
-         'enhanceJobId': enhance_job_id, 'groupTag': group_tag})}
+    # Parse body as JSON. HTTP API (payload format 2.0) may base64-encode the body.
+    body = event['body']
+    if isinstance(body, str):
+        if event.get('isBase64Encoded'):
+            body = base64.b64decode(body).decode('utf-8')
+        body = json.loads(body)
+    return body
+
+
+def select_tier(body):
+    """
+    Pick the latency tier of a request from its "tier" field, or failing that its "priority" field.
+
+    Interactive runs on on-demand Fargate with Spot overflow; batch runs on Fargate Spot only.
+
+    Returns:
+        tuple: (tier, job queue name)
+    """
+    tier = body.get('tier')
+    if tier is None and body.get('priority') is not None:
+        tier = 'interactive' if body['priority'] == 'high' else 'batch'
+    tier = tier or os.environ.get('DEFAULT_TIER', 'batch')
+    if tier not in ('interactive', 'batch'):
+        raise ValueError(f"Unknown tier {tier}")
+
+    if tier == 'interactive':
+        return tier, os.environ.get('INTERACTIVE_JOB_QUEUE', 'fargateInteractive')
+    return tier, os.environ.get('BATCH_JOB_QUEUE', 'fargateSpotTrades')
 
 
 def extract_arguments_from_event(event):
     """Extract ticker symbol and date range from the event body."""
     try:
-        # Check if body is present
-        if 'body' not in event:
-            raise ValueError("No body in event")
-
-        # Parse body as JSON
-        body = event['body']
-        if isinstance(body, str):
-            import json
-            body = json.loads(body)
+        body = parse_event_body(event)
 
         # Extract ticker from parsed body
         if 'ticker' in body:
@@ -263,6 +504,25 @@ def extract_arguments_from_event(event):
         raise ValueError("Could not extract arguments from event body")
 
 
+def is_dry_run(event):
+    """
+    Check whether a request asks for a plan instead of a launch, with "dryRun": true in the body
+    or ?dryRun=true.
+    """
+    query = event.get('queryStringParameters') or {}
+    try:
+        body = parse_event_body(event)
+    except ValueError:
+        body = {}
+    return str(body.get('dryRun', query.get('dryRun', False))).lower() == 'true'
+
+
+def is_ping_request(event):
+    """Check whether the event comes from the /ping route of the REST (v1) or HTTP (v2) API."""
+    path = event.get('rawPath') or event.get('path') or ''
+    return path.rstrip('/').endswith('/ping')
+
+
 def sanitize_job_name(name):
     """
     Sanitize job name by replacing invalid characters with valid ones.
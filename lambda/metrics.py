@@ -0,0 +1,113 @@
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+
+from botocore.exceptions import ClientError
+
+DEFAULT_NAMESPACE = "Mochi/Launcher"
+
+# Error codes AWS services use to signal throttling
+THROTTLE_ERROR_CODES = {'Throttling', 'ThrottlingException', 'TooManyRequestsException', 'RequestLimitExceeded',
+                        'SlowDown', 'ProvisionedThroughputExceededException'}
+
+# Polygon ticker prefixes, e.g. C:EURUSD or X:BTCUSD
+TICKER_CLASS_PREFIXES = {'C:': 'forex', 'X:': 'crypto', 'I:': 'index', 'O:': 'option'}
+
+
+def ticker_class(ticker) -> str:
+    """Classify a Polygon ticker so metrics can be split by asset class without a per-ticker dimension."""
+    if not ticker:
+        return 'unknown'
+    for prefix, name in TICKER_CLASS_PREFIXES.items():
+        if str(ticker).upper().startswith(prefix):
+            return name
+    return 'stock'
+
+
+def should_log_verbose() -> bool:
+    """Sample verbose log lines, such as full event dumps, at VERBOSE_LOG_SAMPLE_RATE (default 1%)."""
+    return random.random() < float(os.environ.get('VERBOSE_LOG_SAMPLE_RATE', '0.01'))
+
+
+class StageMetrics:
+    """
+    Times handler stages and AWS calls and prints them in CloudWatch Embedded Metric Format.
+
+    Lambda ships stdout to CloudWatch Logs, which extracts the metrics from the EMF lines,
+    so no metrics agent or PutMetricData calls are needed on the hot path.
+    """
+
+    def __init__(self, namespace: str = None):
+        self.namespace = namespace or os.environ.get('METRICS_NAMESPACE', DEFAULT_NAMESPACE)
+        self.ticker_class = 'unknown'
+
+    def emit(self, stage: str, outcome: str, latency_ms: float, throttles: int = 0, retries: int = 0):
+        """Print one EMF record for a stage."""
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [['Stage', 'TickerClass', 'Outcome'], ['Stage']],
+                    'Metrics': [
+                        {'Name': 'Latency', 'Unit': 'Milliseconds'},
+                        {'Name': 'Throttles', 'Unit': 'Count'},
+                        {'Name': 'Retries', 'Unit': 'Count'}
+                    ]
+                }]
+            },
+            'Stage': stage,
+            'TickerClass': self.ticker_class,
+            'Outcome': outcome,
+            'Latency': round(latency_ms, 3),
+            'Throttles': throttles,
+            'Retries': retries
+        }
+        print(json.dumps(record))
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as a stage, recording its outcome even when it raises."""
+        start = time.perf_counter()
+        outcome, throttles = 'success', 0
+        try:
+            yield
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in THROTTLE_ERROR_CODES:
+                outcome, throttles = 'throttled', 1
+            else:
+                outcome = 'error'
+            raise
+        except ValueError:
+            outcome = 'invalid'
+            raise
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            self.emit(name, outcome, (time.perf_counter() - start) * 1000, throttles=throttles)
+
+    def call(self, name: str, fn, *args, **kwargs):
+        """
+        Call an AWS client method (or any function) as a timed stage.
+
+        Throttles that botocore retried transparently show up as `Retries` on a successful call.
+        """
+        start = time.perf_counter()
+        try:
+            response = fn(*args, **kwargs)
+        except ClientError as e:
+            throttled = e.response.get('Error', {}).get('Code') in THROTTLE_ERROR_CODES
+            retries = e.response.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+            self.emit(name, 'throttled' if throttled else 'error', (time.perf_counter() - start) * 1000,
+                      throttles=1 if throttled else 0, retries=retries)
+            raise
+        except Exception:
+            self.emit(name, 'error', (time.perf_counter() - start) * 1000)
+            raise
+
+        retries = response.get('ResponseMetadata', {}).get('RetryAttempts', 0) if isinstance(response, dict) else 0
+        self.emit(name, 'success', (time.perf_counter() - start) * 1000, retries=retries)
+        return response
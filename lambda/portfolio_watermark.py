@@ -0,0 +1,108 @@
+import datetime
+import json
+import os
+import urllib.request
+from typing import Dict, List, Optional
+
+import boto3
+
+WATERMARK_PREFIX = "watermarks/"
+FILING_FORMS = ("13F-HR", "13F-HR/A")
+SEC_SUBMISSIONS_URL = "https://data.sec.gov/submissions/CIK{cik:0>10}.json"
+
+
+def watermark_key(cik: str) -> str:
+    """Return the S3 key holding the last processed filing accession for a CIK."""
+    return f"{WATERMARK_PREFIX}{cik}.json"
+
+
+def read_watermark(bucket_name: str, cik: str, s3_client=None) -> Optional[Dict]:
+    """
+    Read the watermark of a CIK from the portfolio tracking bucket.
+
+    Returns:
+        dict: The watermark, or None if the CIK has never been processed
+    """
+    s3_client = s3_client or boto3.client('s3')
+
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=watermark_key(cik))
+    except s3_client.exceptions.NoSuchKey:
+        return None
+
+    return json.loads(response['Body'].read())
+
+
+def fetch_filing_accessions(cik: str, user_agent: str) -> List[Dict]:
+    """
+    Fetch the recent 13F filings of a CIK from the SEC submissions API, newest first.
+
+    The submissions document is a single small JSON file per filer, so this costs one
+    HTTP request rather than a container run.
+    """
+    request = urllib.request.Request(SEC_SUBMISSIONS_URL.format(cik=cik), headers={'User-Agent': user_agent})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        submissions = json.loads(response.read())
+
+    recent = submissions['filings']['recent']
+    return [{'accession': accession, 'form': form, 'filing_date': filing_date}
+            for accession, form, filing_date in zip(recent['accessionNumber'], recent['form'], recent['filingDate'])
+            if form in FILING_FORMS]
+
+
+def check_handler(event, context):
+    """
+    Step Functions task that decides whether the tracker container needs to run for a CIK.
+
+    Returns the input CIK plus `changed` and the accession range that is new since the
+    watermark. If EDGAR cannot be reached the CIK is reported as changed, so a failed
+    pre-check falls back to the old unconditional run instead of skipping a filing.
+    """
+    cik = str(event['cik'])
+    bucket_name = os.environ['PORTFOLIO_TRACKING_BUCKET']
+    user_agent = os.environ.get('SEC_USER_AGENT', 'mochi-portfolio-tracker test@test.com')
+
+    watermark = read_watermark(bucket_name, cik)
+    last_accession = watermark['accession'] if watermark else None
+
+    try:
+        filings = fetch_filing_accessions(cik, user_agent)
+    except Exception as e:
+        print(f"Error fetching filings for CIK {cik}, running the tracker anyway: {str(e)}")
+        return {'cik': cik, 'changed': True, 'from_accession': last_accession or '', 'to_accession': '',
+                'new_accessions': ''}
+
+    new_filings = []
+    for filing in filings:
+        if filing['accession'] == last_accession:
+            break
+        new_filings.append(filing)
+
+    changed = bool(new_filings)
+    print(f"CIK {cik}: watermark {last_accession}, {len(new_filings)} new filings")
+
+    return {'cik': cik, 'changed': changed, 'from_accession': last_accession or '',
+            'to_accession': new_filings[0]['accession'] if changed else (last_accession or ''),
+            'new_accessions': ",".join(filing['accession'] for filing in reversed(new_filings))}
+
+
+def update_handler(event, context):
+    """
+    Step Functions task that advances the watermark of a CIK after a successful tracker run.
+    """
+    cik = str(event['cik'])
+    to_accession = event.get('to_accession')
+    bucket_name = os.environ['PORTFOLIO_TRACKING_BUCKET']
+
+    if not to_accession:
+        print(f"CIK {cik}: no accession to record, leaving the watermark unchanged")
+        return event
+
+    s3_client = boto3.client('s3')
+    watermark = {'cik': cik, 'accession': to_accession,
+                 'updated_at': datetime.datetime.now(datetime.timezone.utc).isoformat()}
+    s3_client.put_object(Bucket=bucket_name, Key=watermark_key(cik), Body=json.dumps(watermark),
+                         ContentType='application/json')
+
+    print(f"CIK {cik}: watermark advanced to {to_accession}")
+    return event
@@ -0,0 +1,210 @@
+import datetime
+import hashlib
+import json
+import os
+from decimal import Decimal, InvalidOperation
+
+import boto3
+
+from do_all_s3_keys_exist import do_all_s3_keys_exist
+from run_catalog import catalog_table
+
+# Memoized market data lives under cache/{digest}/ in both the raw and the prepared bucket, instead of
+# the run-scoped {group_tag}/ prefix, so later backtests with the same inputs find it
+CACHE_PREFIX = "cache"
+
+# The enhancer reads and writes the same keys, so raw data is stored under the prepared digest too. A pointer
+# at cache/raw/{digest}.json, keyed by the extract inputs only, names the prefix that holds a date range's
+# raw data, so a backtest with other enhancer parameters copies it instead of downloading it again
+RAW_POINTER_PREFIX = f"{CACHE_PREFIX}/raw"
+
+# The run that fills a cache prefix claims it with claim.json; other runs that miss the cache meanwhile
+# stay run-scoped rather than write the same keys. A claim older than CACHE_CLAIM_MINUTES is only taken
+# over once the run catalog shows its owner finished (or never recorded it), and after
+# CACHE_CLAIM_MAX_HOURS regardless, so an owner whose final event was missed cannot hold it forever.
+CLAIM_FILE = "claim.json"
+DEFAULT_CLAIM_MINUTES = 60
+DEFAULT_CLAIM_MAX_HOURS = 24
+
+# Run catalog statuses of a run that no longer writes anything
+FINISHED_RUN_STATUSES = ('SUCCEEDED', 'FAILED')
+
+# Bump PREPARED_CACHE_VERSION when polygon-extract or trade-data-enhancer change their output, so
+# existing artifacts stop matching
+DEFAULT_CACHE_VERSION = "1"
+
+
+def _canonical_number(value) -> str:
+    """Spell a parameter the same way however it was sent, e.g. 14, "14" and 14.0 all become "14"."""
+    try:
+        number = Decimal(str(value)).normalize()
+    except InvalidOperation:
+        return str(value)
+    return format(number, 'f')
+
+
+def is_cacheable(to_date, today=None) -> bool:
+    """
+    Return True if the data of a date range is final and can be shared between backtests.
+
+    Ranges that reach today or later are still growing, so they stay run-scoped.
+    """
+    try:
+        end = datetime.date.fromisoformat(str(to_date))
+    except ValueError:
+        return False
+    return end < (today or datetime.datetime.now(datetime.timezone.utc).date())
+
+
+def prepared_cache_prefix(ticker, source, from_date, to_date, short_atr_period, long_atr_period, alpha) -> str:
+    """
+    Derive the canonical prefix of the extracted and prepared data of a backtest.
+
+    The digest covers everything polygon-extract and trade-data-enhancer read, and nothing the
+    later stages use, so backtests that only change the trade duration or timeout share it.
+    """
+    inputs = {
+        'version': os.environ.get('PREPARED_CACHE_VERSION', DEFAULT_CACHE_VERSION),
+        'ticker': ticker,
+        'source': source,
+        'from_date': str(from_date),
+        'to_date': str(to_date),
+        'short_atr_period': _canonical_number(short_atr_period),
+        'long_atr_period': _canonical_number(long_atr_period),
+        'alpha': _canonical_number(alpha),
+    }
+    digest = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+    return f"{CACHE_PREFIX}/{digest}"
+
+
+def raw_cache_key(ticker, source, from_date, to_date) -> str:
+    """Derive the key of the raw data pointer of a date range, from the inputs of polygon-extract only."""
+    inputs = {
+        'version': os.environ.get('PREPARED_CACHE_VERSION', DEFAULT_CACHE_VERSION),
+        'ticker': ticker,
+        'source': source,
+        'from_date': str(from_date),
+        'to_date': str(to_date),
+    }
+    digest = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+    return f"{RAW_POINTER_PREFIX}/{digest}.json"
+
+
+def _error_code(error) -> str:
+    return error.response.get('Error', {}).get('Code', '')
+
+
+def run_is_active(run_id, table=None) -> bool:
+    """Return True if the run catalog has the run and it has not finished; False without a catalog."""
+    table = table or catalog_table()
+    if not table or not run_id:
+        return False
+    item = table.get_item(Key={'run_id': run_id}, ConsistentRead=True).get('Item')
+    return bool(item) and item.get('status') not in FINISHED_RUN_STATUSES
+
+
+def claim_cache_prefix(bucket_name, prefix, run_id, s3_client=None, now=None, is_active=None) -> bool:
+    """
+    Claim a cache prefix for the run that will fill it, with a conditional write of its claim file.
+
+    An existing claim older than CACHE_CLAIM_MINUTES is taken over, conditional on its ETag,
+    once its owner has finished, so a run that died before filling the prefix does not block
+    it while a run that is still queued or running keeps it.
+
+    Args:
+        is_active: Callable (run_id) telling whether the owner of a claim still runs; defaults
+            to run_is_active
+
+    Returns:
+        bool: True if this run holds the claim
+    """
+    s3_client = s3_client or boto3.client('s3')
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    key = f"{prefix}/{CLAIM_FILE}"
+    body = json.dumps({'run_id': run_id, 'claimed_at': now.isoformat()})
+
+    try:
+        s3_client.put_object(Bucket=bucket_name, Key=key, Body=body, ContentType='application/json',
+                             IfNoneMatch='*')
+        return True
+    except s3_client.exceptions.ClientError as e:
+        if _error_code(e) not in ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409'):
+            raise e
+
+    try:
+        claim = s3_client.get_object(Bucket=bucket_name, Key=key)
+    except s3_client.exceptions.ClientError:
+        return False
+    age = now - claim['LastModified']
+    if age < datetime.timedelta(minutes=float(os.environ.get('CACHE_CLAIM_MINUTES', DEFAULT_CLAIM_MINUTES))):
+        return False
+    owner = json.loads(claim['Body'].read()).get('run_id')
+    max_age = datetime.timedelta(hours=float(os.environ.get('CACHE_CLAIM_MAX_HOURS', DEFAULT_CLAIM_MAX_HOURS)))
+    if age < max_age and (is_active or run_is_active)(owner):
+        print(f"Run {owner} still holds s3://{bucket_name}/{key}")
+        return False
+
+    try:
+        s3_client.put_object(Bucket=bucket_name, Key=key, Body=body, ContentType='application/json',
+                             IfMatch=claim['ETag'])
+        return True
+    except s3_client.exceptions.ClientError as e:
+        if _error_code(e) not in ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409'):
+            raise e
+        return False
+
+
+def reuse_raw_data(bucket_name, raw_key, prefix, s3_keys, s3_client=None) -> bool:
+    """
+    Copy the raw data of a date range into a prefix, from wherever its pointer says it is.
+
+    Args:
+        bucket_name: Raw data bucket
+        raw_key: Pointer key from raw_cache_key
+        prefix: Prefix to copy the data into
+        s3_keys: Keys the data must have under `prefix`
+
+    Returns:
+        bool: True if every key was copied, so the extract can be skipped
+    """
+    s3_client = s3_client or boto3.client('s3')
+    try:
+        pointer = json.loads(s3_client.get_object(Bucket=bucket_name, Key=raw_key)['Body'].read())
+    except s3_client.exceptions.NoSuchKey:
+        return False
+
+    source = pointer.get('prefix')
+    if not source or source == prefix:
+        return False
+    source_keys = [f"{source}{key[len(prefix):]}" for key in s3_keys]
+    if not do_all_s3_keys_exist(bucket_name, source_keys):
+        return False
+
+    for source_key, key in zip(source_keys, s3_keys):
+        s3_client.copy_object(Bucket=bucket_name, Key=key, CopySource={'Bucket': bucket_name, 'Key': source_key})
+    print(f"Copied raw data from s3://{bucket_name}/{source}/ to {prefix}/")
+    return True
+
+
+def record_raw_data(bucket_name, raw_key, prefix, s3_client=None):
+    """Point the raw data pointer of a date range at the prefix its extract is about to fill."""
+    s3_client = s3_client or boto3.client('s3')
+    s3_client.put_object(Bucket=bucket_name, Key=raw_key, Body=json.dumps({'prefix': prefix}),
+                         ContentType='application/json')
+
+
+def cached_stages(raw_bucket, prepared_bucket, s3_keys):
+    """
+    Find the stages whose output already exists under a set of canonical keys.
+
+    The metadata stage reads both buckets, so the enhancer is only skipped when the raw data
+    is still there as well.
+
+    Returns:
+        list: [], ['polygon-extract'] or ['polygon-extract', 'trade-data-enhancer']
+    """
+    if not raw_bucket or not do_all_s3_keys_exist(raw_bucket, s3_keys):
+        return []
+    if not prepared_bucket or not do_all_s3_keys_exist(prepared_bucket, s3_keys):
+        return ['polygon-extract']
+    return ['polygon-extract', 'trade-data-enhancer']
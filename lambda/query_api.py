@@ -0,0 +1,388 @@
+import base64
+import binascii
+import json
+import os
+from collections import OrderedDict
+from decimal import Decimal
+
+import boto3
+from botocore.exceptions import ClientError
+
+from live_trade_deltas import read_since
+from ranking_index import get_json, is_ascending, leaderboard_key, parse_rows
+from run_catalog import INDEX_BY_FILTERS, catalog_table, query_runs, user_from_event
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Most DynamoDB pages one run catalog request reads while collecting `limit` runs that pass its filters
+MAX_CATALOG_PAGES = 10
+
+# Operators of the `filter=field:op:value` query parameter
+FILTER_OPERATORS = {
+    'eq': lambda a, b: a == b,
+    'ne': lambda a, b: a != b,
+    'gt': lambda a, b: a > b,
+    'gte': lambda a, b: a >= b,
+    'lt': lambda a, b: a < b,
+    'lte': lambda a, b: a <= b,
+    'contains': lambda a, b: str(b).lower() in str(a).lower(),
+}
+
+# Parsed ranking objects by key, reused across invocations of a warm container while their ETag is unchanged.
+# Least recently used first; objects are evicted once the cache holds more than RANKING_CACHE_MAX_ROWS rows.
+_ranking_cache = OrderedDict()
+DEFAULT_RANKING_CACHE_MAX_ROWS = 200000
+
+
+class QueryError(ValueError):
+    """A request the API rejects with 400."""
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def response(status_code, body, event=None, max_age=60):
+    """Build an API Gateway proxy response with CORS and browser cache headers."""
+    headers = {'Content-Type': 'application/json', 'Cache-Control': f"private, max-age={max_age}"}
+    origin = ((event or {}).get('headers') or {}).get('origin') or ((event or {}).get('headers') or {}).get('Origin')
+    if origin and origin in os.environ.get('CORS_ALLOWED_ORIGINS', '').split(','):
+        headers['Access-Control-Allow-Origin'] = origin
+        headers['Access-Control-Allow-Credentials'] = 'true'
+        headers['Vary'] = 'Origin'
+    return {'statusCode': status_code, 'headers': headers,
+            'body': json.dumps(body, default=_json_default, separators=(',', ':'))}
+
+
+def encode_cursor(position):
+    """Encode a pagination position as an opaque URL-safe cursor."""
+    data = json.dumps(position, default=_json_default, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor from encode_cursor, or return None for no cursor.
+
+    Cursors come back from clients, so anything but an object with a non-negative integer
+    `offset` or an object `key` is rejected.
+    """
+    if not cursor:
+        return None
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError) as e:
+        raise QueryError("Invalid cursor") from e
+
+    if not isinstance(position, dict):
+        raise QueryError("Invalid cursor")
+    offset = position.get('offset', 0)
+    if isinstance(offset, bool) or not isinstance(offset, int) or offset < 0:
+        raise QueryError("Invalid cursor")
+    if 'key' in position and not isinstance(position['key'], dict):
+        raise QueryError("Invalid cursor")
+    return position
+
+
+def query_options(event):
+    """
+    Read the common query parameters of a request.
+
+    Returns:
+        dict: fields, filters, sort, descending (None when not given), limit and cursor
+    """
+    single = event.get('queryStringParameters') or {}
+    multi = event.get('multiValueQueryStringParameters') or {}
+
+    try:
+        limit = int(single.get('limit') or DEFAULT_PAGE_SIZE)
+    except ValueError as e:
+        raise QueryError("limit must be a number") from e
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise QueryError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    filters = []
+    for expression in multi.get('filter') or ([single['filter']] if single.get('filter') else []):
+        field, _, rest = expression.partition(':')
+        operator, _, value = rest.partition(':')
+        if not field or operator not in FILTER_OPERATORS:
+            raise QueryError(f"Invalid filter {expression}, expected field:op:value with op in "
+                             f"{', '.join(FILTER_OPERATORS)}")
+        filters.append((field, operator, value))
+
+    order = single.get('order')
+    if order not in (None, 'asc', 'desc'):
+        raise QueryError("order must be asc or desc")
+
+    fields = [field for field in (single.get('fields') or '').split(',') if field]
+    return {'fields': fields, 'filters': filters, 'sort': single.get('sort'),
+            'descending': None if order is None else order == 'desc', 'limit': limit,
+            'cursor': decode_cursor(single.get('cursor'))}
+
+
+def _comparable(value):
+    """Compare numbers as numbers, whether they came from JSON, DynamoDB or CSV text."""
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def matches(row, filters):
+    """Return True if a row passes every filter; rows without a filtered field never match."""
+    for field, operator, value in filters:
+        if field not in row:
+            return False
+        left, right = _comparable(row[field]), _comparable(value)
+        if operator != 'contains' and type(left) is not type(right):
+            left, right = str(row[field]), value
+        if not FILTER_OPERATORS[operator](left, right):
+            return False
+    return True
+
+
+def sort_rows(rows, field, descending):
+    """Sort rows by a field, with rows that lack it last."""
+    present = [row for row in rows if row.get(field) not in (None, '')]
+    missing = [row for row in rows if row.get(field) in (None, '')]
+    present.sort(key=lambda row: (isinstance(_comparable(row[field]), str), _comparable(row[field])),
+                 reverse=descending)
+    return present + missing
+
+
+def project(row, fields):
+    """Keep only the requested fields of a row, or every public field when none are requested."""
+    if fields:
+        return {field: row[field] for field in fields if field in row}
+    return {field: value for field, value in row.items() if not str(field).startswith('_')}
+
+
+def typed_row(row):
+    """Turn the numeric text of a CSV row into numbers, so they sort and serialize as numbers."""
+    typed = {}
+    for field, value in row.items():
+        if isinstance(value, str) and value.lstrip('-').isdigit():
+            value = int(value)
+        elif isinstance(value, str):
+            value = _comparable(value)
+        typed[field] = value
+    return typed
+
+
+def paginate(rows, options):
+    """
+    Apply filters, sort, projection and an offset cursor to an in-memory list of rows.
+
+    Returns:
+        dict: {'items', 'count', 'next_cursor'}
+    """
+    rows = [row for row in rows if matches(row, options['filters'])]
+    if options['sort']:
+        descending = options['descending']
+        if descending is None:
+            descending = not is_ascending(options['sort'])
+        rows = sort_rows(rows, options['sort'], descending)
+
+    offset = (options['cursor'] or {}).get('offset', 0)
+    page = rows[offset:offset + options['limit']]
+    next_offset = offset + len(page)
+    return {'items': [project(row, options['fields']) for row in page], 'count': len(rows),
+            'next_cursor': encode_cursor({'offset': next_offset}) if next_offset < len(rows) else None}
+
+
+def load_ranking_rows(s3_client, bucket_name, ticker):
+    """
+    Load every trader row of a ticker from the ranking bucket.
+
+    Objects are listed with their ETags and only downloaded when the warm container has not
+    parsed that version yet. Cached objects of the ticker that are no longer listed are dropped,
+    and the least recently used ones are evicted to keep the cache within its row budget.
+    """
+    rows = []
+    listed = set()
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=f"{ticker}/"):
+        for item in page.get('Contents', []):
+            key = item['Key']
+            if not key.lower().endswith(('.csv', '.json')):
+                continue
+            listed.add(key)
+            cached = _ranking_cache.get(key)
+            if not cached or cached[0] != item['ETag']:
+                obj = s3_client.get_object(Bucket=bucket_name, Key=key)
+                cached = (obj['ETag'], [typed_row(row) for row in parse_rows(obj['Body'].read(), key)])
+                _ranking_cache[key] = cached
+            _ranking_cache.move_to_end(key)
+            rows.extend(cached[1])
+
+    for key in [key for key in _ranking_cache if key.startswith(f"{ticker}/") and key not in listed]:
+        del _ranking_cache[key]
+    _evict_ranking_cache(int(os.environ.get('RANKING_CACHE_MAX_ROWS', DEFAULT_RANKING_CACHE_MAX_ROWS)))
+    return rows
+
+
+def _evict_ranking_cache(max_rows):
+    """Drop the least recently used ranking objects until the cache holds at most max_rows rows."""
+    total = sum(len(cached[1]) for cached in _ranking_cache.values())
+    while _ranking_cache and total > max_rows:
+        _, (_, evicted) = _ranking_cache.popitem(last=False)
+        total -= len(evicted)
+
+
+def query_rankings(event, options, s3_client):
+    """
+    Query the traders of a ticker.
+
+    Requests sorted by a single metric without filters are served from the pre-sorted
+    leaderboard while the page lies inside its top N; anything else reads the ranking objects.
+    """
+    bucket_name = os.environ['RANKING_BUCKET']
+    ticker = event['pathParameters']['ticker']
+
+    offset = (options['cursor'] or {}).get('offset', 0)
+    if options['sort'] and not options['filters'] and options['descending'] in (None, not is_ascending(options['sort'])):
+        leaderboard, _ = get_json(s3_client, bucket_name, leaderboard_key(ticker, options['sort']))
+        if leaderboard and offset + options['limit'] <= len(leaderboard['rows']):
+            result = paginate(leaderboard['rows'], options)
+            # The leaderboard only holds the top N, so it cannot tell how many traders there are in total
+            result.pop('count')
+            return {'ticker': ticker, 'source': 'leaderboard', **result}
+
+    rows = load_ranking_rows(s3_client, bucket_name, ticker)
+    return {'ticker': ticker, 'source': 'ranking', **paginate(rows, options)}
+
+
+def query_leaderboard(event, options, s3_client):
+    """Return the top N traders of a ticker by the metric given as `sort` or `metric`."""
+    single = event.get('queryStringParameters') or {}
+    metric = single.get('metric') or options['sort']
+    if not metric:
+        raise QueryError("metric is required")
+
+    ticker = event['pathParameters']['ticker']
+    leaderboard, _ = get_json(s3_client, os.environ['RANKING_BUCKET'], leaderboard_key(ticker, metric))
+    if not leaderboard:
+        return None
+    return {'ticker': ticker, 'metric': metric, 'updated_at': leaderboard.get('updated_at'),
+            **paginate(leaderboard['rows'], options)}
+
+
+def query_live_trades(event, options, s3_client):
+    """Return the records of a live trade stream written after the `since` sequence."""
+    single = event.get('queryStringParameters') or {}
+    try:
+        since = int(single.get('since') or 0)
+    except ValueError as e:
+        raise QueryError("since must be a sequence number") from e
+
+    stream = event['pathParameters']['stream']
+    result = read_since(os.environ['LIVE_TRADES_BUCKET'], stream, last_sequence=since, s3_client=s3_client)
+    return {'stream': stream, 'sequence': result['sequence'], 'reset': result['reset'],
+            **paginate(result['records'], options)}
+
+
+def catalog_start_key(key, user_id, ticker):
+    """
+    Check that the key of a run catalog cursor belongs to the caller's own index partition.
+
+    Returns:
+        dict: The key, to pass as ExclusiveStartKey, or None for the first page
+    """
+    if key is None:
+        return None
+    _, attribute = INDEX_BY_FILTERS[(True, bool(ticker))]
+    partition = f"{user_id}#{ticker}" if ticker else user_id
+    if set(key) != {'run_id', attribute} or key[attribute] != partition or not isinstance(key['run_id'], str):
+        raise QueryError("Invalid cursor")
+    return key
+
+
+def query_run_catalog(event, options, s3_client):
+    """
+    Return the caller's newest runs, optionally for one ticker and/or submission date.
+
+    Filters are applied to the items DynamoDB returns, so the catalog is read page by page
+    until `limit` runs pass them. A request reads at most MAX_CATALOG_PAGES pages, so a
+    page can still hold fewer runs than `limit` while `next_cursor` is set.
+    """
+    table = catalog_table()
+    if not table:
+        raise QueryError("The run catalog is not configured")
+
+    single = event.get('queryStringParameters') or {}
+    user_id, ticker = user_from_event(event), single.get('ticker')
+    _, attribute = INDEX_BY_FILTERS[(True, bool(ticker))]
+    start_key = catalog_start_key((options['cursor'] or {}).get('key'), user_id, ticker)
+
+    runs, next_key = [], None
+    for _ in range(MAX_CATALOG_PAGES):
+        try:
+            # Always scoped to the caller; the date only narrows their runs
+            items, last_key = query_runs(table, user_id=user_id, ticker=ticker, submitted_date=single.get('date'),
+                                         limit=options['limit'], start_key=start_key)
+        except ValueError as e:
+            raise QueryError(str(e)) from e
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ValidationException':
+                raise
+            raise QueryError("Invalid cursor") from e
+
+        for index, item in enumerate(items):
+            if not matches(item, options['filters']):
+                continue
+            runs.append(item)
+            if len(runs) == options['limit']:
+                # Resume after this run, unless it was the very last one
+                if index < len(items) - 1 or last_key:
+                    last_key = {'run_id': item['run_id'], attribute: item[attribute]}
+                break
+        next_key = last_key
+        if len(runs) == options['limit'] or not last_key:
+            break
+        start_key = last_key
+
+    return {'items': [project(item, options['fields']) for item in runs],
+            'next_cursor': encode_cursor({'key': next_key}) if next_key else None}
+
+
+def query_params(event, options, s3_client):
+    """Return the parameters of one run."""
+    run_id = event['pathParameters']['run_id']
+    params, _ = get_json(s3_client, os.environ['BACKTEST_PARAMS_BUCKET'], f"{run_id}.json")
+    return project(params, options['fields']) if params is not None else None
+
+
+# Handler of every query route, by API Gateway resource path
+ROUTES = {
+    '/query/rankings/{ticker}': query_rankings,
+    '/query/leaderboards/{ticker}': query_leaderboard,
+    '/query/live-trades/{stream}': query_live_trades,
+    '/query/runs': query_run_catalog,
+    '/query/params/{run_id}': query_params,
+}
+
+
+def handler(event, context):
+    """
+    Read-only query API over the rankings, live trades, run catalog and backtest params.
+
+    Every list route accepts `fields`, `filter=field:op:value` (repeatable), `sort`, `order`,
+    `limit` and an opaque `cursor` from the previous page's `next_cursor`.
+    """
+    route = ROUTES.get(event.get('resource'))
+    if not route:
+        return response(404, {'message': f"Unknown route {event.get('resource')}"}, event)
+
+    try:
+        body = route(event, query_options(event), boto3.client('s3'))
+    except QueryError as e:
+        return response(400, {'message': str(e)}, event)
+
+    if body is None:
+        return response(404, {'message': 'Not found'}, event)
+    return response(200, body, event)
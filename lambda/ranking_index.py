@@ -0,0 +1,295 @@
+import csv
+import datetime
+import hashlib
+import io
+import json
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+import boto3
+
+# Object layout the index maintains inside the final trader ranking bucket:
+#   leaderboards/manifest.json               - small, mutable; ETag, size and row count of every leaderboard
+#   leaderboards/{ticker}/{metric}.json      - top N traders of a ticker, pre-sorted by one metric
+#   leaderboards/sources/{ticker}/{hash}.json - top N traders of one ranking object by each metric, to rebuild from
+LEADERBOARDS_PREFIX = "leaderboards/"
+MANIFEST_KEY = f"{LEADERBOARDS_PREFIX}manifest.json"
+SOURCES_PREFIX = f"{LEADERBOARDS_PREFIX}sources/"
+
+LEADERBOARD_CACHE_CONTROL = "public, max-age=60"
+MANIFEST_CACHE_CONTROL = "no-cache"
+
+DEFAULT_TOP_N = 50
+MAX_MANIFEST_ATTEMPTS = 10
+
+# Columns that identify a trader rather than measure it; kept on every leaderboard row
+IDENTITY_COLUMNS = ('trader_id', 'traderid', 'trader', 'id', 'scenario', 'name')
+
+# Metrics where a lower value ranks higher
+ASCENDING_METRIC_WORDS = ('drawdown', 'loss', 'risk')
+
+# Significant digits kept for metric values, which is plenty to render and sort a leaderboard
+METRIC_DIGITS = 6
+
+
+def leaderboard_key(ticker: str, metric: str) -> str:
+    """Return the S3 key of the leaderboard of a ticker by one metric."""
+    return f"{LEADERBOARDS_PREFIX}{ticker}/{metric}.json"
+
+
+def source_index_key(ticker: str, source_key: str) -> str:
+    """Return the S3 key of the per-source index of a ranking object."""
+    return f"{SOURCES_PREFIX}{ticker}/{hashlib.sha256(source_key.encode('utf-8')).hexdigest()[:32]}.json"
+
+
+def ticker_for_key(key: str) -> str:
+    """Name the ticker of a ranking object after its first path segment, or its file name at the top level."""
+    first, _, rest = key.partition('/')
+    return first if rest else first.rsplit('.', 1)[0]
+
+
+def _number(value) -> Optional[float]:
+    if isinstance(value, bool) or value is None or value == '':
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _compact(number: float):
+    """Round a metric value to METRIC_DIGITS significant digits, as an int when it is whole."""
+    rounded = float(f"{number:.{METRIC_DIGITS}g}")
+    return int(rounded) if rounded.is_integer() else rounded
+
+
+def parse_rows(body: bytes, key: str) -> List[Dict]:
+    """
+    Parse the trader rows of a ranking object.
+
+    CSV objects have one trader per row. JSON objects are either a list of traders or an
+    object with the list under "traders" or "rows".
+    """
+    text = body.decode('utf-8-sig')
+    if key.lower().endswith('.json'):
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data.get('traders') or data.get('rows') or []
+        return [row for row in data if isinstance(row, dict)]
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+def metric_columns(rows: List[Dict]) -> List[str]:
+    """Return the columns whose every non-empty value is numeric, excluding identity columns."""
+    columns = {}
+    for row in rows:
+        for column, value in row.items():
+            if column is None or column.lower() in IDENTITY_COLUMNS or value in (None, ''):
+                continue
+            columns[column] = columns.get(column, True) and _number(value) is not None
+    return sorted(column for column, numeric in columns.items() if numeric)
+
+
+def is_ascending(metric: str) -> bool:
+    """Return True if a lower value of the metric ranks higher."""
+    return any(word in metric.lower() for word in ASCENDING_METRIC_WORDS)
+
+
+def compact_rows(rows: List[Dict], metrics: List[str], source_key: str) -> List[Dict]:
+    """
+    Reduce trader rows to their identity columns and rounded metric values.
+
+    Every row records the ranking object it came from, so a rewritten object replaces
+    its own rows on the leaderboards instead of adding duplicates.
+    """
+    compacted = []
+    for index, row in enumerate(rows):
+        entry = {column: value for column, value in row.items()
+                 if column and column.lower() in IDENTITY_COLUMNS and value not in (None, '')}
+        for metric in metrics:
+            number = _number(row.get(metric))
+            if number is not None:
+                entry[metric] = _compact(number)
+        entry['_source'] = source_key
+        entry['_row'] = index
+        compacted.append(entry)
+    return compacted
+
+
+def top_rows(rows: List[Dict], metric: str, top_n: int) -> List[Dict]:
+    """Return the top N rows by a metric, best first; rows without the metric are left out."""
+    candidates = [row for row in rows if metric in row]
+    candidates.sort(key=lambda row: row[metric], reverse=not is_ascending(metric))
+    return candidates[:top_n]
+
+
+def merge_top_n(existing: List[Dict], rows: List[Dict], metric: str, source_key: str,
+                top_n: int) -> Optional[List[Dict]]:
+    """
+    Merge the rows of one ranking object into a leaderboard and keep its top N.
+
+    Only the current top N and the new rows are ever sorted, so the cost of an update does
+    not grow with the size of the full ranking dataset. That is only exact while the merge
+    keeps the board full with rows at least as good as its previous last row; otherwise a
+    rewritten or deleted object gave up places that traders below the board may deserve.
+
+    Returns:
+        list: The new top N, or None if the leaderboard must be rebuilt from every source
+    """
+    merged = top_rows([row for row in existing if row.get('_source') != source_key] + rows, metric, top_n)
+    if len(existing) < top_n or not any(row.get('_source') == source_key for row in existing):
+        # Every known row was already on the board, or the object had no place to give up
+        return merged
+    last = existing[-1][metric]
+    if len(merged) == top_n and (merged[-1][metric] <= last if is_ascending(metric) else merged[-1][metric] >= last):
+        return merged
+    return None
+
+
+def _error_code(error) -> str:
+    return error.response.get('Error', {}).get('Code', '')
+
+
+def get_json(s3_client, bucket_name: str, key: str) -> Tuple[Optional[Dict], Optional[str]]:
+    """Fetch a JSON object and its ETag, or (None, None) if it does not exist."""
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=key)
+    except s3_client.exceptions.NoSuchKey:
+        return None, None
+    return json.loads(response['Body'].read()), response['ETag']
+
+
+def put_leaderboard(s3_client, bucket_name: str, ticker: str, metric: str, rows: List[Dict]) -> Dict:
+    """
+    Write a leaderboard as compact JSON.
+
+    Returns:
+        dict: The manifest entry of the leaderboard
+    """
+    key = leaderboard_key(ticker, metric)
+    updated_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    body = json.dumps({'ticker': ticker, 'metric': metric, 'ascending': is_ascending(metric),
+                       'updated_at': updated_at, 'rows': rows}, separators=(',', ':'))
+    response = s3_client.put_object(Bucket=bucket_name, Key=key, Body=body, ContentType='application/json',
+                                    CacheControl=LEADERBOARD_CACHE_CONTROL)
+    return {'key': key, 'etag': response['ETag'], 'size': len(body), 'rows': len(rows), 'updated_at': updated_at}
+
+
+def update_manifest(s3_client, bucket_name: str, ticker: str, entries: Dict[str, Dict]) -> None:
+    """
+    Record the leaderboards of a ticker in the manifest with a conditional write.
+
+    The dashboard polls the manifest with If-None-Match and only downloads the leaderboards
+    whose ETags changed.
+    """
+    for _ in range(MAX_MANIFEST_ATTEMPTS):
+        manifest, etag = get_json(s3_client, bucket_name, MANIFEST_KEY)
+        manifest = manifest or {'tickers': {}}
+        manifest['tickers'].setdefault(ticker, {}).update(entries)
+        manifest['updated_at'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+        kwargs = {'Bucket': bucket_name, 'Key': MANIFEST_KEY, 'Body': json.dumps(manifest, separators=(',', ':')),
+                  'ContentType': 'application/json', 'CacheControl': MANIFEST_CACHE_CONTROL}
+        if etag:
+            kwargs['IfMatch'] = etag
+        else:
+            kwargs['IfNoneMatch'] = '*'
+
+        try:
+            s3_client.put_object(**kwargs)
+            return
+        except s3_client.exceptions.ClientError as e:
+            if _error_code(e) not in ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409'):
+                raise e
+
+    raise RuntimeError(f"Could not update the leaderboard manifest for {ticker} after {MAX_MANIFEST_ATTEMPTS} attempts")
+
+
+def source_rows(s3_client, bucket_name: str, ticker: str, metric: str) -> List[Dict]:
+    """Collect the rows of every per-source index of a ticker that rank by a metric."""
+    rows = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=f"{SOURCES_PREFIX}{ticker}/"):
+        for summary in page.get('Contents', []):
+            index, _ = get_json(s3_client, bucket_name, summary['Key'])
+            rows += (index or {}).get('metrics', {}).get(metric, [])
+    return rows
+
+
+def index_ranking_object(bucket_name: str, key: str, top_n: int = DEFAULT_TOP_N, s3_client=None,
+                         deleted: bool = False) -> Dict[str, Dict]:
+    """
+    Fold one ranking object into the leaderboards of its ticker.
+
+    The object's own top N by each metric is kept in a per-source index. When merging into a
+    leaderboard cannot be exact, because a rewritten or deleted object gave up places, the
+    leaderboard is rebuilt from the per-source indexes of its ticker.
+
+    Args:
+        bucket_name: Name of the final trader ranking bucket
+        key: Key of the ranking object that was written or deleted
+        top_n: Number of traders to keep per leaderboard
+        s3_client: Optional boto3 S3 client
+        deleted: True if the object was deleted, which removes its traders
+
+    Returns:
+        dict: Manifest entries of the leaderboards that were written, by metric
+    """
+    s3_client = s3_client or boto3.client('s3')
+    ticker = ticker_for_key(key)
+    index_key = source_index_key(ticker, key)
+
+    tops = {}
+    if deleted:
+        s3_client.delete_object(Bucket=bucket_name, Key=index_key)
+    else:
+        response = s3_client.get_object(Bucket=bucket_name, Key=key)
+        rows = parse_rows(response['Body'].read(), key)
+        metrics = metric_columns(rows)
+        compacted = compact_rows(rows, metrics, key)
+        tops = {metric: top_rows(compacted, metric, top_n) for metric in metrics}
+        s3_client.put_object(Bucket=bucket_name, Key=index_key, ContentType='application/json',
+                             Body=json.dumps({'source': key, 'ticker': ticker, 'metrics': tops},
+                                             separators=(',', ':')))
+
+    # Boards the object may have rows on, besides the ones of its own metrics
+    manifest, _ = get_json(s3_client, bucket_name, MANIFEST_KEY)
+    metrics = sorted(set(tops) | set(((manifest or {}).get('tickers') or {}).get(ticker, {})))
+
+    entries, rebuilt = {}, 0
+    for metric in metrics:
+        leaderboard, _ = get_json(s3_client, bucket_name, leaderboard_key(ticker, metric))
+        existing = leaderboard['rows'] if leaderboard else []
+        top = merge_top_n(existing, tops.get(metric, []), metric, key, top_n)
+        if top is None:
+            top = top_rows(source_rows(s3_client, bucket_name, ticker, metric), metric, top_n)
+            rebuilt += 1
+        if top != existing:
+            entries[metric] = put_leaderboard(s3_client, bucket_name, ticker, metric, top)
+
+    if entries:
+        update_manifest(s3_client, bucket_name, ticker, entries)
+    print(f"Indexed s3://{bucket_name}/{key} ({'deleted' if deleted else 'written'}): "
+          f"updated {len(entries)} of {len(metrics)} {ticker} leaderboards, rebuilt {rebuilt}")
+    return entries
+
+
+def handler(event, context):
+    """
+    Handle an EventBridge "Object Created" or "Object Deleted" event from the final trader ranking bucket.
+
+    Runs with a reserved concurrency of 1, so leaderboard updates never race each other;
+    the conditional manifest write still protects against any other writer.
+    """
+    detail = event.get('detail', {})
+    bucket_name = detail.get('bucket', {}).get('name') or os.environ['RANKING_BUCKET']
+    key = detail.get('object', {}).get('key', '')
+
+    if not key or key.startswith(LEADERBOARDS_PREFIX):
+        return {'indexed': False}
+
+    top_n = int(os.environ.get('LEADERBOARD_TOP_N', DEFAULT_TOP_N))
+    entries = index_ranking_object(bucket_name, key, top_n, deleted=event.get('detail-type') == 'Object Deleted')
+    return {'indexed': True, 'ticker': ticker_for_key(key), 'metrics': sorted(entries)}
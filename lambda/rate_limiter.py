@@ -0,0 +1,182 @@
+import datetime
+import math
+import os
+import threading
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+
+from metrics import ticker_class
+from stage_fusion import MINUTE_BARS_PER_DAY
+
+# Polygon's free plan allows 5 calls per minute; paid plans set POLYGON_CALLS_PER_MINUTE higher
+DEFAULT_POLYGON_CALLS_PER_MINUTE = 5
+
+# Bars Polygon returns per aggregates call at most
+POLYGON_BARS_PER_CALL = 50000
+
+MAX_UPDATE_ATTEMPTS = 10
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every process that calls a rate-limited API, stored as one DynamoDB item.
+
+    The item holds the tokens left at `updated_at`; readers refill it for the time since then and
+    write it back conditionally on a version counter, so concurrent jobs never spend the same token.
+    The same item also holds `next_start`, a schedule that spaces out the start of whole jobs so
+    their calls rarely have to wait for tokens at all.
+    """
+
+    def __init__(self, table_name: str, key: str, rate_per_second: float, capacity: float, dynamodb_client=None):
+        self.table_name = table_name
+        self.key = key
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self.dynamodb_client = dynamodb_client or boto3.client('dynamodb')
+
+    def _read(self):
+        item = self.dynamodb_client.get_item(TableName=self.table_name, Key={'limiter': {'S': self.key}},
+                                             ConsistentRead=True).get('Item', {})
+        return {name: float(value['N']) for name, value in item.items() if 'N' in value}
+
+    def _write(self, previous, values):
+        names = {f"#{name}": name for name in values}
+        expression_values = {f":{name}": {'N': repr(value)} for name, value in values.items()}
+        if 'version' in previous:
+            condition = '#version = :previous_version'
+            expression_values[':previous_version'] = {'N': repr(previous['version'])}
+        else:
+            condition = 'attribute_not_exists(#version)'
+        names['#version'] = 'version'
+        expression_values[':one'] = {'N': '1'}
+
+        try:
+            self.dynamodb_client.update_item(
+                TableName=self.table_name, Key={'limiter': {'S': self.key}},
+                UpdateExpression='SET ' + ', '.join(f"#{name} = :{name}" for name in values) +
+                                 ', #version = if_not_exists(#version, :one) + :one',
+                ConditionExpression=condition, ExpressionAttributeNames=names,
+                ExpressionAttributeValues=expression_values)
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def try_acquire(self, tokens: float = 1, now: float = None) -> float:
+        """
+        Take tokens if the bucket has them.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the seconds until they will be available
+        """
+        for _ in range(MAX_UPDATE_ATTEMPTS):
+            current = now or time.time()
+            state = self._read()
+            available = min(self.capacity, state.get('tokens', self.capacity) +
+                            (current - state.get('updated_at', current)) * self.rate_per_second)
+            if available < tokens:
+                return (tokens - available) / self.rate_per_second
+            if self._write(state, {'tokens': available - tokens, 'updated_at': current}):
+                return 0.0
+        raise RuntimeError(f"Could not update rate limiter {self.key} after {MAX_UPDATE_ATTEMPTS} attempts")
+
+    def acquire(self, tokens: float = 1, max_wait_seconds: float = 300) -> None:
+        """Take tokens, sleeping until the bucket has them."""
+        deadline = time.time() + max_wait_seconds
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            if time.time() + wait > deadline:
+                raise TimeoutError(f"Rate limiter {self.key} had no {tokens} tokens within {max_wait_seconds} s")
+            time.sleep(wait)
+
+    def schedule(self, tokens: float, now: float = None) -> float:
+        """
+        Reserve a start time for a job that will spend `tokens` calls.
+
+        Jobs are spaced so the calls of each one fit into the refill since the previous one
+        started, after an initial burst of the bucket's capacity.
+
+        Returns:
+            float: Epoch seconds at which the job should start calling the API
+        """
+        for _ in range(MAX_UPDATE_ATTEMPTS):
+            current = now or time.time()
+            state = self._read()
+            # The schedule may run up to one bucket capacity ahead of now before jobs have to wait
+            start = max(current, state.get('next_start', current) - self.capacity / self.rate_per_second)
+            next_start = max(current, state.get('next_start', current)) + tokens / self.rate_per_second
+            if self._write(state, {'next_start': next_start}):
+                return start
+        raise RuntimeError(f"Could not update rate limiter {self.key} after {MAX_UPDATE_ATTEMPTS} attempts")
+
+
+class LocalTokenBucket:
+    """In-process stand-in for TokenBucket, for local runs without DynamoDB."""
+
+    def __init__(self, key: str, rate_per_second: float, capacity: float):
+        self.key = key
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.time()
+        self.next_start = self.updated_at
+        self.lock = threading.Lock()
+
+    def try_acquire(self, tokens: float = 1, now: float = None) -> float:
+        with self.lock:
+            current = now or time.time()
+            self.tokens = min(self.capacity, self.tokens + (current - self.updated_at) * self.rate_per_second)
+            self.updated_at = current
+            if self.tokens < tokens:
+                return (tokens - self.tokens) / self.rate_per_second
+            self.tokens -= tokens
+            return 0.0
+
+    acquire = TokenBucket.acquire
+
+    def schedule(self, tokens: float, now: float = None) -> float:
+        with self.lock:
+            current = now or time.time()
+            start = max(current, self.next_start - self.capacity / self.rate_per_second)
+            self.next_start = max(current, self.next_start) + tokens / self.rate_per_second
+            return start
+
+
+def polygon_calls_per_minute() -> float:
+    return float(os.environ.get('POLYGON_CALLS_PER_MINUTE', DEFAULT_POLYGON_CALLS_PER_MINUTE))
+
+
+def polygon_bucket():
+    """
+    Return the shared Polygon token bucket named by RATE_LIMIT_TABLE, a local stand-in when
+    RATE_LIMIT_TABLE is "local", or None when rate limiting is off.
+    """
+    table_name = os.environ.get('RATE_LIMIT_TABLE')
+    if not table_name:
+        return None
+
+    rate = polygon_calls_per_minute() / 60
+    # Allow a burst of one minute's worth of calls
+    capacity = max(polygon_calls_per_minute(), 1)
+    if table_name == 'local':
+        return LocalTokenBucket('polygon', rate, capacity)
+    return TokenBucket(table_name, os.environ.get('RATE_LIMIT_KEY', 'polygon'), rate, capacity)
+
+
+def estimate_polygon_calls(ticker, from_date, to_date) -> int:
+    """
+    Estimate the Polygon aggregates calls polygon-extract makes for a backtest: the minute bars
+    in pages of POLYGON_BARS_PER_CALL, plus the hour and day bars.
+    """
+    try:
+        days = max((datetime.date.fromisoformat(str(to_date)) - datetime.date.fromisoformat(str(from_date))).days,
+                   0) + 1
+    except ValueError:
+        return 3
+    minute_bars = days * MINUTE_BARS_PER_DAY[ticker_class(ticker)]
+    return math.ceil(minute_bars / POLYGON_BARS_PER_CALL) + math.ceil(minute_bars / 60 / POLYGON_BARS_PER_CALL) + 1
@@ -0,0 +1,206 @@
+import datetime
+import os
+from decimal import Decimal
+
+import boto3
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+from run_ids import run_id_time
+
+ANONYMOUS_USER = 'anonymous'
+
+# Index to query for each combination of filters, all sorted by run_id (submission time)
+INDEX_BY_FILTERS = {
+    (True, True): ('user-ticker-index', 'user_ticker'),
+    (True, False): ('user-index', 'user_id'),
+    (False, True): ('ticker-index', 'ticker'),
+}
+
+
+def catalog_table(table_name=None):
+    """Return the run catalog table named by RUN_CATALOG_TABLE, or None if the catalog is not configured."""
+    table_name = table_name or os.environ.get('RUN_CATALOG_TABLE')
+    return boto3.resource('dynamodb').Table(table_name) if table_name else None
+
+
+def user_from_event(event):
+    """
+    Find the Cognito user of an API request.
+
+    REST API (Cognito authorizer) requests carry the claims under requestContext.authorizer.claims,
+    HTTP API (JWT authorizer) requests under requestContext.authorizer.jwt.claims.
+
+    Returns:
+        str: The user's sub, or "anonymous" if the request is not authenticated
+    """
+    authorizer = (event.get('requestContext') or {}).get('authorizer') or {}
+    claims = authorizer.get('claims') or (authorizer.get('jwt') or {}).get('claims') or {}
+    return claims.get('sub') or claims.get('cognito:username') or ANONYMOUS_USER
+
+
+def _dynamodb_value(value):
+    """Convert floats, which the DynamoDB resource API rejects, to Decimal."""
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {key: _dynamodb_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_dynamodb_value(item) for item in value]
+    return value
+
+
+def catalog_item(run_id, user_id, ticker, params, stages, outputs, tier=None, mode=None):
+    """
+    Build the catalog item of a newly submitted run.
+
+    Args:
+        run_id: Run ID (group tag) of the run
+        user_id: User who submitted the run
+        ticker: Ticker of the run
+        params: Backtest parameters of the run
+        stages: Dictionary of {'jobId': ...} by stage name
+        outputs: Dictionary of S3 URIs by output name
+
+    Returns:
+        dict: The DynamoDB item
+    """
+    submitted_at = run_id_time(run_id) or datetime.datetime.now(datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    item = {
+        'run_id': run_id,
+        'ticker': ticker,
+        'user_id': user_id,
+        'user_ticker': f"{user_id}#{ticker}",
+        'submitted_at': submitted_at.isoformat(),
+        'submitted_date': submitted_at.strftime('%Y-%m-%d'),
+        'status': 'SUBMITTED',
+        'params': params,
+        'stages': {name: {**stage, 'status': 'SUBMITTED', 'updated_at': now} for name, stage in stages.items()},
+        'outputs': outputs,
+    }
+    if tier:
+        item['tier'] = tier
+    if mode:
+        item['mode'] = mode
+    return _dynamodb_value(item)
+
+
+def put_run(table, item):
+    """Write the catalog item of a new run."""
+    table.put_item(Item=item)
+
+
+def update_stage_status(table, run_id, stage, status, job_id=None, status_reason=None):
+    """
+    Record the status of one stage of a run, and the run status it implies.
+
+    A failed stage fails the run. A run whose recorded stages have all succeeded is SUCCEEDED,
+    with a finished_at time; a downstream stage that only starts later makes it RUNNING again.
+    Only runs that are already in the catalog are updated, so jobs submitted outside the launcher
+    do not create partial items.
+
+    Returns:
+        bool: True if the run was in the catalog
+    """
+    now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    stage_value = {'status': status, 'updated_at': now}
+    if job_id:
+        stage_value['jobId'] = job_id
+    if status_reason:
+        stage_value['status_reason'] = status_reason
+
+    update_expression = 'SET stages.#stage = :stage, updated_at = :now, last_stage = :stage_name'
+    names = {'#stage': stage}
+    values = {':stage': stage_value, ':now': now, ':stage_name': stage}
+
+    if status == 'FAILED':
+        attempts = [{
+            'UpdateExpression': update_expression + ', #status = :failed, failed_at = :now',
+            'ConditionExpression': 'attribute_exists(run_id)',
+            'ExpressionAttributeNames': {**names, '#status': 'status'},
+            'ExpressionAttributeValues': {**values, ':failed': 'FAILED'}
+        }]
+    else:
+        # Any started or finished stage makes the run RUNNING, unless another stage already failed it
+        attempts = [{
+            'UpdateExpression': update_expression + ', #status = :running REMOVE finished_at',
+            'ReturnValues': 'ALL_NEW',
+            'ConditionExpression': 'attribute_exists(run_id) AND #status <> :failed',
+            'ExpressionAttributeNames': {**names, '#status': 'status'},
+            'ExpressionAttributeValues': {**values, ':running': 'RUNNING', ':failed': 'FAILED'}
+        }, {
+            'UpdateExpression': update_expression,
+            'ConditionExpression': 'attribute_exists(run_id)',
+            'ExpressionAttributeNames': names,
+            'ExpressionAttributeValues': values
+        }]
+
+    for attempt in attempts:
+        try:
+            item = table.update_item(Key={'run_id': run_id}, **attempt).get('Attributes')
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            continue
+        if status == 'SUCCEEDED' and item and item.get('status') == 'RUNNING' and all(
+                value.get('status') == 'SUCCEEDED' for value in item.get('stages', {}).values()):
+            _finish_run(table, run_id, now)
+        return True
+    return False
+
+
+def _finish_run(table, run_id, now):
+    """Mark a run SUCCEEDED, unless another stage changed it since this update."""
+    try:
+        table.update_item(Key={'run_id': run_id},
+                          UpdateExpression='SET #status = :succeeded, finished_at = :now',
+                          ConditionExpression='#status = :running AND updated_at = :now',
+                          ExpressionAttributeNames={'#status': 'status'},
+                          ExpressionAttributeValues={':succeeded': 'SUCCEEDED', ':running': 'RUNNING', ':now': now})
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+
+def query_runs(table, user_id=None, ticker=None, submitted_date=None, limit=50, start_key=None):
+    """
+    Query the newest runs of a user and/or ticker, or of a submission date, with one indexed query.
+
+    A submission date narrows a user or ticker query to the run IDs that start with that date,
+    so it never widens the query beyond the given user. Only a date on its own reads the
+    submitted-date-index.
+
+    Returns:
+        tuple: (items, last evaluated key to pass as start_key for the next page, or None)
+    """
+    if submitted_date:
+        try:
+            day = datetime.date.fromisoformat(str(submitted_date))
+        except ValueError as e:
+            raise ValueError("The submission date must be YYYY-MM-DD") from e
+
+    if user_id or ticker:
+        index_name, attribute = INDEX_BY_FILTERS[(bool(user_id), bool(ticker))]
+        value = f"{user_id}#{ticker}" if user_id and ticker else user_id or ticker
+        key_condition = Key(attribute).eq(value)
+        if submitted_date:
+            key_condition = key_condition & Key('run_id').begins_with(day.strftime('%Y%m%d'))
+    elif submitted_date:
+        index_name, key_condition = 'submitted-date-index', Key('submitted_date').eq(day.isoformat())
+    else:
+        raise ValueError("Filter runs by user, ticker or submission date")
+
+    kwargs = {'IndexName': index_name, 'KeyConditionExpression': key_condition, 'ScanIndexForward': False,
+              'Limit': limit}
+    if start_key:
+        kwargs['ExclusiveStartKey'] = start_key
+    response = table.query(**kwargs)
+    return response.get('Items', []), response.get('LastEvaluatedKey')
+
+
+def job_stage(job):
+    """Name a Batch job's stage after its TaskType tag, falling back to its job definition name."""
+    return (job.get('tags', {}).get('TaskType')
+            or job.get('jobDefinition', '').split('/')[-1].split(':')[0]
+            or 'batch-job')
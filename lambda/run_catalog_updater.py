@@ -0,0 +1,31 @@
+from backtest_plan import record_stage_duration
+from run_catalog import catalog_table, job_stage, update_stage_status
+
+
+def handler(event, context):
+    """
+    EventBridge handler that records Batch job state changes in the run catalog, and the run
+    time of every succeeded job in its stage's history.
+
+    Jobs are matched to their run by the SubmissionGroupTag tag the launcher puts on every job.
+    """
+    job = event.get('detail', {})
+
+    # Succeeded jobs also feed the per-stage durations behind dry-run estimates
+    try:
+        record_stage_duration(catalog_table(), job_stage(job), job)
+    except Exception as e:
+        print(f"Error recording the duration of job {job.get('jobId')}: {str(e)}")
+
+    run_id = job.get('tags', {}).get('SubmissionGroupTag')
+    if not run_id:
+        print(f"Job {job.get('jobId')} has no SubmissionGroupTag, skipping")
+        return {'updated': False}
+
+    stage = job_stage(job)
+    updated = update_stage_status(catalog_table(), run_id, stage, job.get('status'), job_id=job.get('jobId'),
+                                  status_reason=job.get('statusReason'))
+    if not updated:
+        print(f"Run {run_id} is not in the catalog, skipping {stage} {job.get('status')}")
+
+    return {'updated': updated, 'runId': run_id, 'stage': stage, 'status': job.get('status')}
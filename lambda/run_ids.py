@@ -0,0 +1,85 @@
+import datetime
+import secrets
+from typing import List, Optional
+
+# Easy-to-remember random words, so run IDs can still be read out and recognised
+EASY_WORDS = ["apple", "banana", "cherry", "dragonfruit", "elderberry", "fig", "grape", "honeydew", "kiwi", "lemon",
+              "mango", "nectarine", "orange", "papaya", "quince", "raspberry", "strawberry", "tangerine", "ugli",
+              "vanilla", "watermelon", "xigua", "yam", "zucchini"]
+
+# Second set of easy words (animal theme)
+EASY_WORDS2 = ["ant", "bear", "cat", "dog", "elephant", "fox", "giraffe", "hippo", "iguana", "jaguar", "koala",
+               "lion", "monkey", "newt", "otter", "panda", "quail", "rabbit", "snake", "tiger", "unicorn",
+               "vulture", "wolf", "xerus", "yak", "zebra"]
+
+# Crockford base32 in lower case: no i, l, o or u, so suffixes are unambiguous when read aloud
+BASE32_ALPHABET = "0123456789abcdefghjkmnpqrstvwxyz"
+RANDOM_SUFFIX_LENGTH = 8
+
+# UTC timestamp with milliseconds, fixed width so IDs sort lexicographically in time order
+TIMESTAMP_FORMAT = "%Y%m%d%H%M%S"
+TIMESTAMP_LENGTH = 17
+
+
+def format_timestamp(moment: datetime.datetime) -> str:
+    """Format a moment as the fixed-width UTC timestamp that starts a run ID, e.g. 20250321143005123."""
+    moment = moment.astimezone(datetime.timezone.utc) if moment.tzinfo else moment
+    return f"{moment.strftime(TIMESTAMP_FORMAT)}{moment.microsecond // 1000:03d}"
+
+
+def new_run_id(now: Optional[datetime.datetime] = None) -> str:
+    """
+    Generate a run ID such as 20250321143005123-mango-zebra-7k2q9xwd.
+
+    IDs start with a millisecond UTC timestamp, so they sort in submission order and "runs since T"
+    is a range scan from the timestamp of T. The two words keep them human-friendly, and the 40 random
+    bits of the suffix make concurrent submissions in the same millisecond collide with negligible
+    probability. IDs only use characters that are valid in Batch job names, tags and S3 keys.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    suffix = "".join(secrets.choice(BASE32_ALPHABET) for _ in range(RANDOM_SUFFIX_LENGTH))
+    return f"{format_timestamp(now)}-{secrets.choice(EASY_WORDS)}-{secrets.choice(EASY_WORDS2)}-{suffix}"
+
+
+def run_id_time(run_id: str) -> Optional[datetime.datetime]:
+    """Return the UTC submission time encoded in a run ID, or None for IDs in another format."""
+    timestamp = run_id[:TIMESTAMP_LENGTH]
+    if len(timestamp) < TIMESTAMP_LENGTH or not timestamp.isdigit():
+        return None
+    try:
+        moment = datetime.datetime.strptime(timestamp[:14], TIMESTAMP_FORMAT)
+    except ValueError:
+        # 17 digits that are not a real time, e.g. month 13
+        return None
+    return moment.replace(microsecond=int(timestamp[14:]) * 1000, tzinfo=datetime.timezone.utc)
+
+
+def list_run_ids_since(bucket_name: str, since: datetime.datetime, s3_client, prefix: str = '') -> List[str]:
+    """
+    List the run IDs in a bucket that were submitted at or after `since`.
+
+    Works for buckets keyed by `{run_id}/...` (output buckets) and `{run_id}.json` (params bucket).
+    S3 lists keys in lexicographic order, so starting after the timestamp of `since` skips every
+    older run instead of listing the whole bucket.
+
+    Args:
+        bucket_name: Name of the S3 bucket
+        since: Earliest submission time to include
+        s3_client: Boto3 S3 client
+        prefix: Optional key prefix the run IDs are under
+
+    Returns:
+        list: Run IDs in submission order
+    """
+    # Every ID submitted at `since` or later sorts after this key, e.g. 20250321143004999~ sorts
+    # after 20250321143004999-... but before 20250321143005000-...
+    start_after = f"{prefix}{format_timestamp(since - datetime.timedelta(milliseconds=1))}~"
+
+    run_ids = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, StartAfter=start_after, Delimiter='/'):
+        names = [common['Prefix'][len(prefix):].rstrip('/') for common in page.get('CommonPrefixes', [])]
+        names += [item['Key'][len(prefix):].rsplit('.', 1)[0] for item in page.get('Contents', [])]
+        run_ids += [name for name in names if run_id_time(name)]
+
+    return sorted(set(run_ids))
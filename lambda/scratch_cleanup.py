@@ -0,0 +1,70 @@
+import os
+import shutil
+import time
+
+DEFAULT_RETENTION_HOURS = 24
+
+
+def modified_since(path: str, cutoff: float) -> bool:
+    """
+    Check whether anything in a directory tree was modified after cutoff.
+
+    Writes to nested files do not touch the run directory's own mtime, so the whole tree is walked, stopping at
+    the first recent entry.
+
+    Returns:
+        bool: True if the directory or any file or directory below it is newer than cutoff
+    """
+    try:
+        if os.stat(path, follow_symlinks=False).st_mtime >= cutoff:
+            return True
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.stat(follow_symlinks=False).st_mtime >= cutoff:
+                    return True
+                if entry.is_dir(follow_symlinks=False) and modified_since(entry.path, cutoff):
+                    return True
+    except FileNotFoundError:
+        # A stage removed the entry while it was being walked, so the run is still active
+        return True
+    return False
+
+
+def expired_runs(runs_dir: str, retention_hours: float, now: float = None):
+    """
+    List the run scratch directories in which nothing has been modified for retention_hours.
+
+    Returns:
+        list: Paths of the expired run directories
+    """
+    if not os.path.isdir(runs_dir):
+        return []
+
+    cutoff = (now or time.time()) - retention_hours * 3600
+    expired = []
+    for entry in os.scandir(runs_dir):
+        if entry.is_dir(follow_symlinks=False) and not modified_since(entry.path, cutoff):
+            expired.append(entry.path)
+    return expired
+
+
+def handler(event, context):
+    """
+    Scheduled handler that deletes expired per-run directories from the shared scratch file system.
+
+    Stages write their durable output to S3, so scratch only needs to outlive a run's job chain.
+    """
+    scratch_root = os.environ.get('SCRATCH_ROOT', '/mnt/scratch')
+    retention_hours = float(os.environ.get('SCRATCH_RETENTION_HOURS', DEFAULT_RETENTION_HOURS))
+    runs_dir = os.path.join(scratch_root, 'runs')
+
+    removed = []
+    for path in expired_runs(runs_dir, retention_hours):
+        try:
+            shutil.rmtree(path)
+            removed.append(os.path.basename(path))
+        except OSError as e:
+            print(f"Error removing {path}: {e}")
+
+    print(f"Removed {len(removed)} expired run directories from {runs_dir}")
+    return {'removed': removed}
@@ -0,0 +1,67 @@
+import datetime
+import os
+
+from metrics import ticker_class
+
+FUSED_JOB_DEFINITION = 'backtest-fused'
+
+# Container names in the fused job definition, in the order they run
+FUSED_CONTAINERS = ('extract', 'enhance', 'metadata')
+
+# Default largest estimated raw input (minute bars) that still runs as a single fused task. The fused enhancer
+# container has 6 GiB against the standalone job's 16 GiB, so only inputs far below the multi-year ranges the
+# standalone job is sized for are fused: about 2.5 months of stock or 5 weeks of crypto minute bars.
+DEFAULT_FUSED_MAX_ESTIMATED_MB = 4
+
+# Rough size of one minute bar across the min/hour/day CSVs polygon-extract writes
+BYTES_PER_MINUTE_BAR = 80
+
+# Minute bars per calendar day: stocks trade ~16h (with extended hours) on 5 of 7 days,
+# forex 24h on 5 of 7 days and crypto around the clock
+MINUTE_BARS_PER_DAY = {'stock': 960 * 5 / 7, 'index': 390 * 5 / 7, 'option': 390 * 5 / 7,
+                       'forex': 1440 * 5 / 7, 'crypto': 1440, 'unknown': 1440}
+
+
+def estimate_input_bytes(ticker, from_date, to_date, today=None):
+    """
+    Estimate the size of the raw market data a backtest will extract.
+
+    The date range is clipped to today, since the API accepts far-future end dates.
+
+    Returns:
+        int: Estimated bytes of raw data, or None if the dates cannot be parsed
+    """
+    try:
+        start = datetime.date.fromisoformat(str(from_date))
+        end = min(datetime.date.fromisoformat(str(to_date)), today or datetime.date.today())
+    except ValueError:
+        return None
+
+    days = max((end - start).days, 0) + 1
+    return int(days * MINUTE_BARS_PER_DAY[ticker_class(ticker)] * BYTES_PER_MINUTE_BAR)
+
+
+def should_fuse(estimated_bytes):
+    """
+    Decide whether a backtest runs as one fused task instead of the three-job chain.
+
+    Small backtests spend most of their time on Fargate provisioning, image pulls and dependsOn
+    resolution, so they are fused below FUSED_MAX_ESTIMATED_MB (0 disables fusion).
+    """
+    max_mb = float(os.environ.get('FUSED_MAX_ESTIMATED_MB', DEFAULT_FUSED_MAX_ESTIMATED_MB))
+    return estimated_bytes is not None and max_mb > 0 and estimated_bytes <= max_mb * 1024 * 1024
+
+
+def fused_overrides(stages):
+    """
+    Build the ecsPropertiesOverride for a fused job from the command and environment of each stage.
+
+    Args:
+        stages: Dictionary of {'command': [...], 'environment': [...]} by container name
+
+    Returns:
+        dict: The ecsPropertiesOverride for submit_job
+    """
+    return {'taskProperties': [{'containers': [
+        {'name': name, 'command': stages[name]['command'], 'environment': stages[name]['environment']}
+        for name in FUSED_CONTAINERS]}]}
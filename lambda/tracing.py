@@ -0,0 +1,49 @@
+import os
+from typing import Dict, List, Optional
+
+TRACE_HEADER_ENV = '_X_AMZN_TRACE_ID'
+
+
+def parse_trace_header(header: Optional[str]) -> Dict[str, str]:
+    """
+    Parse an X-Ray trace header such as "Root=1-5759e988-bd862e3fe1be46a994272793;Parent=53995c3f42cd8ad8;Sampled=1".
+
+    Returns:
+        dict: Header fields by name, empty if there is no header
+    """
+    fields = {}
+    for part in (header or '').split(';'):
+        if '=' in part:
+            key, value = part.split('=', 1)
+            fields[key.strip()] = value.strip()
+    return fields
+
+
+def current_trace_header() -> Optional[str]:
+    """Return the trace header of the current Lambda invocation, if active tracing is enabled."""
+    return os.environ.get(TRACE_HEADER_ENV) or None
+
+
+def trace_environment() -> List[Dict[str, str]]:
+    """
+    Build the container environment entries that carry the current trace into a Batch job.
+
+    Containers that use an X-Ray SDK pick `_X_AMZN_TRACE_ID` up automatically, and the Batch
+    state-change handler uses it to attach the job's queue and run segments to the same trace.
+    """
+    header = current_trace_header()
+    return [{'name': TRACE_HEADER_ENV, 'value': header}] if header else []
+
+
+def trace_header_from_job(job: Dict) -> Optional[str]:
+    """Find the trace header in the environment of a Batch job description or state-change event detail."""
+    environments = [job.get('container', {}).get('environment', [])]
+    for task_properties in job.get('ecsProperties', {}).get('taskProperties', []):
+        for container in task_properties.get('containers', []):
+            environments.append(container.get('environment', []))
+
+    for environment in environments:
+        for variable in environment:
+            if variable.get('name') == TRACE_HEADER_ENV:
+                return variable.get('value')
+    return None
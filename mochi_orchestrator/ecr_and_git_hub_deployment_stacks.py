@@ -1,12 +1,28 @@
+import json
+
 from aws_cdk import (
     Stack,
+    aws_codebuild as codebuild,
     aws_ecr as ecr,
+    aws_events as events,
+    aws_events_targets as targets,
     aws_iam as iam,
     Duration,
     CfnOutput
 )
 from constructs import Construct
 
+# Repository prefix of the ECR pull-through cache for ghcr.io: ghcr.io/willhumphreys/polygon is
+# pulled as {account}.dkr.ecr.{region}.amazonaws.com/ghcr/willhumphreys/polygon
+GHCR_CACHE_PREFIX = "ghcr"
+
+# Large stage images that get a SOCI index so Fargate can lazy-load them. The ghcr.io images are
+# only in ECR (and so only indexable) when the pull-through cache is enabled.
+SOCI_ECR_REPOSITORIES = ["mochi-java"]
+SOCI_GHCR_IMAGES = ["willhumphreys/py-trade-lens", "willhumphreys/r-graphs"]
+SOCI_VERSION = "0.9.0"
+CONTAINERD_VERSION = "1.7.27"
+
 
 class EcrStack(Stack):
     def __init__(self, scope: Construct, id: str, **kwargs) -> None:
@@ -33,6 +49,147 @@ class EcrStack(Stack):
                 lifecycle_rules=[lifecycle_rule]
             )
 
+        # Cache ghcr.io images in ECR. ghcr.io needs credentials, stored as a Secrets Manager secret
+        # whose name starts with "ecr-pullthroughcache/" (e.g. ecr-pullthroughcache/ghcr) holding a
+        # {"username": ..., "accessToken": ...} GitHub token with read:packages.
+        ghcr_credential_arn = self.node.try_get_context("ghcr_credential_arn")
+        if ghcr_credential_arn:
+            ecr.CfnPullThroughCacheRule(
+                self, "GhcrPullThroughCacheRule",
+                ecr_repository_prefix=GHCR_CACHE_PREFIX,
+                upstream_registry="github-container-registry",
+                upstream_registry_url="ghcr.io",
+                credential_arn=ghcr_credential_arn
+            )
+
+            # Repositories created by the cache get the same lifecycle as ours, so cached
+            # :latest pulls do not accumulate every upstream image forever
+            ecr.CfnRepositoryCreationTemplate(
+                self, "GhcrCacheRepositoryTemplate",
+                prefix=GHCR_CACHE_PREFIX,
+                applied_for=["PULL_THROUGH_CACHE"],
+                description="Repositories cached from ghcr.io",
+                image_tag_mutability="MUTABLE",
+                lifecycle_policy=json.dumps({
+                    "rules": [{
+                        "rulePriority": 1,
+                        "description": "Keep only last 5 images",
+                        "selection": {"tagStatus": "any", "countType": "imageCountMoreThan", "countNumber": 5},
+                        "action": {"type": "expire"}
+                    }]
+                })
+            )
+
+        soci_repositories = SOCI_ECR_REPOSITORIES + (
+            [f"{GHCR_CACHE_PREFIX}/{image}" for image in SOCI_GHCR_IMAGES] if ghcr_credential_arn else [])
+        self._create_soci_index_builder(soci_repositories)
+
+    def _create_soci_index_builder(self, repositories) -> None:
+        """
+        Build SOCI (seekable OCI) indexes for large images so Fargate lazy-loads them.
+
+        Fargate starts a container from an indexed image before the whole image is downloaded and
+        fetches the rest of the layers on demand, so stages that only read part of a multi-GB image
+        start in seconds. No job definition change is needed: Fargate (platform 1.4.0 and later)
+        picks the index up automatically for images in the same ECR repository.
+        """
+        project = codebuild.Project(
+            self, "SociIndexBuilder",
+            description="Builds and pushes SOCI indexes for large Batch stage images",
+            environment=codebuild.BuildEnvironment(
+                build_image=codebuild.LinuxBuildImage.STANDARD_7_0,
+                compute_type=codebuild.ComputeType.MEDIUM,
+                privileged=True
+            ),
+            environment_variables={
+                "IMAGE_REPOSITORIES": codebuild.BuildEnvironmentVariable(value=" ".join(repositories)),
+                "IMAGE_TAG": codebuild.BuildEnvironmentVariable(value="latest")
+            },
+            timeout=Duration.hours(1),
+            build_spec=codebuild.BuildSpec.from_object({
+                "version": "0.2",
+                "phases": {
+                    "install": {
+                        "commands": [
+                            f"curl -sSL https://github.com/containerd/containerd/releases/download/v{CONTAINERD_VERSION}/"
+                            f"containerd-{CONTAINERD_VERSION}-linux-amd64.tar.gz | tar -xz -C /usr/local",
+                            f"curl -sSL https://github.com/awslabs/soci-snapshotter/releases/download/v{SOCI_VERSION}/"
+                            f"soci-snapshotter-{SOCI_VERSION}-linux-amd64.tar.gz | tar -xz -C /usr/local/bin soci",
+                            "nohup /usr/local/bin/containerd > /tmp/containerd.log 2>&1 &",
+                            "sleep 5"
+                        ]
+                    },
+                    "build": {
+                        "commands": [
+                            "ACCOUNT_ID=$(aws sts get-caller-identity --query Account --output text)",
+                            "REGISTRY=$ACCOUNT_ID.dkr.ecr.$AWS_REGION.amazonaws.com",
+                            "PASSWORD=$(aws ecr get-login-password)",
+                            # A pull-through cache repository only exists after its first pull, so a fresh
+                            # account has nothing to index yet; skip it instead of failing the nightly build
+                            "for repository in $IMAGE_REPOSITORIES; do "
+                            "image=$REGISTRY/$repository:$IMAGE_TAG; "
+                            "if ! aws ecr describe-images --repository-name $repository "
+                            "--image-ids imageTag=$IMAGE_TAG > /dev/null 2>&1; then "
+                            "echo Skipping $image, not in ECR yet; continue; fi; "
+                            "echo Indexing $image; "
+                            "/usr/local/bin/ctr image pull --user AWS:$PASSWORD $image "
+                            "&& soci create $image "
+                            "&& soci push --user AWS:$PASSWORD $image "
+                            "|| exit 1; done"
+                        ]
+                    }
+                }
+            })
+        )
+
+        project.add_to_role_policy(iam.PolicyStatement(
+            actions=["ecr:GetAuthorizationToken"],
+            resources=["*"]
+        ))
+        project.add_to_role_policy(iam.PolicyStatement(
+            actions=["ecr:DescribeImages", "ecr:BatchGetImage", "ecr:GetDownloadUrlForLayer",
+                     "ecr:BatchCheckLayerAvailability",
+                     "ecr:InitiateLayerUpload", "ecr:UploadLayerPart", "ecr:CompleteLayerUpload", "ecr:PutImage"],
+            resources=[f"arn:aws:ecr:{self.region}:{self.account}:repository/{repository}"
+                       for repository in repositories]
+        ))
+
+        # Index every tagged push. The index itself is pushed by digest without a tag, so it does not
+        # trigger another build.
+        events.Rule(
+            self, "SociIndexOnPushRule",
+            event_pattern=events.EventPattern(
+                source=["aws.ecr"],
+                detail_type=["ECR Image Action"],
+                detail={
+                    "action-type": ["PUSH"],
+                    "result": ["SUCCESS"],
+                    "repository-name": repositories,
+                    "image-tag": [{"exists": True}]
+                }
+            ),
+            targets=[targets.CodeBuildProject(
+                project,
+                event=events.RuleTargetInput.from_object({
+                    "environmentVariablesOverride": [
+                        {"name": "IMAGE_REPOSITORIES", "value": events.EventField.from_path("$.detail.repository-name"),
+                         "type": "PLAINTEXT"},
+                        {"name": "IMAGE_TAG", "value": events.EventField.from_path("$.detail.image-tag"),
+                         "type": "PLAINTEXT"}
+                    ]
+                })
+            )]
+        )
+
+        # Images refreshed through the pull-through cache do not emit push events, so re-index nightly
+        events.Rule(
+            self, "SociIndexNightlyRule",
+            schedule=events.Schedule.cron(minute="0", hour="3"),
+            targets=[targets.CodeBuildProject(project)]
+        )
+
+        CfnOutput(self, "SociIndexBuilderProject", value=project.project_name)
+
 
 class GitHubOIDCProviderStack(Stack):
     def __init__(self, scope: Construct, id: str, **kwargs) -> None:
@@ -0,0 +1,67 @@
+import os
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional
+
+if TYPE_CHECKING:
+    # Only needed for annotations, so listing the registered stacks does not start the jsii runtime
+    from aws_cdk import App, Stack
+
+# Comma-separated stack names to synthesize, from `cdk synth -c stacks=...` or this environment variable
+STACKS_CONTEXT_KEY = "stacks"
+STACKS_ENV_VAR = "MOCHI_STACKS"
+
+
+class StackRegistry:
+    """
+    Registry of stack factories that only constructs the stacks that are actually needed.
+
+    Each factory receives the app and the registry, and asks the registry for the stacks it
+    depends on, so selecting one stack also builds its dependencies but nothing else.
+    """
+
+    def __init__(self, app: Optional["App"]) -> None:
+        self.app = app
+        self._factories: Dict[str, Callable[["App", "StackRegistry"], "Stack"]] = {}
+        self._stacks: Dict[str, "Stack"] = {}
+
+    def stack(self, name: str):
+        """Decorator that registers a factory for the stack called `name`."""
+        def decorator(factory: Callable[["App", "StackRegistry"], "Stack"]):
+            if name in self._factories:
+                raise ValueError(f"Stack {name} is registered twice")
+            self._factories[name] = factory
+            return factory
+        return decorator
+
+    @property
+    def names(self) -> List[str]:
+        """Names of all registered stacks, in registration order."""
+        return list(self._factories)
+
+    def get(self, name: str) -> "Stack":
+        """Return the stack called `name`, constructing it (and its dependencies) on first use."""
+        if name not in self._stacks:
+            if name not in self._factories:
+                raise ValueError(f"Unknown stack {name}. Available stacks: {', '.join(self.names)}")
+            self._stacks[name] = self._factories[name](self.app, self)
+        return self._stacks[name]
+
+    def build(self, names: Optional[Iterable[str]] = None) -> Dict[str, "Stack"]:
+        """Construct the selected stacks, or every registered stack if no selection is given."""
+        for name in (names or self.names):
+            self.get(name)
+        return dict(self._stacks)
+
+
+def selected_stack_names(app: "App") -> Optional[List[str]]:
+    """
+    Read the stack selection from the `stacks` context value or the MOCHI_STACKS environment variable.
+
+    Returns:
+        list: Selected stack names, or None to build every stack
+    """
+    selection = app.node.try_get_context(STACKS_CONTEXT_KEY) or os.environ.get(STACKS_ENV_VAR)
+    if not selection:
+        return None
+    if isinstance(selection, str):
+        selection = selection.split(",")
+    return [name.strip() for name in selection if name.strip()] or None
@@ -1,12 +1,23 @@
 from aws_cdk import (
     Stack,
+    Duration,
     aws_s3 as s3,
+    aws_dynamodb as dynamodb,
     CfnOutput,
     RemovalPolicy
     # Include other necessary imports
 )
 from constructs import Construct
 
+# Global secondary indexes of the run catalog by name, and the attribute each is partitioned by.
+# All of them sort by run_id, which starts with the submission timestamp.
+RUN_CATALOG_INDEXES = {
+    'ticker-index': 'ticker',
+    'user-index': 'user_id',
+    'user-ticker-index': 'user_ticker',
+    'submitted-date-index': 'submitted_date',
+}
+
 
 class MochiStorageStack(Stack):
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
@@ -20,7 +31,15 @@ class MochiStorageStack(Stack):
             self,
             'RawHistoricalData',
             bucket_name='mochi-prod-raw-historical-data',
-            removal_policy=RemovalPolicy.RETAIN
+            removal_policy=RemovalPolicy.RETAIN,
+            # Data memoized across backtests is recomputed on demand, so it does not need to be kept forever
+            lifecycle_rules=[
+                s3.LifecycleRule(
+                    id='ExpireMemoizedData',
+                    prefix='cache/',
+                    expiration=Duration.days(90)
+                )
+            ]
 
         )
         CfnOutput(
@@ -43,7 +62,15 @@ class MochiStorageStack(Stack):
             self,
             'PreparedHistoricalData',
             bucket_name='mochi-prod-prepared-historical-data',
-            removal_policy=RemovalPolicy.RETAIN
+            removal_policy=RemovalPolicy.RETAIN,
+            # Data memoized across backtests is recomputed on demand, so it does not need to be kept forever
+            lifecycle_rules=[
+                s3.LifecycleRule(
+                    id='ExpireMemoizedData',
+                    prefix='cache/',
+                    expiration=Duration.days(90)
+                )
+            ]
 
         )
         CfnOutput(
@@ -227,6 +254,8 @@ class MochiStorageStack(Stack):
             'FinalTraderRanking',
             bucket_name='mochi-prod-final-trader-ranking',
             removal_policy=RemovalPolicy.RETAIN,
+            # New ranking objects trigger the leaderboard index
+            event_bridge_enabled=True,
             cors=[s3.CorsRule(
             allowed_methods=[s3.HttpMethods.GET, s3.HttpMethods.PUT, s3.HttpMethods.POST, s3.HttpMethods.HEAD],
             allowed_origins=['*'],  # For production, specify actual origins instead of '*'
@@ -278,6 +307,27 @@ class MochiStorageStack(Stack):
             bucket_name='mochi-prod-live-trades',
             removal_policy=RemovalPolicy.RETAIN,
             versioned=True,
+            lifecycle_rules=[
+                # Compaction deletes the deltas it folds; this only catches orphans of writers that crashed
+                # before registering their delta, and is far longer than compaction can be failing unalarmed
+                s3.LifecycleRule(
+                    id='ExpireOrphanedDeltas',
+                    prefix='deltas/',
+                    expiration=Duration.days(30),
+                    noncurrent_version_expiration=Duration.days(1)
+                ),
+                # Manifests are rewritten on every append; old versions are never read
+                s3.LifecycleRule(
+                    id='ExpireOldManifestVersions',
+                    prefix='manifests/',
+                    noncurrent_version_expiration=Duration.days(1)
+                ),
+                s3.LifecycleRule(
+                    id='ExpireSupersededSnapshots',
+                    prefix='snapshots/',
+                    noncurrent_version_expiration=Duration.days(1)
+                )
+            ],
             cors=[s3.CorsRule(
                 allowed_methods=[s3.HttpMethods.GET, s3.HttpMethods.PUT, s3.HttpMethods.POST, s3.HttpMethods.HEAD],
                 allowed_origins=['*'],  # For production, specify actual origins instead of '*'
@@ -350,6 +400,92 @@ class MochiStorageStack(Stack):
             export_name='MochiStorage-BacktestParamsBucketArn'
         )
 
+        # Checkpoints of long-running jobs, so a retry after a Spot interruption resumes instead of
+        # starting over. They are only useful while a run can still be retried.
+        self.buckets['backtest_checkpoints'] = s3.Bucket(
+            self,
+            'BacktestCheckpointsBucket',
+            bucket_name='mochi-prod-backtest-checkpoints',
+            removal_policy=RemovalPolicy.RETAIN,
+            lifecycle_rules=[
+                s3.LifecycleRule(
+                    id='ExpireCheckpoints',
+                    prefix='checkpoints/',
+                    expiration=Duration.days(14),
+                    abort_incomplete_multipart_upload_after=Duration.days(1)
+                )
+            ]
+        )
+        CfnOutput(
+            self,
+            'BacktestCheckpointsBucketName',
+            value=self.buckets['backtest_checkpoints'].bucket_name,
+            description='Name of the bucket holding checkpoints of long-running jobs',
+            export_name='MochiStorage-BacktestCheckpointsBucketName'
+        )
+        # Run catalog: one item per backtest run with its parameters, stage statuses and output
+        # locations. Run IDs sort by submission time, so each index returns the newest runs first
+        # with ScanIndexForward=False, e.g. "my last 50 runs for AAPL" is one query on user_ticker.
+        self.run_catalog_table = dynamodb.Table(
+            self,
+            'RunCatalogTable',
+            table_name='mochi-prod-run-catalog',
+            partition_key=dynamodb.Attribute(name='run_id', type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            point_in_time_recovery_specification=dynamodb.PointInTimeRecoverySpecification(
+                point_in_time_recovery_enabled=True
+            ),
+            removal_policy=RemovalPolicy.RETAIN
+        )
+        for index_name, partition_key in RUN_CATALOG_INDEXES.items():
+            self.run_catalog_table.add_global_secondary_index(
+                index_name=index_name,
+                partition_key=dynamodb.Attribute(name=partition_key, type=dynamodb.AttributeType.STRING),
+                sort_key=dynamodb.Attribute(name='run_id', type=dynamodb.AttributeType.STRING),
+                projection_type=dynamodb.ProjectionType.ALL
+            )
+        CfnOutput(
+            self,
+            'RunCatalogTableName',
+            value=self.run_catalog_table.table_name,
+            description='Name of the backtest run catalog table',
+            export_name='MochiStorage-RunCatalogTableName'
+        )
+
+        # Admission control: in-flight and held pipeline counters per tier and per user, plus one
+        # lease per admitted pipeline. A handful of small items, so on-demand billing costs next to nothing.
+        self.admission_table = dynamodb.Table(
+            self,
+            'AdmissionTable',
+            table_name='mochi-prod-admission',
+            partition_key=dynamodb.Attribute(name='scope', type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+        CfnOutput(
+            self,
+            'AdmissionTableName',
+            value=self.admission_table.table_name,
+            description='Name of the backtest admission control table',
+            export_name='MochiStorage-AdmissionTableName'
+        )
+
+        # Token buckets shared by jobs that call rate-limited APIs, one item per limiter (e.g. "polygon")
+        self.rate_limit_table = dynamodb.Table(
+            self,
+            'RateLimitTable',
+            table_name='mochi-prod-rate-limits',
+            partition_key=dynamodb.Attribute(name='limiter', type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+        CfnOutput(
+            self,
+            'RateLimitTableName',
+            value=self.rate_limit_table.table_name,
+            description='Name of the API rate limiter table',
+            export_name='MochiStorage-RateLimitTableName'
+        )
 
         # Keep existing references for backward compatibility
         self.input_bucket = self.buckets['raw_historical_data']
@@ -1,15 +1,59 @@
 # mochi_orchestrator/mochi_batch_resources.py
 from aws_cdk import (
+    RemovalPolicy,
     Stack,
     Tags,
     aws_batch as batch,
+    aws_dynamodb as dynamodb,
     aws_ec2 as ec2,
+    aws_efs as efs,
     aws_iam as iam,
     CfnOutput,
     Fn
 )
 from constructs import Construct
-from typing import Optional
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from mochi_orchestrator.ecr_and_git_hub_deployment_stacks import GHCR_CACHE_PREFIX
+
+GHCR_REGISTRY = "ghcr.io/"
+
+# Stages of the fused job definition for small backtests: (container, job definition it replaces, vCPU, memory MiB).
+# The containers run one after another on a single task, so their total must be a valid Fargate size.
+FUSED_JOB_DEFINITION_NAME = "backtest-fused"
+FUSED_STAGES = [
+    ("extract", "polygon-extract", 0.5, 1024),
+    ("enhance", "trade-data-enhancer", 1.0, 6144),
+    ("metadata", "data-metadata", 0.5, 1024),
+]
+FUSED_WORK_PATH = "/work"
+
+# Largest estimated raw input the launcher fuses by default. It must stay well inside what the fused enhance
+# container's memory can hold; the standalone trade-data-enhancer has 16 GiB for multi-year inputs.
+DEFAULT_FUSED_MAX_ESTIMATED_MB = 4
+
+# Where the shared scratch file system is mounted in every job container (and the cleanup Lambda)
+SCRATCH_MOUNT_PATH = "/mnt/scratch"
+
+
+@lru_cache(maxsize=None)
+def resolve_image_digest(repository_name: str, tag: str, region: Optional[str] = None) -> Optional[str]:
+    """
+    Look up the digest an ECR image tag currently points to, using the synth-time AWS credentials.
+
+    Returns:
+        str: The image digest (sha256:...), or None if it cannot be resolved
+    """
+    import boto3
+
+    try:
+        ecr_client = boto3.client("ecr", region_name=region) if region else boto3.client("ecr")
+        response = ecr_client.describe_images(repositoryName=repository_name, imageIds=[{"imageTag": tag}])
+        return response["imageDetails"][0]["imageDigest"]
+    except Exception as e:
+        print(f"Could not resolve digest of {repository_name}:{tag}, keeping the tag: {e}")
+        return None
 
 
 class MochiBatchResources(Construct):
@@ -22,26 +66,97 @@ class MochiBatchResources(Construct):
                  max_vcpus: int = 4,
                  compute_env_name: str = "MochiFargate",
                  job_queue_name: str = "fargateSpotTrades",
+                 interactive_job_queue_name: str = "fargateInteractive",
+                 interactive_max_vcpus: int = 4,
+                 private_subnets: bool = False,
+                 interface_endpoints: Optional[bool] = None,
+                 ghcr_pull_through_cache: bool = False,
+                 pin_image_digests: bool = False,
+                 image_digests: Optional[Dict[str, str]] = None,
+                 shared_scratch: bool = False,
+                 checkpoint_bucket_name: Optional[str] = None,
+                 rate_limit_table_name: Optional[str] = None,
+                 polygon_calls_per_minute: float = 5,
                  tags: Optional[dict] = None,
                  **kwargs) -> None:
         """
         Initialize Batch resources.
+
+        Args:
+            job_queue_name: Queue for the batch tier, on Fargate Spot only
+            interactive_job_queue_name: Queue for the interactive tier, on on-demand Fargate with Spot overflow
+            interactive_max_vcpus: vCPU limit of the on-demand compute environment
+            private_subnets: Run jobs in private subnets behind a NAT Gateway instead of public subnets
+            interface_endpoints: Create interface endpoints for ECR, CloudWatch Logs and Athena
+                (default: only with private_subnets, where they keep that traffic off the NAT Gateway)
+            ghcr_pull_through_cache: Pull ghcr.io images through the ECR pull-through cache in EcrStack
+            pin_image_digests: Resolve image tags to digests at synth time
+            image_digests: Digests to pin by configured image (e.g. ghcr.io/willhumphreys/polygon:latest),
+                taking precedence over resolved ones
+            shared_scratch: Mount a shared EFS scratch file system into every job at /mnt/scratch (default: off)
+            checkpoint_bucket_name: Bucket where long-running jobs checkpoint their progress
+            rate_limit_table_name: DynamoDB table of the token buckets shared by rate-limited jobs
+            polygon_calls_per_minute: Polygon plan rate limit the extract jobs share
         """
         super().__init__(scope, id)
 
-        # Create a custom VPC with only public subnets (no NAT Gateway)
+        # Create a custom VPC. By default jobs run in public subnets with public IPs and no NAT Gateway;
+        # with private_subnets they run in private subnets behind a single NAT Gateway, which is still
+        # needed for images pulled from ghcr.io and for any other internet access.
+        subnet_configuration = [
+            ec2.SubnetConfiguration(
+                name="Public",
+                subnet_type=ec2.SubnetType.PUBLIC,
+                cidr_mask=24
+            )
+        ]
+        if private_subnets:
+            subnet_configuration.append(
+                ec2.SubnetConfiguration(
+                    name="Private",
+                    subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS,
+                    cidr_mask=24
+                )
+            )
+
         vpc = ec2.Vpc(self, "MochiVPC",
                       ip_addresses=ec2.IpAddresses.cidr("10.0.0.0/16"),
                       max_azs=2,
-                      subnet_configuration=[
-                          ec2.SubnetConfiguration(
-                              name="Public",
-                              subnet_type=ec2.SubnetType.PUBLIC,
-                              cidr_mask=24
-                          )
-                      ],
-                      nat_gateways=0
+                      subnet_configuration=subnet_configuration,
+                      nat_gateways=1 if private_subnets else 0
                       )
+        job_subnet_type = ec2.SubnetType.PRIVATE_WITH_EGRESS if private_subnets else ec2.SubnetType.PUBLIC
+        job_subnets = ec2.SubnetSelection(subnet_type=job_subnet_type)
+
+        # Keep S3 traffic inside the VPC. The gateway endpoint is free and adds a route to the job
+        # subnets' route tables, so the multi-GB reads and writes of the enhancer and mochi-trades
+        # jobs (and ECR image layers, which are served from S3) bypass the internet gateway and NAT.
+        vpc.add_gateway_endpoint("S3Endpoint",
+                                 service=ec2.GatewayVpcEndpointAwsService.S3,
+                                 subnets=[job_subnets])
+
+        # Also free: rate-limited jobs check the shared token bucket in DynamoDB before every API call
+        if rate_limit_table_name:
+            vpc.add_gateway_endpoint("DynamoDbEndpoint",
+                                     service=ec2.GatewayVpcEndpointAwsService.DYNAMODB,
+                                     subnets=[job_subnets])
+
+        # Interface endpoints for the other AWS services jobs talk to. Each is billed per AZ-hour, and
+        # jobs in public subnets already reach these services directly, so by default they only come
+        # with private subnets.
+        if interface_endpoints is None:
+            interface_endpoints = private_subnets
+        if interface_endpoints:
+            for endpoint_id, service in [
+                ("EcrApiEndpoint", ec2.InterfaceVpcEndpointAwsService.ECR),
+                ("EcrDockerEndpoint", ec2.InterfaceVpcEndpointAwsService.ECR_DOCKER),
+                ("LogsEndpoint", ec2.InterfaceVpcEndpointAwsService.CLOUDWATCH_LOGS),
+                ("AthenaEndpoint", ec2.InterfaceVpcEndpointAwsService.ATHENA),
+            ]:
+                vpc.add_interface_endpoint(endpoint_id,
+                                           service=service,
+                                           subnets=job_subnets,
+                                           private_dns_enabled=True)
 
         # Create service role for Batch
         batch_service_role = iam.Role.from_role_arn(
@@ -56,6 +171,35 @@ class MochiBatchResources(Construct):
                                            allow_all_outbound=True
                                            )
 
+        self.vpc = vpc
+        self.security_group = security_group
+        self.job_subnets = job_subnets
+
+        # Shared scratch space, so a stage can read its predecessor's output locally instead of
+        # downloading it from S3 again. S3 stays the durable copy; scratch is per run
+        # (runs/{group_tag}, passed to the jobs as SCRATCH_DIR) and is cleaned up after a day.
+        self.scratch_file_system = None
+        self.scratch_access_point = None
+        if shared_scratch:
+            self.scratch_file_system = efs.FileSystem(
+                self, "ScratchFileSystem",
+                vpc=vpc,
+                vpc_subnets=job_subnets,
+                encrypted=True,
+                performance_mode=efs.PerformanceMode.GENERAL_PURPOSE,
+                throughput_mode=efs.ThroughputMode.ELASTIC,
+                removal_policy=RemovalPolicy.DESTROY
+            )
+            self.scratch_file_system.connections.allow_default_port_from(security_group)
+
+            # Job definitions are static, so a single access point is shared by all runs and every
+            # run gets its own subdirectory under it
+            self.scratch_access_point = self.scratch_file_system.add_access_point(
+                "ScratchAccessPoint",
+                path="/scratch",
+                create_acl=efs.Acl(owner_uid="0", owner_gid="0", permissions="777")
+            )
+
         # Create Batch Compute Environment
         self.batch_compute_env = batch.CfnComputeEnvironment(
             self, "BatchComputeEnv",
@@ -65,13 +209,28 @@ class MochiBatchResources(Construct):
             compute_resources=batch.CfnComputeEnvironment.ComputeResourcesProperty(
                 type="FARGATE_SPOT",
                 maxv_cpus=max_vcpus,
-                subnets=vpc.select_subnets(subnet_type=ec2.SubnetType.PUBLIC).subnet_ids,
+                subnets=vpc.select_subnets(subnet_type=job_subnet_type).subnet_ids,
                 security_group_ids=[security_group.security_group_id]
             ),
             service_role=batch_service_role.role_arn
         )
 
-        # Create Batch Job Queue
+        # On-demand Fargate for the interactive tier: not subject to Spot capacity shortages or interruptions
+        self.on_demand_compute_env = batch.CfnComputeEnvironment(
+            self, "OnDemandComputeEnv",
+            compute_environment_name=f"{compute_env_name}OnDemand",
+            type="MANAGED",
+            state="ENABLED",
+            compute_resources=batch.CfnComputeEnvironment.ComputeResourcesProperty(
+                type="FARGATE",
+                maxv_cpus=interactive_max_vcpus,
+                subnets=vpc.select_subnets(subnet_type=job_subnet_type).subnet_ids,
+                security_group_ids=[security_group.security_group_id]
+            ),
+            service_role=batch_service_role.role_arn
+        )
+
+        # Create Batch Job Queue (batch tier, Spot only, so bulk work stays cheap)
         self.batch_job_queue = batch.CfnJobQueue(
             self, "BatchJobQueue",
             job_queue_name=job_queue_name,
@@ -85,6 +244,25 @@ class MochiBatchResources(Construct):
             ]
         )
 
+        # Interactive tier: on-demand first and Spot once the on-demand environment is full. The higher
+        # priority makes the Spot environment schedule interactive jobs ahead of queued batch jobs.
+        self.interactive_job_queue = batch.CfnJobQueue(
+            self, "InteractiveJobQueue",
+            job_queue_name=interactive_job_queue_name,
+            priority=10,
+            state="ENABLED",
+            compute_environment_order=[
+                batch.CfnJobQueue.ComputeEnvironmentOrderProperty(
+                    order=1,
+                    compute_environment=self.on_demand_compute_env.ref
+                ),
+                batch.CfnJobQueue.ComputeEnvironmentOrderProperty(
+                    order=2,
+                    compute_environment=self.batch_compute_env.ref
+                )
+            ]
+        )
+
         # Define job definitions
         job_definitions_config = [
             {
@@ -93,6 +271,7 @@ class MochiBatchResources(Construct):
                 "vcpu": 1.0,
                 "memory": 2048,
                 "timeout_seconds": 3600,
+                "rate_limited": True,
             },
             {
                 "name": "trade-data-enhancer",
@@ -110,6 +289,7 @@ class MochiBatchResources(Construct):
             },
             {
                 "name": "mochi-trades",
+                "checkpoint": True,
                 "image": "739275456034.dkr.ecr.eu-central-1.amazonaws.com/mochi-java:latest",
                 "vcpu": 4.0,
                 "memory": 30720,
@@ -117,6 +297,7 @@ class MochiBatchResources(Construct):
             },
             {
                 "name": "py-trade-lens",
+                "checkpoint": True,
                 "image": "ghcr.io/willhumphreys/py-trade-lens:latest",
                 "vcpu": 4.0,
                 "memory": 30720,
@@ -161,6 +342,15 @@ class MochiBatchResources(Construct):
             ]
         )
 
+        ecr_registry = f"{Stack.of(self).account}.dkr.ecr.{Stack.of(self).region}.{Stack.of(self).url_suffix}"
+        if ghcr_pull_through_cache:
+            # The first pull of an image through the cache creates its repository and imports it from ghcr.io
+            execution_role.add_to_policy(iam.PolicyStatement(
+                actions=["ecr:BatchImportUpstreamImage", "ecr:CreateRepository"],
+                resources=[
+                    f"arn:aws:ecr:{Stack.of(self).region}:{Stack.of(self).account}:repository/{GHCR_CACHE_PREFIX}/*"]
+            ))
+
         # Create job role with permissions to access S3
         job_role = iam.Role(
             self, "BatchJobRole",
@@ -174,17 +364,71 @@ class MochiBatchResources(Construct):
 
         )
 
+        scratch_volumes, scratch_mount_points, scratch_environment = [], [], []
+        if self.scratch_file_system:
+            self.scratch_file_system.grant(job_role, "elasticfilesystem:ClientMount", "elasticfilesystem:ClientWrite")
+            scratch_volumes = [{
+                "name": "scratch",
+                "efsVolumeConfiguration": {
+                    "fileSystemId": self.scratch_file_system.file_system_id,
+                    "transitEncryption": "ENABLED",
+                    "authorizationConfig": {
+                        "accessPointId": self.scratch_access_point.access_point_id,
+                        "iam": "ENABLED"
+                    }
+                }
+            }]
+            scratch_mount_points = [{"sourceVolume": "scratch", "containerPath": SCRATCH_MOUNT_PATH, "readOnly": False}]
+            scratch_environment = [{"name": "SCRATCH_ROOT", "value": SCRATCH_MOUNT_PATH}]
+
+        # Long-running jobs checkpoint to S3 so that a retry after a Spot interruption resumes from
+        # the last checkpoint. Batch sets AWS_BATCH_JOB_ID, which stays the same across attempts, and
+        # AWS_BATCH_JOB_ATTEMPT (1, 2, ...); a stage checkpoints under $CHECKPOINT_PREFIX$AWS_BATCH_JOB_ID/.
+        # The launcher overrides CHECKPOINT_PREFIX with a run-scoped one; jobs submitted without it, such
+        # as the ones data-metadata submits, fall back to checkpoints/jobs/. Fargate Spot sends SIGTERM two minutes
+        # before reclaiming the task; Batch job definitions cannot raise the ECS stopTimeout, so an
+        # init process forwards the signal to the stage so it can flush progress in that window.
+        checkpoint_environment = []
+        if checkpoint_bucket_name:
+            checkpoint_environment = [
+                {"name": "CHECKPOINT_BUCKET", "value": checkpoint_bucket_name},
+                {"name": "CHECKPOINT_PREFIX", "value": "checkpoints/jobs/"},
+                {"name": "CHECKPOINT_ON_SIGTERM", "value": "true"},
+                {"name": "CHECKPOINT_INTERVAL_SECONDS", "value": "600"}
+            ]
+
+        # Extract jobs share Polygon's plan rate limit through a token bucket item in DynamoDB: take a
+        # token from RATE_LIMIT_TABLE/RATE_LIMIT_KEY before each call, and wait for POLYGON_NOT_BEFORE
+        # (epoch seconds, set by the launcher) before the first one
+        rate_limit_environment = []
+        if rate_limit_table_name:
+            dynamodb.Table.from_table_name(self, "RateLimitTable", rate_limit_table_name).grant_read_write_data(
+                job_role)
+            rate_limit_environment = [
+                {"name": "RATE_LIMIT_TABLE", "value": rate_limit_table_name},
+                {"name": "RATE_LIMIT_KEY", "value": "polygon"},
+                {"name": "POLYGON_CALLS_PER_MINUTE", "value": f"{polygon_calls_per_minute:g}"}
+            ]
+
         # Create all job definitions using the configurations
         self.job_definitions = {}
         for i, job_def in enumerate(job_definitions_config):
+            image = self._job_image(job_def["image"], ecr_registry, ghcr_pull_through_cache, pin_image_digests,
+                                    image_digests or {})
             job_definition = batch.CfnJobDefinition(
                 self, f"JobDef{i}",
                 job_definition_name=job_def["name"],
                 type="container",
                 platform_capabilities=["FARGATE"],
                 container_properties={
-                    "image": job_def["image"],
+                    "image": image,
                     "command": [],
+                    "environment": scratch_environment + (
+                        checkpoint_environment if job_def.get("checkpoint") else []) + (
+                        rate_limit_environment if job_def.get("rate_limited") else []),
+                    **({"linuxParameters": {"initProcessEnabled": True}} if job_def.get("checkpoint") else {}),
+                    "volumes": scratch_volumes,
+                    "mountPoints": scratch_mount_points,
                     "jobRoleArn": job_role.role_arn,
                     "executionRoleArn": execution_role.role_arn,
                     "resourceRequirements": [
@@ -202,7 +446,7 @@ class MochiBatchResources(Construct):
                         "options": {}
                     },
                     "networkConfiguration": {
-                        "assignPublicIp": "ENABLED"
+                        "assignPublicIp": "DISABLED" if private_subnets else "ENABLED"
                     },
                     "fargatePlatformConfiguration": {
                         "platformVersion": "LATEST"
@@ -239,11 +483,80 @@ class MochiBatchResources(Construct):
                 description=f"ARN of the {job_def['name']} job definition"
             )
 
+        # Fused job definition: extract, enhance and metadata as containers of one task, each starting
+        # when the previous one succeeds and passing data through a task-local volume at /work. This
+        # avoids two extra Fargate provisions, image pulls and dependsOn hops for small backtests.
+        images = {job_def["name"]: self._job_image(job_def["image"], ecr_registry, ghcr_pull_through_cache,
+                                                   pin_image_digests, image_digests or {})
+                  for job_def in job_definitions_config}
+        fused_containers = []
+        for index, (container_name, job_definition_name, vcpu, memory) in enumerate(FUSED_STAGES):
+            container = {
+                "name": container_name,
+                "image": images[job_definition_name],
+                "essential": index == len(FUSED_STAGES) - 1,
+                "command": [],
+                "environment": [{"name": "LOCAL_DATA_DIR", "value": FUSED_WORK_PATH}] + scratch_environment + (
+                    rate_limit_environment if job_definition_name == "polygon-extract" else []),
+                "mountPoints": [{"sourceVolume": "work", "containerPath": FUSED_WORK_PATH,
+                                 "readOnly": False}] + scratch_mount_points,
+                "resourceRequirements": [
+                    {"type": "VCPU", "value": str(vcpu)},
+                    {"type": "MEMORY", "value": str(memory)}
+                ],
+                "logConfiguration": {
+                    "logDriver": "awslogs",
+                    "options": {}
+                }
+            }
+            if index > 0:
+                container["dependsOn"] = [{"containerName": FUSED_STAGES[index - 1][0], "condition": "SUCCESS"}]
+            fused_containers.append(container)
+
+        self.fused_job_definition = batch.CfnJobDefinition(
+            self, "FusedJobDef",
+            job_definition_name=FUSED_JOB_DEFINITION_NAME,
+            type="container",
+            platform_capabilities=["FARGATE"],
+            ecs_properties={
+                "taskProperties": [{
+                    "containers": fused_containers,
+                    "executionRoleArn": execution_role.role_arn,
+                    "taskRoleArn": job_role.role_arn,
+                    "volumes": [{"name": "work"}] + scratch_volumes,
+                    "ephemeralStorage": {"sizeInGiB": 50},
+                    "networkConfiguration": {
+                        "assignPublicIp": "DISABLED" if private_subnets else "ENABLED"
+                    },
+                    "platformVersion": "LATEST",
+                    "runtimePlatform": {
+                        "operatingSystemFamily": "LINUX",
+                        "cpuArchitecture": "X86_64"
+                    }
+                }]
+            },
+            retry_strategy=batch.CfnJobDefinition.RetryStrategyProperty(
+                attempts=3,
+                evaluate_on_exit=[
+                    batch.CfnJobDefinition.EvaluateOnExitProperty(
+                        action="RETRY",
+                        on_reason="SpotInterruption"
+                    ),
+                ]
+            ),
+            timeout={
+                "attemptDurationSeconds": 3600
+            }
+        )
+        self.job_definitions[FUSED_JOB_DEFINITION_NAME] = self.fused_job_definition
+        CfnOutput(self, "FusedJobDefinitionArn", value=self.fused_job_definition.ref)
+
         # Output the VPC ID and other useful information
         CfnOutput(self, "VpcId", value=vpc.vpc_id)
-        CfnOutput(self, "SubnetIds", value=Fn.join(",", vpc.select_subnets(subnet_type=ec2.SubnetType.PUBLIC).subnet_ids))
+        CfnOutput(self, "SubnetIds", value=Fn.join(",", vpc.select_subnets(subnet_type=job_subnet_type).subnet_ids))
         CfnOutput(self, "SecurityGroupId", value=security_group.security_group_id)
         CfnOutput(self, "JobQueueArn", value=self.batch_job_queue.ref)
+        CfnOutput(self, "InteractiveJobQueueArn", value=self.interactive_job_queue.ref)
         CfnOutput(self, "ComputeEnvironmentArn", value=self.batch_compute_env.ref)
 
         # Apply tags if provided
@@ -251,6 +564,33 @@ class MochiBatchResources(Construct):
             for key, value in tags.items():
                 Tags.of(self).add(key, value)
 
+    @staticmethod
+    def _job_image(configured_image: str, ecr_registry: str, ghcr_pull_through_cache: bool,
+                   pin_image_digests: bool, image_digests: Dict[str, str]) -> str:
+        """
+        Work out the image a job definition pulls.
+
+        ghcr.io images are rewritten to their pull-through cache repository, so tasks pull from ECR in
+        the same region instead of ghcr.io. Pinning replaces the tag with a digest, so every task runs
+        the same image and Fargate can reuse cached layers instead of resolving :latest on each start.
+        """
+        repository, _, tag = configured_image.rpartition(":")
+        region = None
+        image = configured_image
+        if ghcr_pull_through_cache and configured_image.startswith(GHCR_REGISTRY):
+            repository = f"{GHCR_CACHE_PREFIX}/{repository[len(GHCR_REGISTRY):]}"
+            image = f"{ecr_registry}/{repository}:{tag}"
+        elif ".dkr.ecr." in repository:
+            registry, repository = repository.split("/", 1)
+            region = registry.split(".")[3]
+
+        digest = image_digests.get(configured_image)
+        if not digest and pin_image_digests and (image != configured_image or region):
+            digest = resolve_image_digest(repository, tag, region)
+        if digest:
+            image = f"{image.rpartition(':')[0]}@{digest}"
+        return image
+
     @property
     def compute_environment_arn(self) -> str:
         """Get the ARN of the Batch compute environment."""
@@ -260,3 +600,13 @@ class MochiBatchResources(Construct):
     def job_queue_arn(self) -> str:
         """Get the ARN of the Batch job queue."""
         return self.batch_job_queue.ref
+
+    @property
+    def interactive_job_queue_arn(self) -> str:
+        """Get the ARN of the interactive tier job queue."""
+        return self.interactive_job_queue.ref
+
+    @property
+    def job_queue_arns(self) -> List[str]:
+        """Get the ARNs of all Batch job queues."""
+        return [self.batch_job_queue.ref, self.interactive_job_queue.ref]
@@ -6,11 +6,75 @@ from aws_cdk import (
     aws_lambda as _lambda,
     aws_iam as iam,
     aws_apigateway as apigateway,
+    aws_apigatewayv2 as apigatewayv2,
+    aws_apigatewayv2_authorizers as apigatewayv2_authorizers,
+    aws_apigatewayv2_integrations as apigatewayv2_integrations,
     CfnOutput,
-    aws_s3 as s3
+    aws_s3 as s3,
+    aws_dynamodb as dynamodb,
+    aws_events as events,
+    aws_events_targets as targets,
+    aws_sqs as sqs
 )
 from constructs import Construct
-from .batch_resources import MochiBatchResources
+from .batch_resources import DEFAULT_FUSED_MAX_ESTIMATED_MB, MochiBatchResources, SCRATCH_MOUNT_PATH
+from ..stateful.storage_stack import RUN_CATALOG_INDEXES
+
+# JSON schema of the POST /backtest body, mirroring extract_arguments_from_event in the launcher.
+# Numeric parameters are accepted as numbers or numeric strings because they are passed on as CLI arguments.
+NUMERIC_PARAMETER = {"type": ["number", "string"], "pattern": r"^-?[0-9]+(\.[0-9]+)?$"}
+
+BACKTEST_REQUEST_SCHEMA = {
+    "type": "object",
+    "required": ["ticker", "from_date", "to_date", "shortATRPeriod", "longATRPeriod", "alpha"],
+    "properties": {
+        "ticker": {"type": "string", "minLength": 1, "maxLength": 32, "pattern": r"^[A-Za-z0-9.:_\-^=/]+$"},
+        "from_date": {"type": "string", "pattern": r"^[0-9]{4}-[0-9]{2}-[0-9]{2}$"},
+        "to_date": {"type": "string", "pattern": r"^[0-9]{4}-[0-9]{2}-[0-9]{2}$"},
+        "shortATRPeriod": NUMERIC_PARAMETER,
+        "longATRPeriod": NUMERIC_PARAMETER,
+        "alpha": NUMERIC_PARAMETER,
+        "tradeDuration": NUMERIC_PARAMETER,
+        "tradeTimeout": NUMERIC_PARAMETER,
+        "tier": {"type": "string", "enum": ["interactive", "batch"]},
+        "priority": {"type": "string", "enum": ["high", "normal", "low"]}
+    }
+}
+
+CORS_ALLOWED_ORIGINS = [
+    'https://master.d37eokvg7j9het.amplifyapp.com',
+    'https://dashboard.minoko.life',
+    'http://localhost:5173'
+]
+
+# Gateway responses (authorizer, validation and throttling errors) cannot pick an origin from a list,
+# so they allow only this one; the other origins still get CORS on every response the Lambdas build
+DEFAULT_CORS_ERROR_ORIGIN = 'https://dashboard.minoko.life'
+
+CORS_ALLOWED_HEADERS = [
+    'Content-Type',
+    'Authorization',
+    'X-Amz-Date',
+    'X-Api-Key',
+    'X-Amz-Security-Token',
+]
+
+# Stage-wide limits that apply to every caller, before any per-client usage plan
+DEFAULT_API_RATE_LIMIT = 10
+DEFAULT_API_BURST_LIMIT = 20
+DEFAULT_API_CACHE_TTL_SECONDS = 300
+
+# Read-only query routes and how long the stage cache keeps their responses; live data expires sooner
+QUERY_ROUTE_CACHE_TTL_SECONDS = {
+    "/query/rankings/{ticker}": 60,
+    "/query/leaderboards/{ticker}": 60,
+    "/query/live-trades/{stream}": 5,
+    "/query/runs": 15,
+    "/query/params/{run_id}": 300,
+}
+
+# Query string parameters of the query routes, all part of the cache key
+QUERY_STRING_PARAMETERS = ["fields", "filter", "sort", "order", "limit", "cursor", "metric", "since", "ticker", "date"]
 
 
 class MochiComputeStack(Stack):
@@ -28,7 +92,12 @@ class MochiComputeStack(Stack):
                  mochi_prod_ticker_meta: str = None,
                  mochi_prod_live_trades: str = None,
                  mochi_prod_backtest_params: str = None,
+                 checkpoint_bucket_name: str = None,
+                 run_catalog_table_name: str = None,
+                 admission_table_name: str = None,
+                 rate_limit_table_name: str = None,
                  user_pool=None,
+                 user_pool_client=None,
                  **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
@@ -40,6 +109,7 @@ class MochiComputeStack(Stack):
             code=_lambda.Code.from_asset("lambda"),  # code (Code)
             handler="market_data_pipeline_launcher.handler",  # handler (str)
             timeout=Duration.minutes(1),  # timeout (Duration)
+            tracing=_lambda.Tracing.ACTIVE,  # trace ID is forwarded to the Batch jobs
             environment={  # environment (Map[str,str])
                 "RAW_BUCKET_NAME": raw_bucket_name or "",
                 "PREPARED_BUCKET_NAME": prepared_bucket_name or "",
@@ -54,7 +124,15 @@ class MochiComputeStack(Stack):
                 "MOCHI_PROD_FINAL_TRADER_RANKING": mochi_prod_final_trader_ranking or "",
                 "MOCHI_PROD_TICKER_META": mochi_prod_ticker_meta or "",
                 "MOCHI_PROD_LIVE_TRADES": mochi_prod_live_trades or "",
-                "MOCHI_PROD_BACKTEST_PARAMS": mochi_prod_backtest_params or ""
+                "MOCHI_PROD_BACKTEST_PARAMS": mochi_prod_backtest_params or "",
+                "CHECKPOINT_BUCKET": checkpoint_bucket_name or "",
+                "RUN_CATALOG_TABLE": run_catalog_table_name or "",
+                "FUSED_MAX_ESTIMATED_MB": str(self.node.try_get_context("fused_max_estimated_mb")
+                                              if self.node.try_get_context("fused_max_estimated_mb") is not None
+                                              else DEFAULT_FUSED_MAX_ESTIMATED_MB),
+                "PREPARED_CACHE_VERSION": str(self.node.try_get_context("prepared_cache_version") or 1),
+                "METRICS_NAMESPACE": "Mochi/Launcher",
+                "VERBOSE_LOG_SAMPLE_RATE": "0.01"
             }
         )
 
@@ -62,6 +140,9 @@ class MochiComputeStack(Stack):
             actions=[
                 "batch:SubmitJob",
                 "batch:DescribeJobs",
+                "batch:DescribeJobDefinitions",
+                "batch:DescribeJobQueues",
+                "batch:ListJobs",
                 "batch:TerminateJob",
                 "batch:TagResource",
                 "batch:UntagResource"
@@ -76,7 +157,8 @@ class MochiComputeStack(Stack):
             raw_bucket = s3.Bucket.from_bucket_name(
                 self, "ImportedInputBucket", raw_bucket_name
             )
-            raw_bucket.grant_read(lambda_function)
+            # Write access for the prepared cache's claims and raw data pointers and copies
+            raw_bucket.grant_read_write(lambda_function)
 
         if prepared_bucket_name:
             prepared_bucket = s3.Bucket.from_bucket_name(
@@ -91,27 +173,206 @@ class MochiComputeStack(Stack):
             backtest_params_bucket.grant_write(lambda_function)
 
 
+        # Polygon plan rate limit, shared by every extract job through a token bucket
+        polygon_calls_per_minute = float(self.node.try_get_context("polygon_calls_per_minute") or 5)
+        if rate_limit_table_name:
+            rate_limit_table = dynamodb.Table.from_table_name(self, "ImportedRateLimitTable", rate_limit_table_name)
+            rate_limit_table.grant_read_write_data(lambda_function)
+            lambda_function.add_environment("RATE_LIMIT_TABLE", rate_limit_table_name)
+            lambda_function.add_environment("POLYGON_CALLS_PER_MINUTE", f"{polygon_calls_per_minute:g}")
+
+        # Edge limits, configurable through context
+        api_rate_limit = int(self.node.try_get_context("api_rate_limit") or DEFAULT_API_RATE_LIMIT)
+        api_burst_limit = int(self.node.try_get_context("api_burst_limit") or DEFAULT_API_BURST_LIMIT)
+
+        # Front door for the backtest service: "rest" (default), "http", or "both" to benchmark them side by side
+        api_front_door = self.node.try_get_context("api_front_door") or "rest"
+        if api_front_door not in ("rest", "http", "both"):
+            raise ValueError(f"Unknown api_front_door '{api_front_door}', expected rest, http or both")
+
+        # Imported by name like the buckets; the index names let grants cover the indexes too
+        run_catalog_table = dynamodb.Table.from_table_attributes(
+            self, "ImportedRunCatalogTable",
+            table_name=run_catalog_table_name,
+            global_indexes=list(RUN_CATALOG_INDEXES)
+        ) if run_catalog_table_name else None
+
+        if api_front_door in ("rest", "both"):
+            query_function = self._create_query_function(
+                ranking_bucket_name=mochi_prod_final_trader_ranking,
+                live_trades_bucket_name=mochi_prod_live_trades,
+                backtest_params_bucket_name=mochi_prod_backtest_params,
+                run_catalog_table=run_catalog_table
+            )
+            self._create_rest_api(lambda_function, user_pool, api_rate_limit, api_burst_limit, query_function)
+
+        if api_front_door in ("http", "both"):
+            self._create_http_api(lambda_function, user_pool, user_pool_client, api_rate_limit, api_burst_limit)
+
+        # Create Batch resources
+        batch_max_vcpus = 4
+        batch_resources = MochiBatchResources(
+            self,
+            "MochiBatchResources",
+            max_vcpus=batch_max_vcpus,
+            compute_env_name="MochiFargate",
+            job_queue_name="fargateSpotTrades",
+            interactive_job_queue_name="fargateInteractive",
+            private_subnets=str(self.node.try_get_context("batch_private_subnets") or "false").lower() == "true",
+            interface_endpoints=(str(self.node.try_get_context("batch_interface_endpoints")).lower() == "true"
+                                 if self.node.try_get_context("batch_interface_endpoints") is not None else None),
+            ghcr_pull_through_cache=bool(self.node.try_get_context("ghcr_credential_arn")),
+            pin_image_digests=str(self.node.try_get_context("pin_image_digests") or "false").lower() == "true",
+            image_digests=self.node.try_get_context("image_digests"),
+            checkpoint_bucket_name=checkpoint_bucket_name,
+            rate_limit_table_name=rate_limit_table_name,
+            polygon_calls_per_minute=polygon_calls_per_minute,
+            shared_scratch=str(self.node.try_get_context("batch_shared_scratch") or "false").lower() == "true",
+            tags={
+                "Project": "Mochi",
+                "Environment": "QA"
+            }
+        )
+
+        # Queues for the latency tiers; requests pick one with "tier" or "priority"
+        lambda_function.add_environment("BATCH_JOB_QUEUE", "fargateSpotTrades")
+        lambda_function.add_environment("INTERACTIVE_JOB_QUEUE", "fargateInteractive")
+        lambda_function.add_environment("DEFAULT_TIER", self.node.try_get_context("default_tier") or "batch")
+        lambda_function.add_environment("BATCH_MAX_VCPUS", str(batch_max_vcpus))
+
+        if batch_resources.scratch_file_system:
+            # The launcher hands every job in a run the same scratch directory under this root
+            lambda_function.add_environment("SCRATCH_ROOT", SCRATCH_MOUNT_PATH)
+
+            # Delete run scratch directories once their job chains are long finished
+            scratch_cleanup_function = _lambda.Function(
+                self, "ScratchCleanupFunction",
+                runtime=_lambda.Runtime.PYTHON_3_13,
+                code=_lambda.Code.from_asset("lambda"),
+                handler="scratch_cleanup.handler",
+                timeout=Duration.minutes(5),
+                vpc=batch_resources.vpc,
+                vpc_subnets=batch_resources.job_subnets,
+                allow_public_subnet=True,
+                filesystem=_lambda.FileSystem.from_efs_access_point(batch_resources.scratch_access_point,
+                                                                    SCRATCH_MOUNT_PATH),
+                environment={
+                    "SCRATCH_ROOT": SCRATCH_MOUNT_PATH,
+                    "SCRATCH_RETENTION_HOURS": "24"
+                }
+            )
+
+            events.Rule(
+                self, "ScratchCleanupSchedule",
+                schedule=events.Schedule.rate(Duration.hours(1)),
+                targets=[targets.LambdaFunction(scratch_cleanup_function)]
+            )
+
+        # Turn Batch job state changes into X-Ray segments on the trace of the originating API request
+        trace_segments_function = _lambda.Function(
+            self, "BatchTraceSegmentsFunction",
+            runtime=_lambda.Runtime.PYTHON_3_13,
+            code=_lambda.Code.from_asset("lambda"),
+            handler="batch_trace_segments.handler",
+            timeout=Duration.seconds(30)
+        )
+
+        trace_segments_function.add_to_role_policy(iam.PolicyStatement(
+            actions=["xray:PutTraceSegments"],
+            resources=["*"]
+        ))
+
+        batch_state_change_rule = events.Rule(
+            self, "BatchJobStateChangeRule",
+            event_pattern=events.EventPattern(
+                source=["aws.batch"],
+                detail_type=["Batch Job State Change"],
+                detail={
+                    "jobQueue": batch_resources.job_queue_arns,
+                    "status": ["RUNNING", "SUCCEEDED", "FAILED"]
+                }
+            )
+        )
+        batch_state_change_rule.add_target(targets.LambdaFunction(trace_segments_function))
+
+        if run_catalog_table:
+            # Read for the stage durations behind dry-run estimates
+            run_catalog_table.grant_read_write_data(lambda_function)
+
+            # Record every stage's status in the run catalog
+            run_catalog_updater_function = _lambda.Function(
+                self, "RunCatalogUpdaterFunction",
+                runtime=_lambda.Runtime.PYTHON_3_13,
+                code=_lambda.Code.from_asset("lambda"),
+                handler="run_catalog_updater.handler",
+                timeout=Duration.seconds(30),
+                environment={
+                    "RUN_CATALOG_TABLE": run_catalog_table_name
+                }
+            )
+            run_catalog_table.grant_read_write_data(run_catalog_updater_function)
+            batch_state_change_rule.add_target(targets.LambdaFunction(run_catalog_updater_function))
+
+        if admission_table_name:
+            self._create_admission_control(lambda_function, admission_table_name, batch_resources.job_queue_arns)
+
+        if mochi_prod_final_trader_ranking:
+            self._create_ranking_index(mochi_prod_final_trader_ranking)
+
+        # Output Batch resource ARNs using property methods for consistency
+        CfnOutput(
+            self,
+            "BatchComputeEnvironmentArn",
+            value=batch_resources.compute_environment_arn,
+            description="ARN of the AWS Batch Compute Environment"
+        )
+
+        CfnOutput(
+            self, "BatchJobQueueArn",
+            value=batch_resources.job_queue_arn,
+            description="ARN of the AWS Batch Job Queue"
+        )
+
+    def _create_rest_api(self, lambda_function, user_pool, api_rate_limit: int, api_burst_limit: int,
+                         query_function=None):
+        """Create the REST API front door with the Cognito User Pools authorizer."""
+        # The cache cluster is billed per hour whether or not anything hits it, so it is opt-in
+        api_cache_enabled = str(self.node.try_get_context("api_cache_enabled") or "false").lower() == "true"
+        api_clients = self.node.try_get_context("api_clients") or []
+
+        method_options = {
+            "/backtest/POST": apigateway.MethodDeploymentOptions(caching_enabled=False),
+            "/ping/GET": apigateway.MethodDeploymentOptions(caching_enabled=False)
+        }
+        if query_function:
+            for route, ttl in QUERY_ROUTE_CACHE_TTL_SECONDS.items():
+                method_options[f"{route}/GET"] = apigateway.MethodDeploymentOptions(
+                    caching_enabled=api_cache_enabled,
+                    cache_ttl=Duration.seconds(ttl) if api_cache_enabled else None
+                )
+
         # Create API Gateway
         # Create API Gateway with CORS configuration
         api = apigateway.RestApi(
             self, "MochiBacktestApi",
             rest_api_name="Mochi Backtest Service",
             description="API for triggering backtest processes with ticker data",
+            deploy_options=apigateway.StageOptions(
+                stage_name="prod",
+                tracing_enabled=True,
+                throttling_rate_limit=api_rate_limit,
+                throttling_burst_limit=api_burst_limit,
+                # The cache cluster serves the idempotent GET endpoints; caching is enabled per method
+                cache_cluster_enabled=api_cache_enabled,
+                cache_cluster_size="0.5" if api_cache_enabled else None,
+                cache_ttl=Duration.seconds(DEFAULT_API_CACHE_TTL_SECONDS) if api_cache_enabled else None,
+                method_options=method_options
+            ),
             # Enable CORS at the API level
             default_cors_preflight_options = apigateway.CorsOptions(
-                allow_origins=[
-                    'https://master.d37eokvg7j9het.amplifyapp.com',
-                    'https://dashboard.minoko.life',
-                    'http://localhost:5173'
-                ],  # Specific allowed origins
-                allow_methods=['POST', 'OPTIONS'],
-                allow_headers=[
-                    'Content-Type',
-                    'Authorization',
-                    'X-Amz-Date',
-                    'X-Api-Key',
-                    'X-Amz-Security-Token',
-                ],
+                allow_origins=CORS_ALLOWED_ORIGINS,  # Specific allowed origins
+                allow_methods=['GET', 'POST', 'OPTIONS'],
+                allow_headers=CORS_ALLOWED_HEADERS,
                 allow_credentials=True,  # Can be True when using specific origins
                 max_age=Duration.seconds(300),  # How long the browser should cache preflight request results
             )
@@ -125,6 +386,50 @@ class MochiComputeStack(Stack):
         )
 
 
+        # Reject malformed bodies at the edge, before they reach (and cold-start) the Lambda
+        backtest_request_model = api.add_model(
+            "BacktestRequestModel",
+            content_type="application/json",
+            model_name="BacktestRequest",
+            schema=apigateway.JsonSchema(
+                schema=apigateway.JsonSchemaVersion.DRAFT4,
+                title="BacktestRequest",
+                **_json_schema_kwargs(BACKTEST_REQUEST_SCHEMA)
+            )
+        )
+
+        body_validator = api.add_request_validator(
+            "BacktestRequestValidator",
+            request_validator_name="backtest-body-validator",
+            validate_request_body=True,
+            validate_request_parameters=False
+        )
+
+        # Errors generated by API Gateway itself need CORS headers too, or the browser hides them. They carry
+        # credentials, so the origin is a fixed allowed one rather than whatever the request sent.
+        cors_error_origin = self.node.try_get_context("cors_error_origin") or DEFAULT_CORS_ERROR_ORIGIN
+        if cors_error_origin not in CORS_ALLOWED_ORIGINS:
+            raise ValueError(f"cors_error_origin '{cors_error_origin}' is not one of the allowed CORS origins")
+        cors_error_headers = {
+            "Access-Control-Allow-Origin": f"'{cors_error_origin}'",
+            "Access-Control-Allow-Credentials": "'true'"
+        }
+        for response_type in [apigateway.ResponseType.DEFAULT_4_XX, apigateway.ResponseType.DEFAULT_5_XX]:
+            api.add_gateway_response(
+                f"GatewayResponse{response_type.response_type}",
+                type=response_type,
+                response_headers=cors_error_headers
+            )
+
+        api.add_gateway_response(
+            "GatewayResponseBadRequestBody",
+            type=apigateway.ResponseType.BAD_REQUEST_BODY,
+            response_headers=cors_error_headers,
+            templates={
+                "application/json": '{"message": "Invalid request body", "errors": "$context.error.validationErrorString"}'
+            }
+        )
+
         # Create resource and method
         backtest_resource = api.root.add_resource("backtest")
 
@@ -137,9 +442,49 @@ class MochiComputeStack(Stack):
         backtest_resource.add_method(
             "POST", lambda_integration,
             authorizer=auth,  # Apply the Cognito authorizer
-            authorization_type=apigateway.AuthorizationType.COGNITO  #
+            authorization_type=apigateway.AuthorizationType.COGNITO,  #
+            request_models={"application/json": backtest_request_model},
+            request_validator=body_validator,
+            # Usage plans are only enforced when callers have to present an API key
+            api_key_required=bool(api_clients)
+        )
+
+        # Lightweight authorized route that returns before any work, used to benchmark the front doors
+        api.root.add_resource("ping").add_method(
+            "GET", lambda_integration,
+            authorizer=auth,
+            authorization_type=apigateway.AuthorizationType.COGNITO
         )
 
+        if query_function:
+            self._add_query_routes(api, auth, query_function)
+
+        # Per-client usage plans, e.g. context api_clients=[{"name": "dashboard", "rate_limit": 5, "burst_limit": 10}]
+        for client in api_clients:
+            if isinstance(client, str):
+                client = {"name": client}
+            client_name = client["name"]
+
+            api_key = api.add_api_key(
+                f"{client_name}ApiKey",
+                api_key_name=f"mochi-backtest-{client_name}"
+            )
+
+            usage_plan = api.add_usage_plan(
+                f"{client_name}UsagePlan",
+                name=f"mochi-backtest-{client_name}",
+                throttle=apigateway.ThrottleSettings(
+                    rate_limit=client.get("rate_limit", api_rate_limit),
+                    burst_limit=client.get("burst_limit", api_burst_limit)
+                ),
+                quota=apigateway.QuotaSettings(
+                    limit=client["quota_per_day"],
+                    period=apigateway.Period.DAY
+                ) if "quota_per_day" in client else None
+            )
+            usage_plan.add_api_stage(stage=api.deployment_stage)
+            usage_plan.add_api_key(api_key)
+
         # Add Lambda permission for API Gateway
         lambda_function.add_permission(
             id="ApiGatewayInvoke",
@@ -155,29 +500,260 @@ class MochiComputeStack(Stack):
             description="URL for triggering the backtest process"
         )
 
-        # Create Batch resources
-        batch_resources = MochiBatchResources(
-            self,
-            "MochiBatchResources",
-            max_vcpus=4,
-            compute_env_name="MochiFargate",
-            job_queue_name="fargateSpotTrades",
-            tags={
-                "Project": "Mochi",
-                "Environment": "QA"
-            }
+        return api
+
+    def _create_http_api(self, lambda_function, user_pool, user_pool_client, api_rate_limit: int,
+                         api_burst_limit: int):
+        """
+        Create the HTTP API front door with a JWT authorizer against the same user pool.
+
+        HTTP APIs have lower per-request latency and price than REST APIs but no request
+        validators or usage plans, so bodies are only validated inside the Lambda.
+        """
+        http_api = apigatewayv2.HttpApi(
+            self, "MochiBacktestHttpApi",
+            api_name="Mochi Backtest Service (HTTP)",
+            description="HTTP API for triggering backtest processes with ticker data",
+            cors_preflight=apigatewayv2.CorsPreflightOptions(
+                allow_origins=CORS_ALLOWED_ORIGINS,
+                allow_methods=[apigatewayv2.CorsHttpMethod.GET, apigatewayv2.CorsHttpMethod.POST,
+                               apigatewayv2.CorsHttpMethod.OPTIONS],
+                allow_headers=CORS_ALLOWED_HEADERS,
+                allow_credentials=True,
+                max_age=Duration.seconds(300)
+            )
+        )
+
+        default_stage = http_api.default_stage.node.default_child
+        default_stage.default_route_settings = apigatewayv2.CfnStage.RouteSettingsProperty(
+            throttling_rate_limit=api_rate_limit,
+            throttling_burst_limit=api_burst_limit
+        )
+
+        # JWT authorizer: issuer is the user pool, audience is the dashboard app client
+        auth = apigatewayv2_authorizers.HttpUserPoolAuthorizer(
+            "MochiHttpApiAuthorizer",
+            user_pool,
+            user_pool_clients=[user_pool_client] if user_pool_client else None
+        )
+
+        lambda_integration = apigatewayv2_integrations.HttpLambdaIntegration(
+            "BacktestHttpIntegration",
+            lambda_function,
+            payload_format_version=apigatewayv2.PayloadFormatVersion.VERSION_2_0
+        )
+
+        http_api.add_routes(
+            path="/backtest",
+            methods=[apigatewayv2.HttpMethod.POST],
+            integration=lambda_integration,
+            authorizer=auth
+        )
+
+        http_api.add_routes(
+            path="/ping",
+            methods=[apigatewayv2.HttpMethod.GET],
+            integration=lambda_integration,
+            authorizer=auth
         )
 
-        # Output Batch resource ARNs using property methods for consistency
         CfnOutput(
-            self,
-            "BatchComputeEnvironmentArn",
-            value=batch_resources.compute_environment_arn,
-            description="ARN of the AWS Batch Compute Environment"
+            self, "HttpApiEndpoint",
+            value=f"{http_api.api_endpoint}/backtest",
+            description="URL for triggering the backtest process through the HTTP API"
         )
 
+        return http_api
+
+    def _create_query_function(self, ranking_bucket_name: str = None, live_trades_bucket_name: str = None,
+                               backtest_params_bucket_name: str = None, run_catalog_table=None):
+        """Create the read-only Lambda behind the /query routes, with read access to the datasets it serves."""
+        query_function = _lambda.Function(
+            self, "QueryApiFunction",
+            runtime=_lambda.Runtime.PYTHON_3_13,
+            code=_lambda.Code.from_asset("lambda"),
+            handler="query_api.handler",
+            timeout=Duration.seconds(29),
+            # Parsed ranking objects stay in memory between invocations of a warm container
+            memory_size=1024,
+            tracing=_lambda.Tracing.ACTIVE,
+            environment={
+                "RANKING_BUCKET": ranking_bucket_name or "",
+                "LIVE_TRADES_BUCKET": live_trades_bucket_name or "",
+                "BACKTEST_PARAMS_BUCKET": backtest_params_bucket_name or "",
+                "RUN_CATALOG_TABLE": run_catalog_table.table_name if run_catalog_table else "",
+                "CORS_ALLOWED_ORIGINS": ",".join(CORS_ALLOWED_ORIGINS)
+            }
+        )
+
+        for construct_id, bucket_name in [("QueryRankingBucket", ranking_bucket_name),
+                                          ("QueryLiveTradesBucket", live_trades_bucket_name),
+                                          ("QueryBacktestParamsBucket", backtest_params_bucket_name)]:
+            if bucket_name:
+                s3.Bucket.from_bucket_name(self, construct_id, bucket_name).grant_read(query_function)
+
+        if run_catalog_table:
+            run_catalog_table.grant_read_data(query_function)
+
+        return query_function
+
+    def _add_query_routes(self, api, auth, query_function):
+        """
+        Add the cached GET /query routes to the REST API.
+
+        The Authorization header is part of every cache key, so a cached page is only ever
+        served back to the user it was built for.
+        """
+        query_resource = api.root.add_resource("query")
+
+        for route in QUERY_ROUTE_CACHE_TTL_SECONDS:
+            resource = query_resource
+            for part in route.split("/")[2:]:
+                resource = resource.get_resource(part) or resource.add_resource(part)
+
+            cache_key_parameters = ["method.request.header.Authorization"]
+            cache_key_parameters += [f"method.request.path.{part[1:-1]}" for part in route.split("/") if
+                                     part.startswith("{")]
+            cache_key_parameters += [f"method.request.querystring.{name}" for name in QUERY_STRING_PARAMETERS]
+
+            resource.add_method(
+                "GET",
+                apigateway.LambdaIntegration(query_function, proxy=True, cache_key_parameters=cache_key_parameters),
+                authorizer=auth,
+                authorization_type=apigateway.AuthorizationType.COGNITO,
+                request_parameters={parameter: parameter.startswith("method.request.path.")
+                                    for parameter in cache_key_parameters}
+            )
+
         CfnOutput(
-            self, "BatchJobQueueArn",
-            value=batch_resources.job_queue_arn,
-            description="ARN of the AWS Batch Job Queue"
+            self, "QueryApiEndpoint",
+            value=f"{api.url}query",
+            description="Base URL of the read-only query API"
+        )
+
+    def _create_admission_control(self, lambda_function, admission_table_name: str, job_queue_arns):
+        """
+        Cap in-flight pipelines per tier and per user, holding excess requests in FIFO queues.
+
+        The launcher admits or holds each request and also drains the holding queues on a schedule,
+        so held runs are launched with exactly the same configuration as direct ones.
+        """
+        admission_table = dynamodb.Table.from_table_name(self, "ImportedAdmissionTable", admission_table_name)
+        admission_table.grant_read_write_data(lambda_function)
+
+        lambda_function.add_environment("ADMISSION_TABLE", admission_table_name)
+        lambda_function.add_environment("ADMISSION_MAX_IN_FLIGHT_INTERACTIVE",
+                                        str(self.node.try_get_context("admission_max_interactive") or 2))
+        lambda_function.add_environment("ADMISSION_MAX_IN_FLIGHT_BATCH",
+                                        str(self.node.try_get_context("admission_max_batch") or 4))
+        lambda_function.add_environment("ADMISSION_MAX_PER_USER",
+                                        str(self.node.try_get_context("admission_max_per_user") or 2))
+
+        for tier in ("interactive", "batch"):
+            holding_queue = sqs.Queue(
+                self, f"{tier.capitalize()}HoldingQueue",
+                queue_name=f"mochi-backtest-holding-{tier}.fifo",
+                fifo=True,
+                retention_period=Duration.days(4),
+                # Longer than the drain's receive timeout, which is what actually hides in-progress messages
+                visibility_timeout=Duration.minutes(5)
+            )
+            holding_queue.grant_send_messages(lambda_function)
+            holding_queue.grant_consume_messages(lambda_function)
+            lambda_function.add_environment(f"HOLDING_QUEUE_{tier.upper()}_URL", holding_queue.queue_url)
+
+        events.Rule(
+            self, "AdmissionDrainSchedule",
+            schedule=events.Schedule.rate(Duration.minutes(1)),
+            targets=[targets.LambdaFunction(
+                lambda_function, event=events.RuleTargetInput.from_object({"action": "drain-holding-queues"}))]
+        )
+
+        # Track every job of an admitted pipeline, including the ones data-metadata submits, and free the
+        # pipeline's slots when any of them fails. The drain releases pipelines whose jobs have all succeeded.
+        admission_release_function = _lambda.Function(
+            self, "AdmissionReleaseFunction",
+            runtime=_lambda.Runtime.PYTHON_3_13,
+            code=_lambda.Code.from_asset("lambda"),
+            handler="admission_release.handler",
+            timeout=Duration.seconds(30),
+            environment={
+                "ADMISSION_TABLE": admission_table_name
+            }
+        )
+        admission_table.grant_read_write_data(admission_release_function)
+        events.Rule(
+            self, "AdmissionJobStateChangeRule",
+            event_pattern=events.EventPattern(
+                source=["aws.batch"],
+                detail_type=["Batch Job State Change"],
+                detail={
+                    "jobQueue": job_queue_arns,
+                    "status": ["SUBMITTED", "SUCCEEDED", "FAILED"]
+                }
+            ),
+            targets=[targets.LambdaFunction(admission_release_function)]
         )
+
+    def _create_ranking_index(self, ranking_bucket_name: str):
+        """Maintain pre-sorted top-N leaderboards in the ranking bucket as ranking objects are written."""
+        ranking_bucket = s3.Bucket.from_bucket_name(self, "ImportedFinalTraderRankingBucket", ranking_bucket_name)
+
+        ranking_index_function = _lambda.Function(
+            self, "RankingIndexFunction",
+            runtime=_lambda.Runtime.PYTHON_3_13,
+            code=_lambda.Code.from_asset("lambda"),
+            handler="ranking_index.handler",
+            timeout=Duration.minutes(2),
+            memory_size=512,
+            # One writer at a time, so concurrent ranking objects never race on the same leaderboard
+            reserved_concurrent_executions=1,
+            environment={
+                "RANKING_BUCKET": ranking_bucket_name,
+                "LEADERBOARD_TOP_N": str(self.node.try_get_context("leaderboard_top_n") or 50)
+            }
+        )
+        ranking_bucket.grant_read_write(ranking_index_function)
+
+        events.Rule(
+            self, "RankingObjectCreatedRule",
+            event_pattern=events.EventPattern(
+                source=["aws.s3"],
+                detail_type=["Object Created", "Object Deleted"],
+                detail={
+                    "bucket": {"name": [ranking_bucket_name]},
+                    # The index's own writes must not trigger it again
+                    "object": {"key": events.Match.anything_but_prefix("leaderboards/")}
+                }
+            ),
+            targets=[targets.LambdaFunction(ranking_index_function, retry_attempts=4)]
+        )
+
+
+def _json_schema_kwargs(schema: dict) -> dict:
+    """Convert a plain JSON schema dict into keyword arguments for apigateway.JsonSchema."""
+    types = {
+        "object": apigateway.JsonSchemaType.OBJECT,
+        "string": apigateway.JsonSchemaType.STRING,
+        "number": apigateway.JsonSchemaType.NUMBER,
+        "integer": apigateway.JsonSchemaType.INTEGER,
+        "boolean": apigateway.JsonSchemaType.BOOLEAN,
+        "array": apigateway.JsonSchemaType.ARRAY
+    }
+
+    kwargs = {}
+    for key, value in schema.items():
+        if key == "type":
+            kwargs["type"] = [types[t] for t in value] if isinstance(value, list) else types[value]
+        elif key == "properties":
+            kwargs["properties"] = {name: apigateway.JsonSchema(**_json_schema_kwargs(prop))
+                                    for name, prop in value.items()}
+        elif key == "minLength":
+            kwargs["min_length"] = value
+        elif key == "maxLength":
+            kwargs["max_length"] = value
+        elif key == "enum":
+            kwargs["enum"] = value
+        else:
+            kwargs[key] = value
+    return kwargs
@@ -57,7 +57,7 @@ class MochiDashboardStack(Stack):
         )
 
         # Create a Cognito User Pool Client
-        client = self.user_pool.add_client(
+        client = self.user_pool_client = self.user_pool.add_client(
             "MochiDashboardClient",
             auth_flows=cognito.AuthFlow(
                 user_password=True,
@@ -180,6 +180,14 @@ class MochiDashboardStack(Stack):
             )
         )
 
+        # Buckets the dashboard reads directly. Rankings, live trades and params are also served by the
+        # query API on the backtest REST API; once the dashboard uses it, deploy with
+        # -c dashboard_direct_s3_access=false to withdraw the raw bucket access.
+        dashboard_buckets = ["mochi-prod-portfolio-tracking"]
+        if str(self.node.try_get_context("dashboard_direct_s3_access") or "true").lower() == "true":
+            dashboard_buckets += ["mochi-prod-final-trader-ranking", "mochi-prod-live-trades",
+                                  "mochi-prod-backtest-params"]
+
         # Add S3 read permissions to the authenticated role
         authenticated_role.add_to_policy(
             iam.PolicyStatement(
@@ -190,17 +198,8 @@ class MochiDashboardStack(Stack):
                     "s3:ListBucketVersions",
                     "s3:GetObjectVersion"
                 ],
-                resources=[
-                    # Replace with your specific bucket ARN
-                    "arn:aws:s3:::mochi-prod-final-trader-ranking",
-                    "arn:aws:s3:::mochi-prod-final-trader-ranking/*",
-                    "arn:aws:s3:::mochi-prod-live-trades",
-                    "arn:aws:s3:::mochi-prod-live-trades/*",
-                    "arn:aws:s3:::mochi-prod-portfolio-tracking",
-                    "arn:aws:s3:::mochi-prod-portfolio-tracking/*",
-                    "arn:aws:s3:::mochi-prod-backtest-params",
-                    "arn:aws:s3:::mochi-prod-backtest-params/*"
-                ]
+                resources=[arn for bucket in dashboard_buckets
+                           for arn in (f"arn:aws:s3:::{bucket}", f"arn:aws:s3:::{bucket}/*")]
             )
         )
 
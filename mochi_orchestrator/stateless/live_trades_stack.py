@@ -0,0 +1,75 @@
+from aws_cdk import (
+    Stack,
+    Duration,
+    aws_cloudwatch as cloudwatch,
+    aws_lambda as _lambda,
+    aws_s3 as s3,
+    aws_events as events,
+    aws_events_targets as targets,
+    CfnOutput
+)
+from constructs import Construct
+
+
+class LiveTradesStack(Stack):
+    """
+    Stack that maintains the delta/manifest layout of the live trades bucket.
+
+    Writers append small immutable delta objects and register them in a per-stream manifest.
+    A scheduled Lambda periodically folds the deltas into snapshots so the manifests stay small.
+    """
+
+    def __init__(self, scope: Construct, construct_id: str, bucket_name: str,
+                 compaction_interval_minutes: int = 15,
+                 compact_min_deltas: int = 50,
+                 compact_max_delta_age_minutes: int = 60,
+                 **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        live_trades_bucket = s3.Bucket.from_bucket_name(self, "ImportedLiveTradesBucket", bucket_name)
+
+        compactor_function = _lambda.Function(
+            self, "LiveTradesCompactorFunction",
+            runtime=_lambda.Runtime.PYTHON_3_13,
+            code=_lambda.Code.from_asset("lambda"),
+            handler="live_trades_compactor.handler",
+            timeout=Duration.minutes(5),
+            memory_size=512,
+            environment={
+                "LIVE_TRADES_BUCKET": bucket_name,
+                "COMPACT_MIN_DELTAS": str(compact_min_deltas),
+                "COMPACT_MAX_DELTA_AGE_MINUTES": str(compact_max_delta_age_minutes)
+            }
+        )
+
+        live_trades_bucket.grant_read_write(compactor_function)
+        live_trades_bucket.grant_delete(compactor_function)
+
+        rule = events.Rule(
+            self, "LiveTradesCompactionScheduleRule",
+            schedule=events.Schedule.rate(Duration.minutes(compaction_interval_minutes))
+        )
+        rule.add_target(targets.LambdaFunction(compactor_function))
+
+        # Compaction also deletes the deltas it folded, so a stream that keeps failing keeps its deltas
+        # until the 30-day orphan expiration; alarm long before that
+        compaction_alarm = cloudwatch.Alarm(
+            self, "LiveTradesCompactionFailingAlarm",
+            metric=compactor_function.metric_errors(period=Duration.minutes(compaction_interval_minutes)),
+            threshold=1,
+            evaluation_periods=4,
+            comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_OR_EQUAL_TO_THRESHOLD,
+            treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+            alarm_description="Live trade compaction has failed for an hour; deltas are not being compacted"
+        )
+
+        CfnOutput(
+            self, "CompactorFunctionName",
+            value=compactor_function.function_name,
+            description="Name of the Lambda that compacts live trade deltas into snapshots"
+        )
+        CfnOutput(
+            self, "CompactionAlarmName",
+            value=compaction_alarm.alarm_name,
+            description="Name of the alarm that fires when live trade compaction keeps failing"
+        )
@@ -1,4 +1,5 @@
 import os
+from typing import List, Optional
 
 from aws_cdk import (
     Stack,
@@ -6,17 +7,40 @@ from aws_cdk import (
     aws_ecs as ecs,
     aws_ec2 as ec2,
     aws_iam as iam,
+    aws_lambda as _lambda,
     aws_events as events,
     aws_events_targets as targets,
+    aws_stepfunctions as sfn,
+    aws_stepfunctions_tasks as tasks,
     CfnOutput
 )
 from constructs import Construct
 
+PORTFOLIO_TRACKING_BUCKET = "mochi-prod-portfolio-tracking"
+
+# Optional config object in the tracking bucket, e.g. {"ciks": ["1067983", "1336528"]}.
+# When it is missing the CIK list from the "portfolio_tracker_ciks" context is used instead.
+CIK_CONFIG_KEY = "config/ciks.json"
+
+DEFAULT_CIKS = ["1067983"]
+DEFAULT_MAX_CONCURRENCY = 10
+
 
 class PortfolioTrackerStack(Stack):
-    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str,
+                 ciks: Optional[List[str]] = None,
+                 max_concurrency: Optional[int] = None,
+                 **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        if ciks is None:
+            ciks = self.node.try_get_context("portfolio_tracker_ciks") or DEFAULT_CIKS
+            if isinstance(ciks, str):
+                ciks = [cik.strip() for cik in ciks.split(",") if cik.strip()]
+        if max_concurrency is None:
+            max_concurrency = int(self.node.try_get_context("portfolio_tracker_max_concurrency")
+                                  or DEFAULT_MAX_CONCURRENCY)
+
         # Create a VPC for the ECS tasks
         vpc = ec2.Vpc(
             self, "PortfolioTrackerVpc",
@@ -48,39 +72,231 @@ class PortfolioTrackerStack(Stack):
             iam.PolicyStatement(
                 actions=["s3:*"],
                 resources=[
-                    "arn:aws:s3:::mochi-prod-portfolio-tracking",
-                    "arn:aws:s3:::mochi-prod-portfolio-tracking/*"
+                    f"arn:aws:s3:::{PORTFOLIO_TRACKING_BUCKET}",
+                    f"arn:aws:s3:::{PORTFOLIO_TRACKING_BUCKET}/*"
                 ],
                 effect=iam.Effect.ALLOW
             )
         )
 
-        # Add container to the task definition
+        # Add container to the task definition. The command is overridden per CIK by the state machine.
         container = task_definition.add_container(
             "PortfolioTrackerContainer",
             image=ecs.ContainerImage.from_registry("registry.gitlab.com/whumphreys/portfolio-tracker/main:latest"),
             logging=ecs.LogDrivers.aws_logs(stream_prefix="portfolio-tracker"),
             environment={
-                "S3_BUCKET_NAME": "mochi-prod-portfolio-tracking"
+                "S3_BUCKET_NAME": PORTFOLIO_TRACKING_BUCKET
             },
             command=[
-                "--cik", "1067983",
+                "--cik", ciks[0],
                 "--which", "latest",
                 "--email", "test@test.com",
                 "--name", "test"
             ]
         )
 
-        # Create a scheduled Fargate task
-        scheduled_task = targets.EcsTask(
+        # Read the CIK list from the config object, falling back to the list from context
+        load_cik_config = tasks.CallAwsService(
+            self, "LoadCikConfig",
+            service="s3",
+            action="getObject",
+            parameters={
+                "Bucket": PORTFOLIO_TRACKING_BUCKET,
+                "Key": CIK_CONFIG_KEY
+            },
+            iam_resources=[f"arn:aws:s3:::{PORTFOLIO_TRACKING_BUCKET}/{CIK_CONFIG_KEY}"],
+            result_selector={
+                "config.$": "States.StringToJson($.Body)"
+            },
+            result_path="$.loaded"
+        )
+
+        use_context_ciks = sfn.Pass(
+            self, "UseContextCiks",
+            result=sfn.Result.from_object({"config": {"ciks": ciks}}),
+            result_path="$.loaded"
+        )
+
+        load_cik_config.add_catch(use_context_ciks, errors=["States.ALL"], result_path="$.configError")
+
+        # Cheap per-CIK pre-check against the watermark of the last processed filing
+        watermark_environment = {
+            "PORTFOLIO_TRACKING_BUCKET": PORTFOLIO_TRACKING_BUCKET,
+            "SEC_USER_AGENT": "mochi-portfolio-tracker test@test.com"
+        }
+
+        check_function = _lambda.Function(
+            self, "PortfolioWatermarkCheckFunction",
+            runtime=_lambda.Runtime.PYTHON_3_13,
+            code=_lambda.Code.from_asset("lambda"),
+            handler="portfolio_watermark.check_handler",
+            timeout=Duration.seconds(30),
+            environment=watermark_environment
+        )
+
+        update_function = _lambda.Function(
+            self, "PortfolioWatermarkUpdateFunction",
+            runtime=_lambda.Runtime.PYTHON_3_13,
+            code=_lambda.Code.from_asset("lambda"),
+            handler="portfolio_watermark.update_handler",
+            timeout=Duration.seconds(30),
+            environment=watermark_environment
+        )
+
+        watermark_resources = [f"arn:aws:s3:::{PORTFOLIO_TRACKING_BUCKET}/watermarks/*"]
+        check_function.add_to_role_policy(iam.PolicyStatement(
+            actions=["s3:GetObject"],
+            resources=watermark_resources
+        ))
+        # ListBucket lets a missing watermark surface as NoSuchKey instead of AccessDenied
+        check_function.add_to_role_policy(iam.PolicyStatement(
+            actions=["s3:ListBucket"],
+            resources=[f"arn:aws:s3:::{PORTFOLIO_TRACKING_BUCKET}"]
+        ))
+        update_function.add_to_role_policy(iam.PolicyStatement(
+            actions=["s3:PutObject"],
+            resources=watermark_resources
+        ))
+
+        check_for_new_filing = tasks.LambdaInvoke(
+            self, "CheckForNewFiling",
+            lambda_function=check_function,
+            payload=sfn.TaskInput.from_object({"cik.$": "$.cik"}),
+            payload_response_only=True,
+            retry_on_service_exceptions=True,
+            result_path="$.check"
+        )
+
+        update_watermark = tasks.LambdaInvoke(
+            self, "UpdateWatermark",
+            lambda_function=update_function,
+            payload=sfn.TaskInput.from_object({
+                "cik.$": "$.cik",
+                "to_accession.$": "$.check.to_accession"
+            }),
+            payload_response_only=True,
+            retry_on_service_exceptions=True,
+            result_path=sfn.JsonPath.DISCARD
+        )
+
+        # Each CIK reports only a status so the collected Map output stays well under the 256 KB state limit
+        no_new_filing = sfn.Pass(
+            self, "NoNewFiling",
+            parameters={
+                "cik.$": "$.cik",
+                "status": "unchanged"
+            }
+        )
+        cik_tracked = sfn.Pass(
+            self, "CikTracked",
+            parameters={
+                "cik.$": "$.cik",
+                "status": "tracked"
+            }
+        )
+
+        # Run one tracker task per CIK with new filings, each writing under its own prefix
+        track_cik = tasks.EcsRunTask(
+            self, "TrackCik",
+            integration_pattern=sfn.IntegrationPattern.RUN_JOB,
             cluster=cluster,
             task_definition=task_definition,
-            subnet_selection=ec2.SubnetSelection(
+            launch_target=tasks.EcsFargateLaunchTarget(
+                platform_version=ecs.FargatePlatformVersion.LATEST
+            ),
+            assign_public_ip=True,
+            subnets=ec2.SubnetSelection(
                 subnet_type=ec2.SubnetType.PUBLIC
+            ),
+            container_overrides=[
+                tasks.ContainerOverride(
+                    container_definition=container,
+                    command=sfn.JsonPath.list_at("$.command"),
+                    environment=[
+                        tasks.TaskEnvironmentVariable(
+                            name="S3_PREFIX",
+                            value=sfn.JsonPath.format("ciks/{}/", sfn.JsonPath.string_at("$.cik"))
+                        ),
+                        tasks.TaskEnvironmentVariable(
+                            name="FROM_ACCESSION",
+                            value=sfn.JsonPath.string_at("$.check.from_accession")
+                        ),
+                        tasks.TaskEnvironmentVariable(
+                            name="TO_ACCESSION",
+                            value=sfn.JsonPath.string_at("$.check.to_accession")
+                        ),
+                        tasks.TaskEnvironmentVariable(
+                            name="NEW_ACCESSIONS",
+                            value=sfn.JsonPath.string_at("$.check.new_accessions")
+                        )
+                    ]
+                )
+            ],
+            result_path=sfn.JsonPath.DISCARD
+        )
+
+        track_cik.add_retry(
+            errors=["ECS.AmazonECSException", "ECS.ClientException"],
+            interval=Duration.seconds(30),
+            max_attempts=3,
+            backoff_rate=2
+        )
+
+        # A failing CIK is recorded in the output instead of failing the whole run; only the error name is
+        # kept because an ECS failure cause carries the whole task description
+        record_failure = sfn.Pass(
+            self, "RecordCikFailure",
+            parameters={
+                "cik.$": "$.cik",
+                "status": "failed",
+                "error.$": "$.error.Error"
+            }
+        )
+        # The watermark Lambdas retry Lambda service errors and throttling; anything else (a bad watermark,
+        # an S3 error in the function) fails only their CIK, like a failing tracker task
+        for watermark_task in (check_for_new_filing, update_watermark):
+            watermark_task.add_retry(
+                errors=["Lambda.TooManyRequestsException"],
+                interval=Duration.seconds(2),
+                max_attempts=6,
+                backoff_rate=2
+            )
+            watermark_task.add_catch(record_failure, errors=["States.ALL"], result_path="$.error")
+        track_cik.add_catch(record_failure, errors=["States.ALL"], result_path="$.error")
+
+        track_all_ciks = sfn.Map(
+            self, "TrackAllCiks",
+            items_path="$.loaded.config.ciks",
+            max_concurrency=max_concurrency,
+            item_selector={
+                "cik.$": "$$.Map.Item.Value",
+                "command": sfn.JsonPath.array(
+                    "--cik", sfn.JsonPath.string_at("$$.Map.Item.Value"),
+                    "--which", "latest",
+                    "--email", "test@test.com",
+                    "--name", "test"
+                )
+            },
+            result_path="$.results"
+        )
+        track_all_ciks.item_processor(
+            check_for_new_filing.next(
+                sfn.Choice(self, "HasNewFiling")
+                .when(sfn.Condition.boolean_equals("$.check.changed", True), track_cik.next(update_watermark).next(cik_tracked))
+                .otherwise(no_new_filing)
             )
         )
 
-        # Create EventBridge rule to schedule the task
+        definition = load_cik_config.next(track_all_ciks)
+        use_context_ciks.next(track_all_ciks)
+
+        state_machine = sfn.StateMachine(
+            self, "PortfolioTrackerStateMachine",
+            definition_body=sfn.DefinitionBody.from_chainable(definition),
+            timeout=Duration.hours(6)
+        )
+
+        # Create EventBridge rule to schedule the fan-out
         rule = events.Rule(
             self, "PortfolioTrackerScheduleRule",
             schedule=events.Schedule.cron(
@@ -92,8 +308,8 @@ class PortfolioTrackerStack(Stack):
             )
         )
 
-        # Add the ECS task as a target for the rule
-        rule.add_target(scheduled_task)
+        # Add the state machine as a target for the rule
+        rule.add_target(targets.SfnStateMachine(state_machine))
 
         # Output the task ARN
         CfnOutput(
@@ -102,6 +318,13 @@ class PortfolioTrackerStack(Stack):
             description="ARN of the ECS Task Definition"
         )
 
+        # Output the state machine ARN
+        CfnOutput(
+            self, "StateMachineArn",
+            value=state_machine.state_machine_arn,
+            description="ARN of the Step Functions state machine that fans out over the CIK list"
+        )
+
         # Output the schedule rule ARN
         CfnOutput(
             self, "ScheduleRuleArn",
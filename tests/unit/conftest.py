@@ -0,0 +1,26 @@
+import os
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+# The Lambda modules import each other by top-level name, as they do in the Lambda runtime
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lambda'))
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """Mocked AWS in a fixed region, with fake credentials so nothing can reach a real account."""
+    for name, value in {'AWS_DEFAULT_REGION': 'us-east-1', 'AWS_ACCESS_KEY_ID': 'testing',
+                        'AWS_SECRET_ACCESS_KEY': 'testing', 'AWS_SESSION_TOKEN': 'testing'}.items():
+        monkeypatch.setenv(name, value)
+    with mock_aws():
+        yield
+
+
+@pytest.fixture
+def s3_bucket(aws):
+    """An empty S3 bucket."""
+    boto3.client('s3').create_bucket(Bucket='mochi-test-bucket')
+    return 'mochi-test-bucket'
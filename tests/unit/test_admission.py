@@ -0,0 +1,97 @@
+import boto3
+import pytest
+
+import admission
+
+TABLE_NAME = 'mochi-test-admission'
+
+
+@pytest.fixture
+def table(aws, monkeypatch):
+    monkeypatch.setenv('ADMISSION_TABLE', TABLE_NAME)
+    monkeypatch.setenv('ADMISSION_MAX_IN_FLIGHT_BATCH', '2')
+    monkeypatch.setenv('ADMISSION_MAX_PER_USER', '1')
+    client = boto3.client('dynamodb')
+    client.create_table(TableName=TABLE_NAME, KeySchema=[{'AttributeName': 'scope', 'KeyType': 'HASH'}],
+                        AttributeDefinitions=[{'AttributeName': 'scope', 'AttributeType': 'S'}],
+                        BillingMode='PAY_PER_REQUEST')
+    return client
+
+
+def in_flight(client, scope):
+    item = client.get_item(TableName=TABLE_NAME, Key={'scope': {'S': scope}}).get('Item', {})
+    return int(item.get('in_flight', {}).get('N', 0))
+
+
+def test_try_admit_caps_users_and_tiers(table):
+    assert admission.try_admit('run-1', 'alice', 'batch') == (True, None)
+    assert admission.try_admit('run-2', 'alice', 'batch') == (False, 'user')
+    assert admission.try_admit('run-3', 'bob', 'batch') == (True, None)
+    assert admission.try_admit('run-4', 'carol', 'batch') == (False, 'tier')
+    assert in_flight(table, 'TIER#batch') == 2
+
+
+def test_new_requests_queue_behind_requests_held_for_the_tier(table):
+    admission.change_queued('alice', 'batch', 1, tier_held=True)
+
+    assert admission.try_admit('run-1', 'bob', 'batch') == (False, 'tier')
+    assert admission.try_admit('run-1', 'alice', 'batch', held=True) == (True, None)
+
+
+def test_requests_held_for_their_user_do_not_block_other_users(table):
+    admission.change_queued('alice', 'batch', 1)
+
+    assert admission.try_admit('run-1', 'bob', 'batch') == (True, None)
+
+    admission.change_queued('alice', 'batch', 1, tier_held=True)
+    admission.change_queued('alice', 'batch', -1, tier_held=True)
+    assert admission.try_admit('run-2', 'carol', 'batch') == (True, None)
+
+
+def test_replayed_admission_is_only_launched_once(table):
+    assert admission.try_admit('run-1', 'alice', 'batch', held=True) == (True, None)
+    assert admission.try_admit('run-1', 'alice', 'batch', held=True) == (True, None)
+
+    admission.mark_launched('run-1')
+
+    assert admission.try_admit('run-1', 'alice', 'batch', held=True) == (False, 'launched')
+    assert in_flight(table, 'TIER#batch') == 1
+
+
+def test_release_frees_slots_exactly_once(table):
+    admission.try_admit('run-1', 'alice', 'batch', now=1000)
+
+    assert admission.release('run-1', succeeded=True, now=1600)
+    assert not admission.release('run-1', succeeded=False, now=1700)
+    assert in_flight(table, 'TIER#batch') == 0
+    assert in_flight(table, 'USER#alice') == 0
+
+
+def test_run_finishes_once_every_job_has_succeeded(table, monkeypatch):
+    monkeypatch.setenv('ADMISSION_SETTLE_SECONDS', '60')
+    admission.try_admit('run-1', 'alice', 'batch', now=1000)
+    admission.track_job('run-1', 'meta', 'SUBMITTED', now=1000)
+    admission.track_job('run-1', 'meta', 'SUCCEEDED', now=1100)
+    assert admission.finished_leases(now=1200) == ['run-1']
+
+    # data-metadata's downstream job is reported late, so the run is not finished yet
+    admission.track_job('run-1', 'trades', 'SUBMITTED', now=1200)
+    assert admission.finished_leases(now=1300) == []
+
+    admission.track_job('run-1', 'trades', 'SUCCEEDED', now=1300)
+    assert admission.finished_leases(now=1330) == []
+    assert admission.finished_leases(now=1400) == ['run-1']
+
+
+def test_out_of_order_submitted_event_does_not_reopen_a_job(table):
+    admission.try_admit('run-1', 'alice', 'batch', now=1000)
+    admission.track_job('run-1', 'meta', 'SUCCEEDED', now=1000)
+    admission.track_job('run-1', 'meta', 'SUBMITTED', now=1000)
+
+    assert admission.finished_leases(now=2000) == ['run-1']
+
+
+def test_track_job_ignores_runs_without_a_lease(table):
+    admission.track_job('unknown', 'job', 'SUBMITTED')
+
+    assert 'Item' not in table.get_item(TableName=TABLE_NAME, Key={'scope': {'S': 'LEASE#unknown'}})
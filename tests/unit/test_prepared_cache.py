@@ -0,0 +1,65 @@
+import datetime
+
+import boto3
+import pytest
+
+import prepared_cache
+
+PREFIX = 'cache/0123456789abcdef'
+
+
+@pytest.fixture
+def later():
+    return datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=2)
+
+
+def test_only_one_run_claims_a_prefix(s3_bucket):
+    assert prepared_cache.claim_cache_prefix(s3_bucket, PREFIX, 'run-1')
+    assert not prepared_cache.claim_cache_prefix(s3_bucket, PREFIX, 'run-2')
+
+
+def test_expired_claim_is_kept_while_its_owner_still_runs(s3_bucket, later):
+    prepared_cache.claim_cache_prefix(s3_bucket, PREFIX, 'run-1')
+
+    assert not prepared_cache.claim_cache_prefix(s3_bucket, PREFIX, 'run-2', now=later,
+                                                 is_active=lambda run_id: run_id == 'run-1')
+
+
+def test_expired_claim_of_a_finished_owner_is_taken_over(s3_bucket, later):
+    prepared_cache.claim_cache_prefix(s3_bucket, PREFIX, 'run-1')
+
+    assert prepared_cache.claim_cache_prefix(s3_bucket, PREFIX, 'run-2', now=later, is_active=lambda run_id: False)
+    assert not prepared_cache.claim_cache_prefix(s3_bucket, PREFIX, 'run-3')
+
+
+def test_claim_is_taken_over_after_the_maximum_age_even_if_its_owner_looks_active(s3_bucket):
+    prepared_cache.claim_cache_prefix(s3_bucket, PREFIX, 'run-1')
+    much_later = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=2)
+
+    assert prepared_cache.claim_cache_prefix(s3_bucket, PREFIX, 'run-2', now=much_later, is_active=lambda run_id: True)
+
+
+def test_run_is_active_reads_the_run_catalog(aws):
+    table = boto3.resource('dynamodb').create_table(
+        TableName='mochi-test-run-catalog', KeySchema=[{'AttributeName': 'run_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'run_id', 'AttributeType': 'S'}], BillingMode='PAY_PER_REQUEST')
+    table.put_item(Item={'run_id': 'running', 'status': 'RUNNING'})
+    table.put_item(Item={'run_id': 'done', 'status': 'SUCCEEDED'})
+
+    assert prepared_cache.run_is_active('running', table)
+    assert not prepared_cache.run_is_active('done', table)
+    assert not prepared_cache.run_is_active('unknown', table)
+
+
+def test_raw_data_is_copied_from_the_prefix_its_pointer_names(s3_bucket):
+    s3_client = boto3.client('s3')
+    raw_key = prepared_cache.raw_cache_key('AAPL', 'polygon', '2024-01-01', '2024-02-01')
+    keys = [f"cache/other/AAPL/polygon/AAPL_polygon_{timeframe}.csv.lzo" for timeframe in ('min', 'hour', 'day')]
+    assert not prepared_cache.reuse_raw_data(s3_bucket, raw_key, 'cache/other', keys)
+
+    prepared_cache.record_raw_data(s3_bucket, raw_key, PREFIX)
+    for key in keys:
+        s3_client.put_object(Bucket=s3_bucket, Key=PREFIX + key[len('cache/other'):], Body=b'bars')
+
+    assert prepared_cache.reuse_raw_data(s3_bucket, raw_key, 'cache/other', keys)
+    assert all(s3_client.head_object(Bucket=s3_bucket, Key=key) for key in keys)
@@ -0,0 +1,130 @@
+import json
+
+import boto3
+import pytest
+
+import query_api
+from run_catalog import catalog_item
+
+TABLE_NAME = 'mochi-test-run-catalog'
+
+# Same indexes as RUN_CATALOG_INDEXES in the storage stack, all sorted by run_id
+INDEXES = {'ticker-index': 'ticker', 'user-index': 'user_id', 'user-ticker-index': 'user_ticker',
+           'submitted-date-index': 'submitted_date'}
+
+
+@pytest.fixture
+def catalog(aws, monkeypatch):
+    monkeypatch.setenv('RUN_CATALOG_TABLE', TABLE_NAME)
+    table = boto3.resource('dynamodb').create_table(
+        TableName=TABLE_NAME, KeySchema=[{'AttributeName': 'run_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'run_id', 'AttributeType': 'S'}] +
+                             [{'AttributeName': attribute, 'AttributeType': 'S'} for attribute in INDEXES.values()],
+        GlobalSecondaryIndexes=[{'IndexName': name, 'Projection': {'ProjectionType': 'ALL'},
+                                 'KeySchema': [{'AttributeName': attribute, 'KeyType': 'HASH'},
+                                               {'AttributeName': 'run_id', 'KeyType': 'RANGE'}]}
+                                for name, attribute in INDEXES.items()],
+        BillingMode='PAY_PER_REQUEST')
+    for run_id, user_id, ticker in [('20250101090000000-fig-cat-aaaaaaaa', 'alice', 'AAPL'),
+                                    ('20250101100000000-fig-dog-bbbbbbbb', 'alice', 'MSFT'),
+                                    ('20250102090000000-kiwi-yak-cccccccc', 'alice', 'AAPL'),
+                                    ('20250101110000000-lemon-fox-dddddddd', 'bob', 'AAPL')]:
+        table.put_item(Item=catalog_item(run_id, user_id, ticker, {}, {}, {}))
+    return table
+
+
+def runs_request(user_id, **params):
+    return {'resource': '/query/runs', 'queryStringParameters': params,
+            'requestContext': {'authorizer': {'claims': {'sub': user_id}}}}
+
+
+def run_ids(response):
+    assert response['statusCode'] == 200, response['body']
+    return [item['run_id'] for item in json.loads(response['body'])['items']]
+
+
+def test_runs_are_scoped_to_the_caller(catalog):
+    assert run_ids(query_api.handler(runs_request('alice'), None)) == [
+        '20250102090000000-kiwi-yak-cccccccc', '20250101100000000-fig-dog-bbbbbbbb',
+        '20250101090000000-fig-cat-aaaaaaaa']
+
+
+def test_date_narrows_the_callers_runs_instead_of_listing_everyones(catalog):
+    assert run_ids(query_api.handler(runs_request('alice', date='2025-01-01'), None)) == [
+        '20250101100000000-fig-dog-bbbbbbbb', '20250101090000000-fig-cat-aaaaaaaa']
+    assert run_ids(query_api.handler(runs_request('alice', date='2025-01-01', ticker='AAPL'), None)) == [
+        '20250101090000000-fig-cat-aaaaaaaa']
+
+
+def test_invalid_date_is_rejected(catalog):
+    assert query_api.handler(runs_request('alice', date='01/01/2025'), None)['statusCode'] == 400
+
+
+def test_runs_page_with_the_returned_cursor(catalog):
+    first = json.loads(query_api.handler(runs_request('alice', limit='2'), None)['body'])
+    second = query_api.handler(runs_request('alice', limit='2', cursor=first['next_cursor']), None)
+
+    assert len(first['items']) == 2
+    assert run_ids(second) == ['20250101090000000-fig-cat-aaaaaaaa']
+
+
+def test_filtered_runs_fill_the_page(catalog):
+    response = query_api.handler(runs_request('alice', limit='1', filter='ticker:eq:AAPL'), None)
+    body = json.loads(response['body'])
+    second = query_api.handler(runs_request('alice', limit='1', filter='ticker:eq:AAPL',
+                                            cursor=body['next_cursor']), None)
+
+    assert run_ids(response) == ['20250102090000000-kiwi-yak-cccccccc']
+    assert run_ids(second) == ['20250101090000000-fig-cat-aaaaaaaa']
+    assert json.loads(second['body'])['next_cursor'] is None
+
+
+@pytest.mark.parametrize('key', [{'run_id': '20250101110000000-lemon-fox-dddddddd', 'user_id': 'bob'},
+                                 {'run_id': '20250101110000000-lemon-fox-dddddddd'},
+                                 {'run_id': 1, 'user_id': 'alice'},
+                                 {'run_id': 'x', 'user_id': 'alice', 'ticker': 'AAPL'}])
+def test_cursors_outside_the_callers_partition_are_rejected(catalog, key):
+    response = query_api.handler(runs_request('alice', cursor=query_api.encode_cursor({'key': key})), None)
+
+    assert response['statusCode'] == 400
+
+
+@pytest.mark.parametrize('position', [[1], {'offset': -1}, {'offset': '3'}, {'offset': True}, {'key': 'run'}])
+def test_malformed_cursors_are_rejected(position):
+    with pytest.raises(query_api.QueryError):
+        query_api.decode_cursor(query_api.encode_cursor(position))
+
+
+def test_garbage_cursor_is_rejected():
+    with pytest.raises(query_api.QueryError):
+        query_api.decode_cursor('not a cursor!')
+
+
+def test_paginate_filters_sorts_and_projects():
+    rows = [{'trader_id': 'a', 'profit': 3, '_source': 'x'}, {'trader_id': 'b', 'profit': 9},
+            {'trader_id': 'c', 'profit': 5}, {'trader_id': 'd'}]
+    options = {'fields': [], 'filters': [('profit', 'gte', '4')], 'sort': 'profit', 'descending': None,
+               'limit': 1, 'cursor': None}
+
+    first = query_api.paginate(rows, options)
+    second = query_api.paginate(rows, {**options, 'cursor': query_api.decode_cursor(first['next_cursor'])})
+
+    assert (first['items'], first['count']) == ([{'trader_id': 'b', 'profit': 9}], 2)
+    assert (second['items'], second['next_cursor']) == ([{'trader_id': 'c', 'profit': 5}], None)
+
+
+def test_ranking_cache_drops_unlisted_objects_and_stays_within_its_row_budget(s3_bucket, monkeypatch):
+    monkeypatch.setenv('RANKING_CACHE_MAX_ROWS', '3')
+    monkeypatch.setattr(query_api, '_ranking_cache', query_api.OrderedDict())
+    s3_client = boto3.client('s3')
+    for key, traders in [('AAPL/a.json', 2), ('AAPL/b.json', 1), ('MSFT/a.json', 2)]:
+        s3_client.put_object(Bucket=s3_bucket, Key=key,
+                             Body=json.dumps([{'trader_id': str(index), 'profit': index} for index in range(traders)]))
+
+    assert len(query_api.load_ranking_rows(s3_client, s3_bucket, 'AAPL')) == 3
+    s3_client.delete_object(Bucket=s3_bucket, Key='AAPL/b.json')
+    assert len(query_api.load_ranking_rows(s3_client, s3_bucket, 'AAPL')) == 2
+    assert list(query_api._ranking_cache) == ['AAPL/a.json']
+
+    query_api.load_ranking_rows(s3_client, s3_bucket, 'MSFT')
+    assert list(query_api._ranking_cache) == ['MSFT/a.json']
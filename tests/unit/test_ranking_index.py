@@ -0,0 +1,82 @@
+import json
+
+import boto3
+
+import ranking_index
+
+
+def row(trader, profit, source):
+    return {'trader_id': trader, 'profit': profit, '_source': source}
+
+
+def traders(rows):
+    return [entry['trader_id'] for entry in rows]
+
+
+def test_merge_top_n_keeps_the_best_rows_first():
+    existing = [row('a', 9, 'A'), row('b', 5, 'B')]
+
+    merged = ranking_index.merge_top_n(existing, [row('c', 7, 'C')], 'profit', 'C', 3)
+
+    assert traders(merged) == ['a', 'c', 'b']
+
+
+def test_merge_top_n_sorts_ascending_metrics_lowest_first():
+    existing = [{'trader_id': 'a', 'max_drawdown': 2, '_source': 'A'}]
+
+    merged = ranking_index.merge_top_n(existing, [{'trader_id': 'b', 'max_drawdown': 1, '_source': 'B'}],
+                                       'max_drawdown', 'B', 2)
+
+    assert traders(merged) == ['b', 'a']
+
+
+def test_rewritten_object_replaces_its_own_rows():
+    existing = [row('a', 9, 'A'), row('b', 5, 'B')]
+
+    merged = ranking_index.merge_top_n(existing, [row('a2', 10, 'A')], 'profit', 'A', 3)
+
+    assert traders(merged) == ['a2', 'b']
+
+
+def test_merge_top_n_asks_for_a_rebuild_when_a_full_board_gives_up_places():
+    existing = [row('a', 9, 'A'), row('b', 5, 'B')]
+
+    assert ranking_index.merge_top_n(existing, [row('a', 1, 'A')], 'profit', 'A', 2) is None
+    assert ranking_index.merge_top_n(existing, [], 'profit', 'A', 2) is None
+    assert traders(ranking_index.merge_top_n(existing, [row('a', 6, 'A')], 'profit', 'A', 2)) == ['a', 'b']
+
+
+def put_ranking(bucket_name, key, rows):
+    boto3.client('s3').put_object(Bucket=bucket_name, Key=key, Body=json.dumps(rows))
+
+
+def leaderboard(bucket_name, ticker, metric):
+    body = boto3.client('s3').get_object(Bucket=bucket_name, Key=ranking_index.leaderboard_key(ticker, metric))['Body']
+    return traders(json.loads(body.read())['rows'])
+
+
+def test_worse_rewrite_brings_back_traders_below_the_board(s3_bucket):
+    put_ranking(s3_bucket, 'AAPL/a.json', [{'trader_id': 'a1', 'profit': 10}, {'trader_id': 'a2', 'profit': 9}])
+    put_ranking(s3_bucket, 'AAPL/b.json', [{'trader_id': 'b1', 'profit': 8}, {'trader_id': 'b2', 'profit': 7}])
+    ranking_index.index_ranking_object(s3_bucket, 'AAPL/a.json', top_n=2)
+    ranking_index.index_ranking_object(s3_bucket, 'AAPL/b.json', top_n=2)
+    assert leaderboard(s3_bucket, 'AAPL', 'profit') == ['a1', 'a2']
+
+    put_ranking(s3_bucket, 'AAPL/a.json', [{'trader_id': 'a1', 'profit': 1}])
+    ranking_index.index_ranking_object(s3_bucket, 'AAPL/a.json', top_n=2)
+
+    assert leaderboard(s3_bucket, 'AAPL', 'profit') == ['b1', 'b2']
+
+
+def test_deleted_object_leaves_the_leaderboards(s3_bucket, monkeypatch):
+    monkeypatch.setenv('LEADERBOARD_TOP_N', '2')
+    put_ranking(s3_bucket, 'AAPL/a.json', [{'trader_id': 'a1', 'profit': 10}])
+    put_ranking(s3_bucket, 'AAPL/b.json', [{'trader_id': 'b1', 'profit': 8}])
+    ranking_index.index_ranking_object(s3_bucket, 'AAPL/a.json', top_n=2)
+    ranking_index.index_ranking_object(s3_bucket, 'AAPL/b.json', top_n=2)
+
+    boto3.client('s3').delete_object(Bucket=s3_bucket, Key='AAPL/a.json')
+    ranking_index.handler({'detail-type': 'Object Deleted',
+                           'detail': {'bucket': {'name': s3_bucket}, 'object': {'key': 'AAPL/a.json'}}}, None)
+
+    assert leaderboard(s3_bucket, 'AAPL', 'profit') == ['b1']
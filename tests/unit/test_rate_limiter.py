@@ -0,0 +1,41 @@
+import boto3
+import pytest
+
+from rate_limiter import LocalTokenBucket, TokenBucket
+
+TABLE_NAME = 'mochi-test-rate-limit'
+
+
+@pytest.fixture(params=['dynamodb', 'local'])
+def bucket(request):
+    """A bucket of 5 tokens refilling at one token per second, shared in DynamoDB or in process."""
+    if request.param == 'local':
+        bucket = LocalTokenBucket('polygon', rate_per_second=1, capacity=5)
+        bucket.updated_at = bucket.next_start = 1000
+        return bucket
+
+    request.getfixturevalue('aws')
+    boto3.client('dynamodb').create_table(
+        TableName=TABLE_NAME, KeySchema=[{'AttributeName': 'limiter', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'limiter', 'AttributeType': 'S'}], BillingMode='PAY_PER_REQUEST')
+    return TokenBucket(TABLE_NAME, 'polygon', rate_per_second=1, capacity=5)
+
+
+def test_try_acquire_spends_the_burst_then_waits_for_refill(bucket):
+    assert [bucket.try_acquire(now=1000) for _ in range(5)] == [0.0] * 5
+    assert bucket.try_acquire(now=1000) == pytest.approx(1.0)
+    assert bucket.try_acquire(2, now=1000.5) == pytest.approx(1.5)
+    assert bucket.try_acquire(now=1001) == 0.0
+
+
+def test_refill_is_capped_at_capacity(bucket):
+    bucket.try_acquire(5, now=1000)
+
+    assert bucket.try_acquire(6, now=2000) == pytest.approx(1.0)
+    assert bucket.try_acquire(5, now=2000) == 0.0
+
+
+def test_schedule_spaces_jobs_after_one_burst(bucket):
+    starts = [bucket.schedule(5, now=1000) for _ in range(3)]
+
+    assert starts == pytest.approx([1000, 1000, 1005])
@@ -0,0 +1,28 @@
+import datetime
+
+import boto3
+
+import run_ids
+
+SINCE = datetime.datetime(2025, 3, 21, 14, 30, 5, tzinfo=datetime.timezone.utc)
+
+
+def test_run_id_time_reads_the_timestamp():
+    run_id = run_ids.new_run_id(SINCE.replace(microsecond=123000))
+
+    assert run_ids.run_id_time(run_id) == SINCE.replace(microsecond=123000)
+
+
+def test_run_id_time_rejects_digits_that_are_not_a_time():
+    assert run_ids.run_id_time('20251321143005123-mango-zebra-7k2q9xwd') is None
+    assert run_ids.run_id_time('legacy-run') is None
+
+
+def test_listing_skips_keys_that_are_not_run_ids(s3_bucket):
+    s3 = boto3.client('s3')
+    valid = run_ids.new_run_id(SINCE)
+    for key in (f'{valid}/output.csv', '20251321143005123-mango-zebra-7k2q9xwd/output.csv',
+                f'{run_ids.new_run_id(SINCE - datetime.timedelta(days=1))}/output.csv'):
+        s3.put_object(Bucket=s3_bucket, Key=key, Body=b'x')
+
+    assert run_ids.list_run_ids_since(s3_bucket, SINCE, s3) == [valid]
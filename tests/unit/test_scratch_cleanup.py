@@ -0,0 +1,35 @@
+import os
+import time
+
+import scratch_cleanup
+
+DAY = 24 * 3600
+
+
+def make_run(runs_dir, name, age_seconds, now):
+    run_dir = runs_dir / name / 'stage'
+    run_dir.mkdir(parents=True)
+    data = run_dir / 'data.csv'
+    data.write_text('x')
+    for path in (data, run_dir, run_dir.parent):
+        os.utime(path, (now - age_seconds, now - age_seconds))
+    return data
+
+
+def test_idle_run_directory_expires(tmp_path):
+    now = time.time()
+    make_run(tmp_path, 'idle', 2 * DAY, now)
+
+    assert scratch_cleanup.expired_runs(str(tmp_path), 24, now=now) == [str(tmp_path / 'idle')]
+
+
+def test_recent_nested_write_keeps_the_run_directory(tmp_path):
+    now = time.time()
+    data = make_run(tmp_path, 'retried', 2 * DAY, now)
+    os.utime(data, (now - 60, now - 60))
+
+    assert scratch_cleanup.expired_runs(str(tmp_path), 24, now=now) == []
+
+
+def test_missing_runs_directory_has_nothing_to_expire(tmp_path):
+    assert scratch_cleanup.expired_runs(str(tmp_path / 'runs'), 24) == []